@@ -1,8 +1,14 @@
+from collections import deque
+from contextlib import contextmanager
 from enum import Enum, unique
-from random import shuffle, random
+from random import Random, getrandbits
 from itertools import chain
 from threading import RLock
-from math import floor, log
+from time import perf_counter
+from math import ceil, floor, log
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from metrics import METRICS
 from utils import digits
 
 
@@ -16,13 +22,68 @@ class State(Enum):
         self.representation = representation
 
 
+# States are stored by Board as one byte per square: the byte is the index of the state in _STATES
+_STATES = tuple(State)
+_STATE_CODES = {state: code for code, state in enumerate(_STATES)}
+# Representation of a DUG square with no mine, indexed by its number of mined neighbours
+_DUG_REPRESENTATIONS = (State.DUG.representation,) + tuple(str(i) for i in range(1, 9))
+# Translation of the state codes of squares not DUG to their representations
+_STATE_REPRESENTATIONS = bytes(ord(_STATES[code].representation) if code < len(_STATES) else 0 for code in range(256))
+
+# Packed binary board files: a header, the mines (a bit per square) then, optionally, the states (2 bits per square),
+# both in row-major order, the first square in the high bits of the first byte. The header holds a magic number, the
+# version of the format, flags telling which optional fields are present, the height, the width and the seed.
+_FILE_MAGIC = b"MSWB"
+_FILE_FORMAT = 1
+_FILE_HEADER = Struct("<4sBBxxIIQ")
+_FILE_SEED = 1
+_FILE_STATES = 2
+# An entry of the changes passed to the journal of a board: the flat index of a square changed, then its state code
+# in the low 2 bits and its mine in the third bit
+_JOURNAL_ENTRY = Struct("<IB")
+# Translation tables of Board._pack_bits and Board._unpack_bits, indexed by the number of bits of the values, then by
+# the position of the values within a byte: the first table shifts a value to its position, the second one extracts it
+_PACK_TABLES = {bits: [bytes((value << (8 - bits * (position + 1))) & 0xFF for value in range(256))
+                       for position in range(8 // bits)] for bits in (1, 2)}
+_UNPACK_TABLES = {bits: [bytes((byte >> (8 - bits * (position + 1))) & ((1 << bits) - 1) for byte in range(256))
+                         for position in range(8 // bits)] for bits in (1, 2)}
+
+# The locks timed, by the lock label of their histograms: every lock of a board, taken by Board.batch, the locks of
+# the tiles touched by a command or by a batch, and the board lock taken by set_state to publish a change
+_LOCK_WAIT_SECONDS = {lock: METRICS.histogram("minesweeper_board_lock_wait_seconds",
+                                              "Time spent waiting for locks of a board", lock=lock)
+                      for lock in ("batch", "tiles", "board")}
+_LOCK_HOLD_SECONDS = {lock: METRICS.histogram("minesweeper_board_lock_hold_seconds",
+                                              "Time locks of a board were held", lock=lock)
+                      for lock in ("batch", "tiles", "board")}
+_RENDER_SECONDS = {encoding: METRICS.histogram("minesweeper_board_render_seconds",
+                                               "Time spent encoding a snapshot of a board, once per snapshot",
+                                               encoding=encoding)
+                   for encoding in ("text", "packed")}
+
+
+class _TileBusy(Exception):
+    """
+    Raised by Board._flood_fill when the region being dug reaches a tile whose lock is held by another thread.
+    """
+
+    def __init__(self, tile):
+        super().__init__(tile)
+        self.tile = tile
+
+
 class Square:
+    """
+    A lightweight view over a single square of a Board. A Square stores no data of its own: reading or
+    writing **has_bomb** and **state** goes straight to the arrays owned by the board, under the board lock.
+    """
     REPR_BOMB = "*"
 
-    def __init__(self, row, col, has_bomb, state):
+    __slots__ = ("_board", "row", "col")
+
+    def __init__(self, board, row, col):
+        self._board = board
         self.row, self.col = row, col
-        self.has_bomb = has_bomb
-        self.state = state
 
     def __repr__(self):
         return "<'%s.%s' object, row=%d, col=%d, has_bomb=%s, state=%s>" % \
@@ -34,53 +95,358 @@ class Square:
             return Square.REPR_BOMB
         return self.state.representation
 
+    def __eq__(self, other):
+        return isinstance(other, Square) and \
+               self._board is other._board and (self.row, self.col) == (other.row, other.col)
+
+    def __hash__(self):
+        return hash((id(self._board), self.row, self.col))
+
+    @property
+    def has_bomb(self):
+        return self._board._has_bomb(self.row, self.col)
+
+    @has_bomb.setter
+    def has_bomb(self, value):
+        self._board._set_bomb(self.row, self.col, value)
+
+    @property
+    def state(self):
+        return self._board._state(self.row, self.col)
+
+    @state.setter
+    def state(self, value):
+        self._board._set_square_state(self.row, self.col, value)
+
+
+# The text of every possible square, indexed by the code of the square in a packed board (see BoardSnapshot.packed):
+# the number of mined neighbours of a dug square is its own code
+CELL_REPRESENTATIONS = _DUG_REPRESENTATIONS + (State.UNTOUCHED.representation, State.FLAGGED.representation,
+                                               Square.REPR_BOMB)
+_HIGH_NIBBLES = bytes((byte << 4) & 0xFF for byte in range(256))
+_CELL_CODES = bytes.maketrans("".join(CELL_REPRESENTATIONS).encode(), bytes(range(len(CELL_REPRESENTATIONS))))
+
+
+def _render_header(first_col, width, label_width):
+    """
+    :return: the header displayed on top of **width** columns starting at **first_col**: the index of every column,
+        written vertically, one digit per line, after **label_width** spaces, the width of the row labels.
+    """
+    sep = " "
+    hmaxdigits = digits(first_col + width)          # The maximum number of digits that a column index can take
+    # The column indices, in string form, padded with the required whitespace
+    indices = [(str(i).ljust(hmaxdigits))[::-1] for i in range(first_col, first_col + width)]
+
+    return "\n".join(sep * label_width + sep.join([index[i] for index in indices]) for i in range(hmaxdigits))
+
+
+def _pack_codes(codes):
+    """
+    :param codes: the codes of squares, one per byte.
+    :return: **codes**, two per byte, the first one in the high nibble. The last nibble is 0 when the number of
+        squares is odd.
+    """
+    if len(codes) % 2:
+        codes += b"\0"
+
+    # Codes fit in a nibble, so that the sum of the high nibbles and of the low nibbles, as two big integers, never
+    # carries from a byte to the next one
+    high = int.from_bytes(codes[0::2].translate(_HIGH_NIBBLES), "big")
+    low = int.from_bytes(codes[1::2], "big")
+
+    return (high + low).to_bytes(len(codes) // 2, "big")
+
+
+def _count_neighbours(mines, height, width):
+    """
+    :param mines: a flat, row-major grid of **height** rows and **width** columns, holding 1 for every mined square.
+    :return: a bytearray holding, for every square, the number of its mined neighbours. The counts of every square
+        are computed at once, without visiting squares one by one: the grid of mines is read as a single big-endian
+        integer of a byte per square, shifted by the offset of every neighbour, and the 8 shifted grids are added. A
+        count never exceeds 8, so that additions never carry from a byte to the next one. Squares of the first (last)
+        column have no neighbour on their left (right): their offset reaches the last (first) column of another row,
+        which is cleared from the grid shifted.
+    """
+    size = len(mines)
+
+    if size == 0:
+        return bytearray()
+
+    without_last, without_first = bytearray(mines), bytearray(mines)
+    without_last[width - 1::width] = bytes(height)
+    without_first[0::width] = bytes(height)
+    # The grid to shift, indexed by the column offset of the neighbour
+    grids = {-1: int.from_bytes(without_last, "big"), 0: int.from_bytes(mines, "big"),
+             1: int.from_bytes(without_first, "big")}
+    total = 0
+
+    for row_offset in (-1, 0, 1):
+        for col_offset in (-1, 0, 1):
+            # The count of the square at index i is increased by the mine at index i + offset
+            offset = row_offset * width + col_offset
+
+            if offset > 0:
+                total += grids[col_offset] << (8 * offset)
+            elif offset < 0:
+                total += grids[col_offset] >> (-8 * offset)
+
+    # Bytes shifted beyond the first square are dropped
+    return bytearray((total & ((1 << (8 * size)) - 1)).to_bytes(size, "big"))
+
+
+class BoardSnapshot:
+    """
+    An immutable view of a Board at a given version, published by the board after every mutation. Snapshots share
+    the text of the rows which did not change between two versions, and can be read without taking any lock.
+    """
+
+    __slots__ = ("version", "width", "_header", "_rows", "_text", "_encoded", "_packed")
+
+    def __init__(self, version, width, header, rows):
+        self.version = version
+        self.width = width
+        self._header = header
+        self._rows = rows
+        self._text = None
+        self._encoded = None
+        self._packed = None
+
+    def __repr__(self):
+        return "<'%s.%s' object, version=%d, height=%d>" % \
+               (self.__class__.__module__, self.__class__.__name__, self.version, len(self._rows))
+
+    def __str__(self):
+        # Two threads may join the rows at the same time: both compute the same text, so no lock is needed
+        if self._text is None:
+            self._text = self._header + "\n" + "".join(self._rows)
+
+        return self._text
+
+    def height(self):
+        return len(self._rows)
+
+    def encoded(self):
+        """
+        :return: the text of the snapshot as UTF-8 bytes, encoded once and shared by every reply sending it.
+        """
+        if self._encoded is None:
+            start = perf_counter()
+            self._encoded = str(self).encode()
+            _RENDER_SECONDS["text"].observe(perf_counter() - start)
+
+        return self._encoded
+
+    def packed(self):
+        """
+        :return: the squares of the board in row-major order, two per byte, the first one in the high nibble. Every
+            square is coded by the index of its text in CELL_REPRESENTATIONS. The last nibble is 0 when the number of
+            squares is odd.
+        """
+        if self._packed is None:
+            start = perf_counter()
+            self._packed = _pack_codes(self.codes())
+            _RENDER_SECONDS["packed"].observe(perf_counter() - start)
+
+        return self._packed
+
+    def codes(self):
+        """
+        :return: the code of every square of the board in row-major order, one per byte, as in packed.
+        """
+        # Every row is rendered as its index padded to a fixed width, then the text of each square followed by a
+        # space, then a newline: the squares are the characters at even offsets after the padding
+        padding = digits(len(self._rows) - 1) + 1
+
+        return "".join(row[padding:-1:2] for row in self._rows).encode().translate(_CELL_CODES)
+
+    def region(self, row, col, height, width):
+        """
+        :return: the BoardRegion of **height** rows and **width** columns from the (**row**, **col**) square, clipped
+            to the board.
+        """
+        board_height = self.height()
+        row, col = min(max(row, 0), board_height), min(max(col, 0), self.width)
+        width = max(min(col + width, self.width) - col, 0)
+        # The squares of a row follow its label
+        start = digits(board_height - 1) + 1 + 2 * col
+
+        return BoardRegion(self.version, row, col, width, self._rows[row:row + max(height, 0)], start)
+
+
+class BoardRegion:
+    """
+    A rectangular region of a board, e.g. the part of a large board displayed by a client: the **width** columns
+    from the (**row**, **col**) square of **rows**, the text of the rows of the region, where the squares of the
+    region start at offset **start**. The region is cut out of the text of the rows of a snapshot (see
+    BoardSnapshot.region), so that rendering it costs O(height * width) whatever the size of the board, and takes no
+    lock. Its header and row labels are computed for the region only.
+    """
+
+    __slots__ = ("version", "row", "col", "width", "_rows", "_start", "_text", "_encoded", "_packed")
+
+    def __init__(self, version, row, col, width, rows, start=0):
+        self.version = version
+        self.row, self.col, self.width = row, col, width
+        self._rows = rows
+        self._start = start
+        self._text = None
+        self._encoded = None
+        self._packed = None
+
+    def __repr__(self):
+        return "<'%s.%s' object, version=%d, row=%d, col=%d, height=%d, width=%d>" % \
+               (self.__class__.__module__, self.__class__.__name__, self.version, self.row, self.col, len(self._rows),
+                self.width)
+
+    def __str__(self):
+        if self._text is None:
+            label_width = digits(self.row + len(self._rows) - 1) + 1
+            start, end = self._start, self._start + 2 * self.width
+            lines = [_render_header(self.col, self.width, label_width), "\n"]
+
+            for rowindex, text in enumerate(self._rows, self.row):
+                lines.append(str(rowindex).ljust(label_width) + text[start:end] + "\n")
+
+            self._text = "".join(lines)
+
+        return self._text
+
+    def height(self):
+        return len(self._rows)
+
+    def encoded(self):
+        """
+        :return: the text of the region as UTF-8 bytes, encoded once.
+        """
+        if self._encoded is None:
+            self._encoded = str(self).encode()
+
+        return self._encoded
+
+    def packed(self):
+        """
+        :return: the squares of the region in row-major order, two per byte, as by BoardSnapshot.packed.
+        """
+        if self._packed is None:
+            start, end = self._start, self._start + 2 * self.width
+            self._packed = _pack_codes("".join(text[start:end:2] for text in self._rows).encode()
+                                       .translate(_CELL_CODES))
+
+        return self._packed
+
 
 class Board:
     """ Problem 3, point b. Thread safety argument:\n
-    Thread safety is currently ensured in Board only. The Square class and any other lack
-    any type of coverage. Accessing some of the Board's squares through the Square class can lead to race conditions.
-    Board is made thread-safe exclusively by synchronization, by using a reentrant lock (a RLock). The self._squares
-    attribute, which can nevertheless be accessed even though it is marked private (Python does not provide access
-    protection), can be legitimately accessed and modified by observer and mutator methods. These all use
-    synchronization, and as long as a client of Board does not attempt a direct access at self._squares or at an
-    instance of Square, race conditions should not occur. (Of course a rewriting of the Square class may be operated,
-    for ensuring better security. This, however, is not being done for lack of time.) I do not see any piece of
+    Thread safety is currently ensured in Board only. Squares are views which read and write the board through
+    its private accessors, so they share the same coverage.
+    Board is made thread-safe exclusively by synchronization, by using a reentrant lock (a RLock). The self._mines
+    and self._states attributes, which can nevertheless be accessed even though they are marked private (Python does
+    not provide access protection), can be legitimately accessed and modified by observer and mutator methods. These
+    all use synchronization, and as long as a client of Board does not attempt a direct access at self._mines or at
+    self._states, race conditions should not occur. Note that a sequence of calls on a Square (e.g. reading
+    **has_bomb** and then writing it) is not atomic unless the caller holds the board lock. I do not see any piece of
     code using techniques such as thread confinement, immutability or threadsafe datatypes for ensuring thread
     security on this class. (Thread safety techniques discussed in the lecture notes of this course are, indeed,
     confinement, immutability, thread safe datatypes and synchronization.)
     Besides arguments for the thread-safety of Board, a test to confirm that no race conditions occur inside Board is
-    included in board_test.py.
+    included in board_test.py.\n
+    Storage: the grid is kept as flat, row-major bytearrays of height * width bytes each: one holding 1 for every
+    mined square, one holding the code of every square State and one holding the number of mined neighbours of every
+    square. The latter is built once at creation time and kept up to date whenever a mine is added or removed.
+    No per-square object is kept alive.\n
+    Lock striping: by default the board lock guards the squares as well. When a **tile_size** is given, the grid is
+    split into tile_size x tile_size tiles, each guarded by a lock of its own, and the board lock only guards the
+    rendering cache and the change log. Mutators acquire the locks of the tiles they touch in increasing tile order,
+    and always before the board lock, so that no deadlock can occur. A flood-fill reaching a tile it does not hold
+    tries to acquire its lock without blocking; if it fails, every lock is released and the flood-fill is started
+    again, this time acquiring the busy tile as well, in order. The squares found are only dug once the flood-fill
+    holds every tile it reached, and while holding the board lock. The board height and width never change, so
+    observers of the board size take no lock at all.\n
+    Snapshots: after every mutation, and while still holding the board lock, the rows touched are rendered again
+    and a new immutable BoardSnapshot is published by replacing a single reference. Readers (__str__, snapshot())
+    only read that reference, so they never wait for a writer. Rendering holds the board lock, and the squares of a
+    cascade are dug while holding it, so snapshots show either none or all of the squares revealed by a dig. With
+    lock striping, the other mutations write their squares under the locks of their tiles only: a snapshot
+    published meanwhile by a mutation of a row they share may show them before their own snapshot is published. A
+    batch (see batch()) can defer the rendering to its end, publishing a single snapshot for all of its mutations.
     """
     # Height, width, mines_count number
     DIFF_EASY = (9, 9, 10)
     DIFF_INTERMEDIATE = (16, 16, 40)
     DIFF_HARD = (16, 30, 99)
+    # Maximum number of square changes kept in the change log
+    CHANGELOG_SIZE = 4096
+
+    def __init__(self, boolean_grid, tile_size=None):
+        height = len(boolean_grid)
+        width = len(boolean_grid[0]) if height > 0 else 0
 
-    def __init__(self, boolean_grid):
-        self._squares = list()
+        for line in boolean_grid:
+            if len(line) != width:
+                raise ValueError("Found a %d-element-wide line, expected %d" % (len(line), width))
+
+        self._initialize(bytearray(chain.from_iterable(boolean_grid)), height, width, tile_size)
+
+    def _initialize(self, mines, height, width, tile_size, states=None, seed=None):
         self._lock: RLock = RLock()
 
         self._lock.acquire()
 
-        for row in range(len(boolean_grid)):
-            self._squares.append(list())
-
-            for col in range(len(boolean_grid[row])):
-                self._squares[row].append(
-                    Square(row, col, boolean_grid[row][col], State.UNTOUCHED)
-                )
+        self._height = height
+        self._width = width
+        self._mines = mines
+        self._states = bytearray(self._height * self._width) if states is None else states
+        self._counts = self._count_nearby_bombs()
+        # The seed the mines were drawn from, when known
+        self._seed = seed
+        # A callable invoked with the changes of every mutation, encoded as _JOURNAL_ENTRY entries, or None. It is
+        # invoked while holding the board lock, and must neither block nor acquire the locks of a board
+        self.journal = None
+
+        # Rendering cache: the header, the text of every row and the last published snapshot
+        self._header = None
+        self._rendered_rows = [""] * self._height
+        self._snapshot = None
+        # The rows changed since the beginning of a batch deferring snapshots, or None outside of such batches
+        self._deferred_rows = None
+
+        # Versioning: the version is increased by every mutation, and the change log keeps (version, index) entries
+        # for the most recent changed squares. Every change made after self._changelog_start is in the log.
+        self._version = 0
+        self._changelog = deque()
+        self._changelog_start = 0
+
+        # Lock striping: without a tile size the whole grid is a single tile, guarded by the board lock
+        if tile_size is not None and tile_size <= 0:
+            raise ValueError("The tile size must be greater than 0 (found %d)" % tile_size)
+
+        self._tile_size = tile_size
+
+        if tile_size is None:
+            self._tiles_per_row = 1
+            self._tile_locks = [self._lock]
+        else:
+            self._tiles_per_row = ceil(self._width / tile_size)
+            self._tile_locks = [RLock() for i in range(ceil(self._height / tile_size) * self._tiles_per_row)]
 
         self._check_state()
+        self._mark_dirty(range(self._height))
         self._lock.release()
 
     @staticmethod
-    def create_from_probability(height, width, bomb_probability=0.25):
+    def create_from_probability(height, width, bomb_probability=0.25, seed=None, safe=None, tile_size=None):
         """
         Create a new board by supplying a **height**, a **width** and a bomb probability parameters.
         :param height: number of rows of the board, each with an even number of elements.
         :param width: number of elements for each row.
         :param bomb_probability: the probability that a cell of the grid has a bomb during creation.
             **bomb_probability** must belong to [0, 1).
+        :param seed: the seed of the mines, for a reproducible board. By default, the seed is drawn from the global
+            random generator.
+        :param safe: the (row, col) of the first square to be dug, which is kept free of mines, together with its
+            neighbours, or None.
+        :param tile_size: the size of the tiles of the board, each guarded by a lock of its own, or None for a single
+            lock (see Board).
         :return: a new Board instance.
         """
         if height * width <= 0:
@@ -88,18 +454,26 @@ class Board:
         if not 0 <= bomb_probability < 1:
             raise ValueError("It must be 0 <= bomb_probability <= 1 (bomb_probability = %f)" % bomb_probability)
 
-        squares = list()
+        seed = Board._new_seed(seed)
+        mines = Board._random_squares(Random(seed), height * width, bomb_probability)
 
-        for square in range(height * width):
-            squares.append(random() <= bomb_probability)
+        if safe is not None:
+            for index in Board._safe_squares(height, width, safe):
+                mines[index] = 0
 
-        return Board(Board._list_to_grid(squares, height, width))
+        return Board._from_mines(mines, height, width, tile_size, seed=seed)
 
     @staticmethod
-    def create_from_difficulty(difficulty=DIFF_EASY):
+    def create_from_difficulty(difficulty=DIFF_EASY, seed=None, safe=None, tile_size=None):
         """
         Create a new board by supplying a pre-made or a custom difficulty level.
         :param difficulty: a (**height**, **width**, **mines**) tuple.
+        :param seed: the seed of the mines, for a reproducible board. By default, the seed is drawn from the global
+            random generator.
+        :param safe: the (row, col) of the first square to be dug, which is kept free of mines, together with its
+            neighbours, or None.
+        :param tile_size: the size of the tiles of the board, each guarded by a lock of its own, or None for a single
+            lock (see Board).
         :return: a Board instance with **height** rows, each **width**-elements wide, containing
             **mines** mines randomly interspersed in its grid.
         """
@@ -110,39 +484,108 @@ class Board:
         if not 0 < mines < height * width:
             raise ValueError("0 < mines < %d not true (mines = %d)" % (height * width, mines))
 
-        squares = Board._random_mines_distribution((height * width) - mines, mines)
+        excluded = Board._safe_squares(height, width, safe) if safe is not None else set()
+
+        if mines > height * width - len(excluded):
+            raise ValueError("%d mines do not fit out of the %d squares around %s" % (mines, len(excluded), safe))
+
+        seed = Board._new_seed(seed)
+        grid = Board._random_mines(Random(seed), height * width, mines, excluded)
 
-        return Board(Board._list_to_grid(squares, height, width))
+        return Board._from_mines(grid, height, width, tile_size, seed=seed)
 
     @staticmethod
-    def create_from_file(path):
+    def create_from_file(path, tile_size=None):
         """
-        Create a new board as instructed in Problem 4 of the assignment.
-        :param path: a string representing a file containing a well-formatted grid of 0s and 1s.
+        Create a new board as instructed in Problem 4 of the assignment, from a text file, or from a packed binary
+        file written by Board.save. Both describe rectangular grids.
+        :param path: a string representing a file containing a well-formatted grid of 0s and 1s, one row per line,
+            separated by single spaces, or a packed binary board file.
+        :param tile_size: the size of the tiles of the board, each guarded by a lock of its own, or None for a single
+            lock (see Board).
         :return: a new Board instance.
         """
+        with open(path, "rb") as f:
+            if f.read(len(_FILE_MAGIC)) == _FILE_MAGIC:
+                return Board._create_from_packed_file(path, tile_size)
 
-        def read_line(text_line):
-            sep = " "
-            encoding = {'0': False, '1': True}
+            f.seek(0)
+            # The file is parsed a line at a time, straight into the bytearray of the mines
+            encoding = bytes.maketrans(b"01", b"\0\1")
+            mines, height, width = bytearray(), 0, None
 
-            # dict.get() returns None when a given argument is not contained within the dict keys
-            line = [encoding.get(i) for i in text_line.strip().split(sep)]
+            for line in f:
+                line = line.strip()
+                # Every square is a single 0 or 1, the squares of a row being separated by single spaces
+                row = line[0::2]
 
-            if None in line:
-                raise ValueError("Found invalid content in '%s'. Every line can contain only 0s and 1s" % path)
+                if not line or line[1::2].strip(b" ") or row.strip(b"01"):
+                    raise ValueError("Found invalid content in '%s'. Every line can contain only 0s and 1s" % path)
+                if width is None:
+                    width = len(row)
+                elif len(row) != width:
+                    raise ValueError("Found %d wide line in a %d wide grid, rectangular grid expected" %
+                                     (len(row), width))
 
-            return line
+                mines += row.translate(encoding)
+                height += 1
+
+        return Board._from_mines(mines, height, width or 0, tile_size)
+
+    @staticmethod
+    def _create_from_packed_file(path, tile_size=None):
+        """
+        :return: a new Board instance read from the packed binary file at **path**, which is memory-mapped: the
+            mines and the states are unpacked straight from the mapping.
+        """
+        with open(path, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            if len(data) < _FILE_HEADER.size:
+                raise ValueError("Found a truncated header in '%s'" % path)
 
-        with open(path) as f:
-            lines = [read_line(line) for line in f]
+            magic, version, flags, height, width, seed = _FILE_HEADER.unpack_from(data)
 
-            for line in lines:
-                if len(line) != len(lines):
-                    raise ValueError("Found %d wide line in a %d tall grid, square grid expected" %
-                                     (len(line), len(lines)))
+            if version != _FILE_FORMAT:
+                raise ValueError("Found version %d of the board file format in '%s', expected %d" %
+                                 (version, path, _FILE_FORMAT))
 
-        return Board(lines)
+            squares = height * width
+            mines_end = _FILE_HEADER.size + ceil(squares / 8)
+            states_end = mines_end + (ceil(squares / 4) if flags & _FILE_STATES else 0)
+
+            if len(data) != states_end:
+                raise ValueError("Found %d bytes in '%s', expected %d" % (len(data), path, states_end))
+
+            mines = Board._unpack_bits(data[_FILE_HEADER.size:mines_end], 1, squares)
+            states = Board._unpack_bits(data[mines_end:states_end], 2, squares) if flags & _FILE_STATES else None
+
+        return Board._from_mines(mines, height, width, tile_size, states, seed if flags & _FILE_SEED else None)
+
+    def save(self, path, states=True):
+        """
+        Saves the board to **path**, in the packed binary format read by Board.create_from_file: a bit per square
+        for the mines and, if **states**, 2 bits per square for the states. The seed of the mines is saved when
+        known, and an integer fitting in 64 bits.
+        """
+        with open(path, "wb") as f:
+            f.write(self.to_bytes(states))
+
+    def to_bytes(self, states=True):
+        """
+        :return: the content of the file written by Board.save.
+        """
+        with self.batch():
+            mines, squares_states, seed = bytes(self._mines), bytes(self._states), self._seed
+
+        flags = _FILE_STATES if states else 0
+
+        if isinstance(seed, int) and 0 <= seed < 2 ** 64:
+            flags |= _FILE_SEED
+        else:
+            seed = 0
+
+        header = _FILE_HEADER.pack(_FILE_MAGIC, _FILE_FORMAT, flags, self._height, self._width, seed)
+
+        return header + Board._pack_bits(mines, 1) + (Board._pack_bits(squares_states, 2) if states else b"")
 
     def __repr__(self):
         with self._lock:
@@ -150,91 +593,242 @@ class Board:
                    (self.__class__.__module__, self.__class__.__name__, self.height(), self.width(), self.mines_count())
 
     def __str__(self):
+        """
+        :return: the text representation of the board, read from the last published snapshot without locking.
+        """
+        return str(self._snapshot)
+
+    def _render_header(self):
+        """
+        :return: A header line to be displayed on top of the board grid. The board size never changes, so it
+            is computed once only.
+        """
+        if self._header is None:
+            self._header = _render_header(0, self._width, digits(self._height - 1) + 1)
+
+        return self._header
 
-        def format_row(row):
-            result = ""
-
-            for square in row:
-                if square.state in (State.UNTOUCHED, State.FLAGGED):
-                    result += "%s " % str(square)
-                elif square.state == State.DUG:
-                    if square.has_bomb:
-                        result += "%s " % str(square)
-                    else:
-                        nearby_bombs = len([n for n in self.neighbors(square.row, square.col) if n.has_bomb])
-
-                        if nearby_bombs == 0:
-                            result += str(square) + " "
-                        else:
-                            result += "%d " % nearby_bombs
-
-            return result
-
-        def format_row_header():
-            """
-            :return: A header line to be displayed on top of the board grid.
-            """
-            sep = " "
-            hmaxdigits = digits(self.width())               # The maximum number of digits that a column index can take
-            vpad = sep * (digits(self.height() - 1) + 1)    # The vertical padding whitespace to add before this header
-            # The column indices, in string form, padded with the required whitespace
-            indices = [(str(i).ljust(hmaxdigits))[::-1] for i in range(self.width())]
-            result = ""
-
-            for i in range(hmaxdigits):
-                # result is added a new header line at each iteration
-                result += vpad + sep.join([index[i] for index in indices])
-
-                if i < hmaxdigits - 1:
-                    result += "\n"
-
-            return result
-
-        def vertical_padding(rowindex):
-            """
-            :param rowindex: index of the board row being displayed
-            :return: the padding to be appended in front of a board row to allow proper alignment
-            """
-            return " " * (digits(self.height() - 1) + 1 - digits(rowindex))
-
-        result = format_row_header() + "\n"
+    def _render_row(self, rowindex):
+        """
+        :param rowindex: index of the board row being displayed
+        :return: the text line representing the row, terminated by a newline.
+        """
+        start, end = rowindex * self._width, (rowindex + 1) * self._width
+        dug = _STATE_CODES[State.DUG]
+        # The padding appended in front of a board row to allow proper alignment
+        vertical_padding = " " * (digits(self._height - 1) + 1 - digits(rowindex))
+
+        if dug not in self._states[start:end]:
+            # No square of the row depends on its mines: the row is translated at once, e.g. on a new board
+            cells = bytearray(b" ") * (2 * self._width)
+            cells[0::2] = self._states[start:end].translate(_STATE_REPRESENTATIONS)
+
+            return str(rowindex) + vertical_padding + cells.decode() + "\n"
+
+        cells = list()
+
+        for state, mine, count in zip(self._states[start:end], self._mines[start:end], self._counts[start:end]):
+            if state != dug:
+                cells.append(_STATES[state].representation)
+            elif mine:
+                cells.append(Square.REPR_BOMB)
+            else:
+                cells.append(_DUG_REPRESENTATIONS[count])
+
+        return str(rowindex) + vertical_padding + " ".join(cells) + " \n"
+
+    def _mark_dirty(self, rows):
+        """
+        Renders again the given **rows**, which have been touched by a mutation, and publishes a new snapshot.
+        Only the references to the rows are copied: the text of the other rows is shared with older snapshots.
+        Within a batch deferring snapshots, the rows are only recorded, to be rendered when the batch ends.
+        """
+        with self._lock:
+            if self._deferred_rows is not None:
+                self._deferred_rows.update(rows)
+                return
+
+            for rowindex in rows:
+                self._rendered_rows[rowindex] = self._render_row(rowindex)
+
+            self._snapshot = BoardSnapshot(self._version, self._width, self._render_header(),
+                                           tuple(self._rendered_rows))
+
+    def _changed(self, indices):
+        """
+        Records a mutation of the squares at the given flat **indices**: the board version is increased, the change
+        log is updated, dropping its oldest entries when it grows too large, and a new snapshot is published.
+        """
+        with self._lock:
+            self._version += 1
+
+            if len(indices) > self.CHANGELOG_SIZE:
+                self._changelog.clear()
+                self._changelog_start = self._version
+            else:
+                self._changelog.extend((self._version, i) for i in indices)
+
+                while len(self._changelog) > self.CHANGELOG_SIZE:
+                    self._changelog_start = self._changelog.popleft()[0]
+
+            self._mark_dirty({i // self._width for i in indices})
 
+            if self.journal is not None:
+                self.journal(self._journal_entries(indices))
+
+    def _journal_entries(self, indices):
+        """
+        :return: the current state and mine of the squares at the flat **indices**, as _JOURNAL_ENTRY entries.
+        """
+        pack, states, mines = _JOURNAL_ENTRY.pack, self._states, self._mines
+
+        return b"".join(pack(i, states[i] | mines[i] << 2) for i in indices)
+
+    def replay(self, changes):
+        """
+        Applies **changes**, as passed to the journal of a board, e.g. to a snapshot of the board: every square
+        changed is set to the state and mine it had after the change, without digging any other square. Since
+        every entry holds the whole content of its square, changes already applied can be applied again. Like
+        toggle_dug, the change log is dropped and every row is rendered again; the journal is not invoked.
+        """
+        tiles = range(len(self._tile_locks))
+        acquired = self._acquire_tiles(tiles)
         self._lock.acquire()
 
-        for rowindex, row in zip(range(self.height()), self._squares):
-            result += str(rowindex) + vertical_padding(rowindex) + format_row(row) + "\n"
+        try:
+            for index, code in _JOURNAL_ENTRY.iter_unpack(changes):
+                self._states[index] = code & 3
+                self._mines[index] = code >> 2
+
+            self._counts = self._count_nearby_bombs()
+            self._version += 1
+            self._changelog.clear()
+            self._changelog_start = self._version
+            self._mark_dirty(range(self._height))
+        finally:
+            self._lock.release()
+            self._release_tiles(tiles, acquired)
+
+    def version(self):
+        """
+        :return: an int which is increased by every mutation of the board.
+        """
+        with self._lock:
+            return self._version
 
-        self._lock.release()
+    def snapshot(self):
+        """
+        :return: the last published BoardSnapshot. No lock is taken.
+        """
+        return self._snapshot
 
-        return result
+    def region(self, row, col, height, width):
+        """
+        :return: the BoardRegion of the last published snapshot of **height** rows and **width** columns from the
+            (**row**, **col**) square, clipped to the board. No lock is taken.
+        """
+        return self._snapshot.region(row, col, height, width)
 
-    def __len__(self):
+    @contextmanager
+    def batch(self, deferred=False):
+        """
+        Holds every lock of the board for the duration of a with block, so that the calls made within the block
+        are applied as a single atomic sequence, without acquiring any lock again. Batches can be nested.
+        :param deferred: if True, no snapshot is published until the block ends: the rows changed within the block
+            are rendered once, and a single snapshot is published, when it ends. Snapshots read within the block
+            do not show its changes.
+        """
+        tiles = range(len(self._tile_locks))
+        start = perf_counter()
+        tiles_acquired = self._acquire_tiles(tiles)
+        self._lock.acquire()
+        acquired = perf_counter()
+        _LOCK_WAIT_SECONDS["batch"].observe(acquired - start)
+        deferring = deferred and self._deferred_rows is None
+
+        if deferring:
+            self._deferred_rows = set()
+
+        try:
+            yield self
+        finally:
+            if deferring:
+                rows, self._deferred_rows = self._deferred_rows, None
+
+                if rows:
+                    self._mark_dirty(rows)
+
+            self._lock.release()
+            self._release_tiles(tiles, tiles_acquired)
+            _LOCK_HOLD_SECONDS["batch"].observe(perf_counter() - acquired)
+
+    def changes_since(self, version):
+        """
+        :param version: a version of the board previously returned to a client.
+        :return: a (version, changes) tuple, where changes is a list of (row, col, representation) tuples, one for
+            every square changed after **version**, and representation is the current text of the square. None
+            is returned when the changes are no longer available in the change log, or **version** is not valid.
+        """
         with self._lock:
-            return sum([len(row) for row in self._squares])
+            if not self._changelog_start <= version <= self._version:
+                return None
+
+            # Entries are sorted by version: walk the log backwards up to the first entry already seen by the client
+            indices = dict()
+
+            for entry_version, index in reversed(self._changelog):
+                if entry_version <= version:
+                    break
+                indices[index] = None
+
+            changes = [(i // self._width, i % self._width, self._representation(i)) for i in sorted(indices)]
+
+            return self._version, changes
+
+    def _representation(self, index):
+        """
+        :return: the text of the square at the flat **index**, as displayed by __str__.
+        """
+        state = _STATES[self._states[index]]
+
+        if state != State.DUG:
+            return state.representation
+        if self._mines[index]:
+            return Square.REPR_BOMB
+
+        return _DUG_REPRESENTATIONS[self._counts[index]]
+
+    def __len__(self):
+        return self._height * self._width
 
     def __contains__(self, key):
         if not (isinstance(key[0], int) and isinstance(key[1], int)):
             raise ValueError("Arguments must be integers (found %s, %s)" % (key[0], key[1]))
 
-        with self._lock:
-            return 0 <= key[0] < len(self._squares) and \
-                   0 <= key[1] < len(self._squares[key[0]])
+        return 0 <= key[0] < self._height and \
+               0 <= key[1] < self._width
 
     def __iter__(self):
-        with self._lock:
-            return iter(chain(*self._squares))
+        return (Square(self, row, col) for row in range(self._height) for col in range(self._width))
 
     def square(self, row, col):
-        with self._lock:
-            return self._squares[row][col]
+        if (row, col) not in self:
+            raise IndexError("%d, %d coordinates are out of range" % (row, col))
+
+        return Square(self, row, col)
 
     def height(self):
-        with self._lock:
-            return len(self._squares)
+        return self._height
 
     def width(self):
-        with self._lock:
-            return len(self._squares[0]) if len(self._squares) > 0 else 0
+        return self._width
+
+    def seed(self):
+        """
+        :return: the seed the mines of the board were drawn from, which creates the same board again, or None if
+            unknown, e.g. for a board read from a text file.
+        """
+        return self._seed
 
     def mines_count(self):
         """
@@ -242,7 +836,7 @@ class Board:
             which have a bomb, or are "mined".
         """
         with self._lock:
-            return len([square for square in self if square.has_bomb])
+            return self._mines.count(1)
 
     def set_state(self, row, col, state):
         """
@@ -252,83 +846,409 @@ class Board:
         :param row: row coordinate
         :param col: col coordinate
         :param state: State value to set the (row, col) square into
+        :return: a set with the (row, col) coordinates of every square revealed (i.e. turned into DUG) by this call.
+            The set is empty unless state is DUG.
         """
-        self._lock.acquire()
-
         if (row, col) not in self:
             raise ValueError("%d, %d coordinates are out of range" % (row, col))
 
-        self._squares[row][col].state = state
+        index = row * self._width + col
 
-        if state == State.DUG and not self._squares[row][col].has_bomb:
-            neighbors = self.neighbors(row, col)
-            nearby_bombs = len([n for n in neighbors if n.has_bomb])
+        if state != State.DUG:
+            with self._tiles_locked((index,)):
+                if self._states[index] != _STATE_CODES[state]:
+                    self._states[index] = _STATE_CODES[state]
 
-            if nearby_bombs == 0:
-                for n in [s for s in neighbors if s.state != State.DUG]:
-                    self.set_state(n.row, n.col, State.DUG)
+                    with self._board_locked():
+                        self._changed((index,))
 
-        self._lock.release()
+            return set()
+
+        held = {self._tile(index)}
+
+        # Every attempt is timed, including the ones retried because a tile was busy
+        while True:
+            busy = None
+            acquired = self._acquire_tiles(sorted(held))
+
+            try:
+                revealed = self._flood_fill(index, held)
+
+                if revealed:
+                    # Dug while holding the board lock, which renders hold as well, so that every snapshot shows
+                    # either none or all of the squares revealed
+                    with self._board_locked():
+                        if self._tile_size is not None:
+                            for i in revealed:
+                                self._states[i] = _STATE_CODES[State.DUG]
+
+                        self._changed(revealed)
+            except _TileBusy as e:
+                busy = e.tile
+            finally:
+                self._release_tiles(held, acquired)
+
+            if busy is None:
+                return {(i // self._width, i % self._width) for i in revealed}
+
+            held.add(busy)
+
+    def _flood_fill(self, index, held):
+        """
+        Finds the squares dug by digging the square at the flat **index**: the square itself and, if it has no mined
+        neighbours, the whole empty region around it together with its numbered border. The region is visited with
+        an explicit stack, in O(region size) time and without any recursion, so that arbitrarily large open areas
+        can be revealed. Without lock striping, the board lock is held, and the squares are dug as they are found.
+        With lock striping, no square is modified: the caller digs them once every tile reached is held.
+        :param held: the set of the tiles whose lock is held by the caller. With lock striping, the locks of the
+            other tiles reached are acquired without blocking, and added to **held**.
+        :return: a list with the flat indices of the squares which were not DUG.
+        :raise: _TileBusy if a tile reached is locked by another thread.
+        """
+        dug = _STATE_CODES[State.DUG]
+        states, mines, counts = self._states, self._mines, self._counts
+        revealed = [index] if states[index] != dug else []
+        striped = self._tile_size is not None
+        # With lock striping, the squares found so far, which are not dug yet
+        visited = {index} if striped else None
+
+        if not striped:
+            states[index] = dug
+
+        if mines[index] or counts[index] != 0:
+            return revealed
+
+        width, height = self._width, self._height
+        # Offsets of the neighbours of a square which does not lie on the board edges
+        offsets = (-width - 1, -width, -width + 1, -1, 1, width - 1, width, width + 1)
+        stack = [index]
+
+        while stack:
+            current = stack.pop()
+            row, col = divmod(current, width)
+
+            if 0 < row < height - 1 and 0 < col < width - 1:
+                neighbors = [current + offset for offset in offsets]
+            else:
+                neighbors = self._neighbor_indices(row, col)
+
+            for n in neighbors:
+                if striped:
+                    tile = self._tile(n)
+
+                    if tile not in held:
+                        if not self._tile_locks[tile].acquire(blocking=False):
+                            raise _TileBusy(tile)
+
+                        held.add(tile)
+
+                    if n in visited or states[n] == dug:
+                        continue
+
+                    visited.add(n)
+                elif states[n] == dug:
+                    continue
+                else:
+                    states[n] = dug
+
+                revealed.append(n)
+
+                # The neighbours of a square with no mined neighbours are never mined
+                if counts[n] == 0:
+                    stack.append(n)
+
+        return revealed
 
     def neighbors(self, row, col):
         """
         :return: a list containing all those squares which are one square away from the (row, col) square, that is its
             "neighbours".
         """
-        self._lock.acquire()
-
         result = list()
-        min_row, max_row = max(row - 1, 0), min(row + 1, len(self._squares) - 1)
-        min_col, max_col = max(col - 1, 0), min(col + 1, len(self._squares[row]) - 1)
+        min_row, max_row = max(row - 1, 0), min(row + 1, self._height - 1)
+        min_col, max_col = max(col - 1, 0), min(col + 1, self._width - 1)
 
         for x in range(min_row, max_row + 1):
             for y in range(min_col, max_col + 1):
                 if (x, y) != (row, col):
-                    result.append(self._squares[x][y])
-
-        self._lock.release()
+                    result.append(Square(self, x, y))
 
         return result
 
+    def nearby_bombs(self, row, col):
+        """
+        :return: the number of mined squares among the neighbours of the (row, col) square, read from the index
+            built at creation time.
+        """
+        index = row * self._width + col
+
+        with self._tiles_locked((index,)):
+            return self._counts[index]
+
+    def _neighbor_indices(self, row, col):
+        """
+        :return: the flat indices of the neighbours of the (row, col) square.
+        """
+        min_row, max_row = max(row - 1, 0), min(row + 1, self._height - 1)
+        min_col, max_col = max(col - 1, 0), min(col + 1, self._width - 1)
+
+        return [x * self._width + y
+                for x in range(min_row, max_row + 1)
+                for y in range(min_col, max_col + 1)
+                if (x, y) != (row, col)]
+
+    def _count_nearby_bombs(self):
+        """
+        Builds the adjacent-mines index: a bytearray holding, for every square, the number of its mined neighbours.
+        """
+        return _count_neighbours(self._mines, self._height, self._width)
+
+    def _tile(self, index):
+        """
+        :return: the number of the tile containing the square at the flat **index**.
+        """
+        if self._tile_size is None:
+            return 0
+
+        row, col = divmod(index, self._width)
+
+        return (row // self._tile_size) * self._tiles_per_row + col // self._tile_size
+
+    def _acquire_tiles(self, tiles):
+        """
+        Acquires the locks of **tiles**, which must be sorted in increasing order, timing the wait.
+        :return: the perf_counter time the locks were acquired at, to be passed to _release_tiles.
+        """
+        start = perf_counter()
+
+        for tile in tiles:
+            self._tile_locks[tile].acquire()
+
+        acquired = perf_counter()
+        _LOCK_WAIT_SECONDS["tiles"].observe(acquired - start)
+
+        return acquired
+
+    def _release_tiles(self, tiles, acquired):
+        """
+        Releases the locks of **tiles**, acquired at the perf_counter time **acquired**, timing the hold.
+        """
+        for tile in tiles:
+            self._tile_locks[tile].release()
+
+        _LOCK_HOLD_SECONDS["tiles"].observe(perf_counter() - acquired)
+
+    @contextmanager
+    def _tiles_locked(self, indices):
+        """
+        Holds the locks of the tiles containing the squares at the flat **indices** for the duration of a with block.
+        """
+        tiles = sorted({self._tile(i) for i in indices})
+        acquired = self._acquire_tiles(tiles)
+
+        try:
+            yield
+        finally:
+            self._release_tiles(tiles, acquired)
+
+    @contextmanager
+    def _board_locked(self):
+        """
+        Holds the board lock for the duration of a with block, timing the wait and the hold.
+        """
+        start = perf_counter()
+        self._lock.acquire()
+        acquired = perf_counter()
+        _LOCK_WAIT_SECONDS["board"].observe(acquired - start)
+
+        try:
+            yield
+        finally:
+            self._lock.release()
+            _LOCK_HOLD_SECONDS["board"].observe(perf_counter() - acquired)
+
+    def _has_bomb(self, row, col):
+        index = row * self._width + col
+
+        with self._tiles_locked((index,)):
+            return bool(self._mines[index])
+
+    def _set_bomb(self, row, col, has_bomb):
+        """
+        Mines or clears the (row, col) square, keeping the adjacent-mines index of its neighbours up to date.
+        """
+        index = row * self._width + col
+        neighbors = self._neighbor_indices(row, col)
+
+        with self._tiles_locked([index] + neighbors):
+            value = 1 if has_bomb else 0
+            delta = value - self._mines[index]
+
+            if delta != 0:
+                self._mines[index] = value
+
+                for n in neighbors:
+                    self._counts[n] += delta
+
+                # The representation of the neighbours changes as well, if they are dug
+                self._changed([index] + neighbors)
+
+    def _state(self, row, col):
+        index = row * self._width + col
+
+        with self._tiles_locked((index,)):
+            return _STATES[self._states[index]]
+
+    def _set_square_state(self, row, col, state):
+        """
+        Sets the state of the (row, col) square only: unlike set_state, no neighbouring square is ever dug.
+        """
+        index = row * self._width + col
+
+        with self._tiles_locked((index,)):
+            if self._states[index] != _STATE_CODES[state]:
+                self._states[index] = _STATE_CODES[state]
+                self._changed((index,))
+
     def _check_state(self):
         """
         Performs validity checks on the current instance, raising relevant exceptions when detecting an invalid state.
         :return: True if no inconsistencies were found within the current instance.
         """
         self._lock.acquire()
-        expected_line_length = len(self._squares[0]) if len(self._squares) > 0 else None
-
-        for line in self._squares:
-            types = {type(square) for square in line}
 
-            if {Square} != types:
-                raise ValueError("The board can only contain Square variables within its grid")
-            if len(line) != expected_line_length:
-                raise ValueError("Found a %d-element-wide line, expected %d" % (len(line), expected_line_length))
+        if not len(self._mines) == len(self._states) == len(self._counts) == self._height * self._width:
+            raise ValueError("Expected %d squares, found %d" % (self._height * self._width, len(self._mines)))
+        if self._mines.count(0) + self._mines.count(1) != len(self._mines):
+            raise ValueError("The board can only contain boolean values within its grid")
+        if self._states.translate(None, bytes(range(len(_STATES)))):
+            raise ValueError("The board can only contain codes of states within its grid")
 
         self._lock.release()
 
         return True
 
     @staticmethod
-    def _random_mines_distribution(empty_squares, mined_squares):
-        distribution = [False for i in range(empty_squares)]
-        distribution.extend([True for i in range(mined_squares)])
-        shuffle(distribution)
+    def _from_mines(mines, height, width, tile_size=None, states=None, seed=None):
+        """
+        :param mines: a flat, row-major bytearray of **height** * **width** bytes, holding 1 for every mined square,
+            which is kept by the board without copy.
+        :param states: a bytearray of the state codes of the squares, kept without copy, or None for UNTOUCHED ones.
+        :param seed: the seed **mines** were drawn from, if any.
+        :return: a new Board instance, built without any intermediate list.
+        """
+        board = Board.__new__(Board)
+        board._initialize(mines, height, width, tile_size, states, seed)
+
+        return board
+
+    @staticmethod
+    def _new_seed(seed):
+        """
+        :return: **seed**, or a seed drawn from the global random generator if **seed** is None, so that seeding the
+            random module still makes boards reproducible.
+        """
+        return getrandbits(64) if seed is None else seed
+
+    @staticmethod
+    def _pack_bits(values, bits):
+        """
+        :param values: bytes holding values below 2 ** **bits**, where **bits** is 1 or 2.
+        :return: the values packed **bits** to a byte, the first one in the high bits, the last byte padded with 0s.
+            Each position within a byte is taken from every value at once, shifted through a translation table: the
+            positions of all bytes are added as big integers, which never carry since their bits do not overlap.
+        """
+        per_byte = 8 // bits
+        padded = bytes(values) + bytes(-len(values) % per_byte)
+        total = 0
+
+        for position, table in enumerate(_PACK_TABLES[bits]):
+            total += int.from_bytes(padded[position::per_byte].translate(table), "big")
+
+        return total.to_bytes(len(padded) // per_byte, "big")
+
+    @staticmethod
+    def _unpack_bits(data, bits, count):
+        """
+        :return: a bytearray of the first **count** values packed **bits** to a byte in **data**, as by _pack_bits.
+            Each position within a byte is extracted from every byte at once, through a translation table.
+        """
+        per_byte = 8 // bits
+        values = bytearray(len(data) * per_byte)
+
+        for position, table in enumerate(_UNPACK_TABLES[bits]):
+            values[position::per_byte] = data.translate(table)
+
+        del values[count:]
+
+        return values
+
+    @staticmethod
+    def _random_squares(generator, squares, probability):
+        """
+        :return: a bytearray of **squares** bytes, each 1 with **probability**, independently. Every square draws a
+            random byte, and is mined if the byte is below probability * 256, through a translation table. The few
+            squares drawing the byte holding probability * 256 draw again, so that the probability is exact.
+        """
+        threshold = probability * 256
+        whole = int(threshold)
+        draws = generator.randbytes(squares)
+        grid = bytearray(draws.translate(bytes(1 if byte < whole else 0 for byte in range(256))))
+        fraction = threshold - whole
+
+        if fraction and whole < 256:
+            index = draws.find(whole)
+
+            while index != -1:
+                grid[index] = generator.random() < fraction
+                index = draws.find(whole, index + 1)
 
-        return distribution
+        return grid
 
     @staticmethod
-    def _list_to_grid(squares, height, width):
+    def _random_mines(generator, squares, mines, excluded):
         """
-        Utility method used to convert a flat list of boolean values (representing mined squares) to
-        a multi-dimensional list with specified height and width.
-        :param squares: one-dimensional list of squares.
-        :param height: height of the resulting grid.
-        :param width: number of elements for each of the **height** rows.
-        :return: a grid-like list with the same values as **squares**.
+        :return: a bytearray of **squares** bytes holding 1 for exactly **mines** of them, chosen uniformly among the
+            squares whose index is not in **excluded**. Squares are first mined independently, with the density
+            expected, then random mines are removed, or added, until there are exactly **mines**: the count drawn is
+            off by about its standard deviation, a few thousand squares at most, so that few are drawn one by one.
         """
-        return [squares[i * width:(i * width) + width] for i in range(height)]
+        allowed = squares - len(excluded)
+        grid = Board._random_squares(generator, squares, mines / allowed)
+
+        for index in excluded:
+            grid[index] = 0
+
+        count = grid.count(1)
+
+        while count > mines:
+            index = generator.randrange(squares)
+
+            if grid[index]:
+                grid[index] = 0
+                count -= 1
+
+        while count < mines:
+            index = generator.randrange(squares)
+
+            if not grid[index] and index not in excluded:
+                grid[index] = 1
+                count += 1
+
+        return grid
+
+    @staticmethod
+    def _safe_squares(height, width, square):
+        """
+        :return: the set of the indices of the (row, col) **square** and of its neighbours.
+        """
+        row, col = square
+
+        if not (0 <= row < height and 0 <= col < width):
+            raise ValueError("%d, %d coordinates are out of range" % (row, col))
+
+        return {x * width + y for x in range(max(row - 1, 0), min(row + 2, height))
+                for y in range(max(col - 1, 0), min(col + 2, width))}
 
     def toggle_dug(self, toggles=1):
         """
@@ -336,15 +1256,26 @@ class Board:
         for more info). If the state of a square is FLAGGED no modification occurs.\n
         This method is primarily used for debug purposes.
         """
+        untouched, dug = _STATE_CODES[State.UNTOUCHED], _STATE_CODES[State.DUG]
+        # Translation table swapping the UNTOUCHED and DUG codes, leaving any other code unchanged
+        table = bytearray(range(256))
+        table[untouched], table[dug] = dug, untouched
+
+        tiles = range(len(self._tile_locks))
+        acquired = self._acquire_tiles(tiles)
         self._lock.acquire()
 
         for i in range(toggles):
-            for s in self:
-                if s.state == State.UNTOUCHED:
-                    # self.set_state(s.row, s.col, State.DUG)
-                    s.state = State.DUG
-                elif s.state == State.DUG:
-                    # self.set_state(s.row, s.col, State.UNTOUCHED)
-                    s.state = State.UNTOUCHED
-
-        self._lock.release()
\ No newline at end of file
+            self._states[:] = self._states.translate(table)
+
+        # Every square may have changed: the change log is dropped, forcing clients to fetch a full snapshot
+        self._version += 1
+        self._changelog.clear()
+        self._changelog_start = self._version
+        self._mark_dirty(range(self._height))
+
+        if self.journal is not None:
+            self.journal(self._journal_entries(range(len(self._states))))
+
+        self._lock.release()
+        self._release_tiles(tiles, acquired)
@@ -0,0 +1,463 @@
+"""
+Boards too large to be held in memory, such as unbounded maps: the squares are generated lazily, chunk by chunk, the
+first time they are reached, so that memory grows with the area explored by the players rather than with the size of
+the board.
+"""
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from random import Random
+from threading import RLock
+
+from board import (Board, BoardRegion, Square, State, _DUG_REPRESENTATIONS, _STATE_CODES, _STATE_REPRESENTATIONS,
+                   _STATES, _count_neighbours)
+
+
+class _Chunk:
+    """
+    The squares of a chunk of a ChunkedBoard, as flat, row-major bytearrays of chunk_size * chunk_size bytes: the
+    mines, the state codes and the numbers of mined neighbours of the squares, as in Board.
+    """
+
+    __slots__ = ("mines", "states", "counts")
+
+    def __init__(self, mines, counts):
+        self.mines = mines
+        self.states = bytearray(len(mines))
+        self.counts = counts
+
+
+class ChunkedBoard:
+    """
+    A board of **height** rows and **width** columns, by default as large as the binary protocol allows, i.e.
+    unbounded in practice, generated lazily in chunks of **chunk_size** x **chunk_size** squares. Every square is
+    mined with **bomb_probability**. The mines of a chunk are drawn from a random generator seeded with the seed of
+    the board and the coordinates of the chunk, so that a chunk is generated identically whenever, and in whatever
+    order, it is reached: the same seed always creates the same board.\n
+    Memory: chunks are only generated when one of their squares is read or changed, together with the mines of the
+    bordering squares of their neighbours, needed by the numbers of mined neighbours. Chunks whose squares were never
+    changed are unexplored: at most **max_chunks** chunks are held, the least recently used unexplored chunks being
+    dropped beyond that, to be generated again when reached. Explored chunks are always kept. Rendering a region never
+    generates any chunk: the squares of the chunks not held are all untouched.\n
+    The board implements the interface of Board used by the servers, but for the operations visiting every square:
+    it can neither be iterated, nor saved, nor journaled, and its whole text cannot be rendered. The board sent to
+    the clients without a viewport is the region of DEFAULT_VIEWPORT.\n
+    Thread safety: every method holds the board lock, a reentrant lock guarding the chunks and the change log.
+    """
+    # The largest number of rows and columns, i.e. the largest coordinate of the binary protocol
+    MAX_SIZE = 2 ** 31 - 1
+    DEFAULT_CHUNK_SIZE = 64
+    DEFAULT_MAX_CHUNKS = 4096
+    # The (row, col, height, width) region sent to the clients without a viewport
+    DEFAULT_VIEWPORT = (0, 0, 20, 40)
+    # The largest number of rows and columns of a region
+    MAX_REGION_SIZE = 1000
+    # The largest number of squares revealed by a single dig, since an empty area may be as large as the board
+    MAX_REVEALED = 2 ** 16
+    CHANGELOG_SIZE = Board.CHANGELOG_SIZE
+
+    def __init__(self, height=MAX_SIZE, width=MAX_SIZE, bomb_probability=0.15, seed=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_chunks=DEFAULT_MAX_CHUNKS):
+        if height <= 0 or width <= 0:
+            raise ValueError("The grid size must be greater than 0 (found %d x %d)" % (height, width))
+        if not 0 <= bomb_probability < 1:
+            raise ValueError("It must be 0 <= bomb_probability <= 1 (bomb_probability = %f)" % bomb_probability)
+        if chunk_size <= 0:
+            raise ValueError("The chunk size must be greater than 0 (found %d)" % chunk_size)
+
+        self._lock = RLock()
+        self._height = height
+        self._width = width
+        self._bomb_probability = bomb_probability
+        self._seed = Board._new_seed(seed)
+        self._chunk_size = chunk_size
+        self._max_chunks = max_chunks
+        # The chunks held, by (chunk row, chunk col), and the keys of the unexplored ones, least recently used first
+        self._chunks = dict()
+        self._unexplored = OrderedDict()
+
+        # Versioning, as in Board: the change log keeps (version, (row, col)) entries
+        self._version = 0
+        self._changelog = deque()
+        self._changelog_start = 0
+
+    def __repr__(self):
+        with self._lock:
+            return "<'%s.%s' object, height=%d, width=%d, chunk_size=%d, chunks=%d>" % \
+                   (self.__class__.__module__, self.__class__.__name__, self._height, self._width, self._chunk_size,
+                    len(self._chunks))
+
+    def __str__(self):
+        """
+        :return: the text representation of the region of DEFAULT_VIEWPORT.
+        """
+        return str(self.snapshot())
+
+    def __len__(self):
+        return self._height * self._width
+
+    def __contains__(self, key):
+        if not (isinstance(key[0], int) and isinstance(key[1], int)):
+            raise ValueError("Arguments must be integers (found %s, %s)" % (key[0], key[1]))
+
+        return 0 <= key[0] < self._height and \
+               0 <= key[1] < self._width
+
+    def square(self, row, col):
+        if (row, col) not in self:
+            raise IndexError("%d, %d coordinates are out of range" % (row, col))
+
+        return Square(self, row, col)
+
+    def height(self):
+        return self._height
+
+    def width(self):
+        return self._width
+
+    def seed(self):
+        """
+        :return: the seed the mines of the board are drawn from, which creates the same board again.
+        """
+        return self._seed
+
+    def chunk_size(self):
+        return self._chunk_size
+
+    def chunks(self):
+        """
+        :return: the number of chunks held in memory.
+        """
+        with self._lock:
+            return len(self._chunks)
+
+    def version(self):
+        """
+        :return: an int which is increased by every mutation of the board.
+        """
+        with self._lock:
+            return self._version
+
+    def snapshot(self):
+        """
+        :return: the BoardRegion of DEFAULT_VIEWPORT, sent in place of the whole board.
+        """
+        return self.region(*self.DEFAULT_VIEWPORT)
+
+    def region(self, row, col, height, width):
+        """
+        :return: the BoardRegion of **height** rows and **width** columns from the (**row**, **col**) square, clipped
+            to the board and to MAX_REGION_SIZE rows and columns. Rendering it costs O(height * width), and generates
+            no chunk.
+        """
+        with self._lock:
+            row, col = min(max(row, 0), self._height), min(max(col, 0), self._width)
+            height = max(min(row + min(height, self.MAX_REGION_SIZE), self._height) - row, 0)
+            width = max(min(col + min(width, self.MAX_REGION_SIZE), self._width) - col, 0)
+
+            return BoardRegion(self._version, row, col, width,
+                               tuple(self._render_row(rowindex, col, width) for rowindex in range(row, row + height)))
+
+    def _render_row(self, rowindex, col, width):
+        """
+        :return: the text of the **width** squares from the (**rowindex**, **col**) square, each followed by a space.
+        """
+        size, dug = self._chunk_size, _STATE_CODES[State.DUG]
+        chunk_row, offset = divmod(rowindex, size)
+        parts = list()
+        current, end = col, col + width
+
+        while current < end:
+            chunk_col, start = divmod(current, size)
+            stop = min(size, start + end - current)
+            chunk = self._chunks.get((chunk_row, chunk_col))
+
+            if chunk is None:
+                parts.append((State.UNTOUCHED.representation + " ") * (stop - start))
+            elif dug not in chunk.states[offset * size + start:offset * size + stop]:
+                # As in Board._render_row, a part without dug squares is translated at once
+                cells = bytearray(b" ") * (2 * (stop - start))
+                cells[0::2] = chunk.states[offset * size + start:offset * size + stop].translate(_STATE_REPRESENTATIONS)
+                parts.append(cells.decode())
+            else:
+                parts.extend(self._representation(chunk, index) + " "
+                             for index in range(offset * size + start, offset * size + stop))
+
+            current += stop - start
+
+        return "".join(parts)
+
+    @contextmanager
+    def batch(self, deferred=False):
+        """
+        Holds the board lock for the duration of a with block, as Board.batch does. **deferred** is ignored: regions
+        are rendered when requested, so that there is no snapshot to defer.
+        """
+        with self._lock:
+            yield self
+
+    def changes_since(self, version):
+        """
+        :param version: a version of the board previously returned to a client.
+        :return: a (version, changes) tuple, as returned by Board.changes_since, or None.
+        """
+        with self._lock:
+            if not self._changelog_start <= version <= self._version:
+                return None
+
+            squares = dict()
+
+            for entry_version, square in reversed(self._changelog):
+                if entry_version <= version:
+                    break
+                squares[square] = None
+
+            return self._version, [(row, col, self._representation(*self._locate(row, col)))
+                                   for row, col in sorted(squares)]
+
+    def _changed(self, squares):
+        """
+        Records a mutation of the (row, col) **squares**, as Board._changed does. The chunks of the squares are
+        explored from then on.
+        """
+        self._version += 1
+
+        if len(squares) > self.CHANGELOG_SIZE:
+            self._changelog.clear()
+            self._changelog_start = self._version
+        else:
+            self._changelog.extend((self._version, square) for square in squares)
+
+            while len(self._changelog) > self.CHANGELOG_SIZE:
+                self._changelog_start = self._changelog.popleft()[0]
+
+        for row, col in squares:
+            self._unexplored.pop((row // self._chunk_size, col // self._chunk_size), None)
+
+    @staticmethod
+    def _representation(chunk, index):
+        """
+        :return: the text of the square at **index** in **chunk**.
+        """
+        state = _STATES[chunk.states[index]]
+
+        if state != State.DUG:
+            return state.representation
+        if chunk.mines[index]:
+            return Square.REPR_BOMB
+
+        return _DUG_REPRESENTATIONS[chunk.counts[index]]
+
+    def set_state(self, row, col, state):
+        """
+        Set the state of the (row, col) square to **state**, as Board.set_state does: digging a square with no mined
+        neighbours digs the whole empty area around it, across chunks. At most MAX_REVEALED squares are revealed by
+        a call: the squares of a larger area left untouched can be dug in turn.
+        :return: a set with the (row, col) coordinates of every square revealed by this call.
+        """
+        if (row, col) not in self:
+            raise ValueError("%d, %d coordinates are out of range" % (row, col))
+
+        with self._lock:
+            if state != State.DUG:
+                self._set_square_state(row, col, state)
+
+                return set()
+
+            revealed = self._flood_fill(row, col)
+
+            if revealed:
+                self._changed(revealed)
+
+            self._evict()
+
+            return set(revealed)
+
+    def _flood_fill(self, row, col):
+        """
+        Digs the (row, col) square and, if it has no mined neighbours, the empty area around it together with its
+        numbered border, visited with an explicit stack, as Board._flood_fill does.
+        :return: a list with the (row, col) coordinates of the squares which were not DUG before this call.
+        """
+        dug = _STATE_CODES[State.DUG]
+        chunk, index = self._locate(row, col)
+        revealed = [(row, col)] if chunk.states[index] != dug else []
+        chunk.states[index] = dug
+
+        if chunk.mines[index] or chunk.counts[index] != 0:
+            return revealed
+
+        stack = [(row, col)]
+
+        while stack and len(revealed) < self.MAX_REVEALED:
+            current_row, current_col = stack.pop()
+
+            for neighbour in self._neighbour_squares(current_row, current_col):
+                chunk, index = self._locate(*neighbour)
+
+                if chunk.states[index] != dug:
+                    chunk.states[index] = dug
+                    revealed.append(neighbour)
+
+                    # The neighbours of a square with no mined neighbours are never mined
+                    if chunk.counts[index] == 0:
+                        stack.append(neighbour)
+
+        return revealed
+
+    def neighbors(self, row, col):
+        """
+        :return: a list containing the squares which are one square away from the (row, col) square.
+        """
+        return [Square(self, x, y) for x, y in self._neighbour_squares(row, col)]
+
+    def nearby_bombs(self, row, col):
+        """
+        :return: the number of mined squares among the neighbours of the (row, col) square.
+        """
+        with self._lock:
+            chunk, index = self._locate(row, col)
+            count = chunk.counts[index]
+            self._evict()
+
+            return count
+
+    def _neighbour_squares(self, row, col):
+        """
+        :return: the (row, col) coordinates of the neighbours of the (row, col) square.
+        """
+        return [(x, y)
+                for x in range(max(row - 1, 0), min(row + 2, self._height))
+                for y in range(max(col - 1, 0), min(col + 2, self._width))
+                if (x, y) != (row, col)]
+
+    def _has_bomb(self, row, col):
+        with self._lock:
+            chunk, index = self._locate(row, col)
+            has_bomb = bool(chunk.mines[index])
+            self._evict()
+
+            return has_bomb
+
+    def _set_bomb(self, row, col, has_bomb):
+        """
+        Mines or clears the (row, col) square, keeping the numbers of mined neighbours of its neighbours up to date.
+        """
+        with self._lock:
+            squares = [(row, col)] + self._neighbour_squares(row, col)
+            # The chunks of the neighbours are generated first, counting the mine as it was
+            located = [self._locate(*square) for square in squares]
+            chunk, index = located[0]
+            delta = (1 if has_bomb else 0) - chunk.mines[index]
+
+            if delta != 0:
+                chunk.mines[index] += delta
+
+                for neighbour, neighbour_index in located[1:]:
+                    neighbour.counts[neighbour_index] += delta
+
+                self._changed(squares)
+
+            self._evict()
+
+    def _state(self, row, col):
+        with self._lock:
+            chunk, index = self._locate(row, col)
+            state = _STATES[chunk.states[index]]
+            self._evict()
+
+            return state
+
+    def _set_square_state(self, row, col, state):
+        """
+        Sets the state of the (row, col) square only: unlike set_state, no neighbouring square is ever dug.
+        """
+        with self._lock:
+            chunk, index = self._locate(row, col)
+
+            if chunk.states[index] != _STATE_CODES[state]:
+                chunk.states[index] = _STATE_CODES[state]
+                self._changed([(row, col)])
+
+            self._evict()
+
+    def _locate(self, row, col):
+        """
+        :return: a (chunk, index) tuple: the chunk holding the (row, col) square, generated if needed, and the index
+            of the square within the chunk.
+        """
+        chunk_row, chunk_offset_row = divmod(row, self._chunk_size)
+        chunk_col, chunk_offset_col = divmod(col, self._chunk_size)
+        key = (chunk_row, chunk_col)
+        chunk = self._chunks.get(key)
+
+        if chunk is None:
+            chunk = self._chunks[key] = self._generate(chunk_row, chunk_col)
+            self._unexplored[key] = None
+        elif key in self._unexplored:
+            self._unexplored.move_to_end(key)
+
+        return chunk, chunk_offset_row * self._chunk_size + chunk_offset_col
+
+    def _evict(self):
+        """
+        Drops the least recently used unexplored chunks while more than max_chunks chunks are held. Chunks are only
+        dropped once an operation is over, so that no chunk is dropped while being changed.
+        """
+        while len(self._chunks) > self._max_chunks and self._unexplored:
+            key, _ = self._unexplored.popitem(last=False)
+            del self._chunks[key]
+
+    def _generate(self, chunk_row, chunk_col):
+        """
+        :return: the _Chunk at (**chunk_row**, **chunk_col**), with its squares untouched. The numbers of mined
+            neighbours are counted on the mines of the chunk surrounded by the bordering squares of its neighbours,
+            as held if they are, or as generated otherwise.
+        """
+        size = self._chunk_size
+        padded = size + 2
+        mines = self._generate_mines(chunk_row, chunk_col)
+        grid = bytearray(padded * padded)
+
+        for row_offset in (-1, 0, 1):
+            for col_offset in (-1, 0, 1):
+                if row_offset == col_offset == 0:
+                    source = mines
+                elif (chunk_row + row_offset, chunk_col + col_offset) in self._chunks:
+                    source = self._chunks[chunk_row + row_offset, chunk_col + col_offset].mines
+                else:
+                    source = self._generate_mines(chunk_row + row_offset, chunk_col + col_offset)
+
+                # The rows and the columns of the neighbour bordering the chunk
+                rows = range(size) if row_offset == 0 else (size - 1,) if row_offset < 0 else (0,)
+                first, last = (0, size) if col_offset == 0 else (size - 1, size) if col_offset < 0 else (0, 1)
+
+                for rowindex in rows:
+                    target = (rowindex + 1 + row_offset * size) * padded + first + 1 + col_offset * size
+                    grid[target:target + last - first] = source[rowindex * size + first:rowindex * size + last]
+
+        counts = _count_neighbours(grid, padded, padded)
+
+        return _Chunk(mines, bytearray().join(counts[rowindex * padded + 1:rowindex * padded + 1 + size]
+                                              for rowindex in range(1, size + 1)))
+
+    def _generate_mines(self, chunk_row, chunk_col):
+        """
+        :return: the mines of the chunk at (**chunk_row**, **chunk_col**), drawn from the seed of the board and the
+            coordinates of the chunk. The squares beyond the board are never mined.
+        """
+        size = self._chunk_size
+        rows, cols = self._height - chunk_row * size, self._width - chunk_col * size
+
+        if chunk_row < 0 or chunk_col < 0 or rows <= 0 or cols <= 0:
+            return bytearray(size * size)
+
+        generator = Random("%d %d %d" % (self._seed, chunk_row, chunk_col))
+        mines = Board._random_squares(generator, size * size, self._bomb_probability)
+
+        if cols < size:
+            for rowindex in range(size):
+                mines[rowindex * size + cols:(rowindex + 1) * size] = bytes(size - cols)
+        if rows < size:
+            mines[rows * size:] = bytes((size - rows) * size)
+
+        return mines
@@ -0,0 +1,77 @@
+"""
+Compares the memory and the latency of the Board storage (two flat bytearrays) against the former layout (a list of
+lists of Square objects, one per cell). Run from the minesweeper package directory:
+    python -m expirements.exp_board_storage
+"""
+import tracemalloc
+from random import shuffle
+from time import perf_counter
+
+from board import Board, State
+
+
+class LegacySquare:
+
+    def __init__(self, row, col, has_bomb, state):
+        self.row, self.col = row, col
+        self.has_bomb = has_bomb
+        self.state = state
+
+
+class LegacyBoard:
+    """
+    The former Board layout, reduced to its construction and mines counting code.
+    """
+
+    def __init__(self, boolean_grid):
+        self._squares = list()
+
+        for row in range(len(boolean_grid)):
+            self._squares.append(list())
+
+            for col in range(len(boolean_grid[row])):
+                self._squares[row].append(
+                    LegacySquare(row, col, boolean_grid[row][col], State.UNTOUCHED)
+                )
+
+    def mines_count(self):
+        return len([square for row in self._squares for square in row if square.has_bomb])
+
+
+def measure(function, *args):
+    """
+    :return: a (result, seconds, peak bytes) tuple for the call function(*args).
+    """
+    tracemalloc.start()
+    start = perf_counter()
+    result = function(*args)
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def main():
+    configs = {
+        "sizes": (100, 500, 1000),
+        "bomb_probability": 0.2,
+    }
+
+    print("%-8s %-8s %12s %12s %12s" % ("size", "layout", "build (s)", "peak (MB)", "count (s)"))
+
+    for size in configs["sizes"]:
+        mines = int(size * size * configs["bomb_probability"])
+        squares = [False] * (size * size - mines) + [True] * mines
+        shuffle(squares)
+        grid = [squares[i * size:(i + 1) * size] for i in range(size)]
+
+        for name, layout in (("legacy", LegacyBoard), ("board", Board)):
+            board, build_time, peak = measure(layout, grid)
+            count_time = measure(board.mines_count)[1]
+
+            print("%-8d %-8s %12.4f %12.2f %12.4f" % (size, name, build_time, peak / 2 ** 20, count_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+A microbenchmark suite of the hot paths of Board, on seeded boards from the Board.DIFF_* presets up to 4000x4000
+squares. Every operation is timed on every case (the best and the mean of a few runs, in seconds per call), then run
+once more under tracemalloc, for the peak memory it allocated: timings are never taken with tracemalloc on, which
+slows allocations down. Boards are built with the global random generator, seeded before every run, so that every
+run of an operation sees the same boards.\n
+The results are saved as JSON with --output, and compared to a previous run with --compare: the exit status is 1
+if the time or the peak memory of any operation grew by more than --tolerance. Building a 4000x4000 board takes about
+a second, before every run: the full suite takes a few minutes. Run from the minesweeper package directory, e.g.:
+    python -m expirements.exp_board_suite --output baseline.json
+    python -m expirements.exp_board_suite --cases easy,hard,1000 --compare baseline.json
+"""
+import json
+import random
+import tracemalloc
+from argparse import ArgumentParser
+from os import close, remove
+from platform import python_version
+from sys import argv, exit
+from tempfile import mkstemp
+from time import perf_counter, strftime
+
+from board import Board, State
+
+# The name and the (height, width, mines) of every case: the presets, then square boards with 15% of mines
+CASES = [("easy", Board.DIFF_EASY), ("intermediate", Board.DIFF_INTERMEDIATE), ("hard", Board.DIFF_HARD)] + \
+        [(str(size), (size, size, int(size * size * 0.15))) for size in (100, 1000, 4000)]
+# The mines density of the boards flood-filled, low enough for a dig to reveal large regions
+FLOOD_FILL_DENSITY = 0.01
+# The number of squares whose neighbours are listed by a run of "neighbors"
+NEIGHBORS_SAMPLE = 1000
+
+
+def seeded(case, seed):
+    """
+    Seeds the global random generator, for an operation building a board itself.
+    """
+    random.seed(seed)
+
+    return case
+
+
+def seeded_board(case, seed, density=None):
+    """
+    :return: a board of the size of **case**, with its mines or **density**, built from **seed**.
+    """
+    height, width, mines = case
+    random.seed(seed)
+
+    if density is not None:
+        return Board.create_from_probability(height, width, density)
+
+    return Board.create_from_difficulty(case)
+
+
+def write_board_file(case, seed):
+    """
+    :return: the path of a temporary board file of the size of **case**, in the format of Board.create_from_file.
+    """
+    board = seeded_board(case, seed)
+    descriptor, path = mkstemp(suffix=".txt")
+    width = board.width()
+    line = bytearray(b" ") * (2 * width)
+    line[-1:] = b"\n"
+
+    with open(descriptor, "wb") as file:
+        for row in range(board.height()):
+            line[0::2] = board._mines[row * width:(row + 1) * width].translate(bytes.maketrans(b"\0\1", b"01"))
+            file.write(line)
+
+    return path
+
+
+def write_packed_board_file(case, seed):
+    """
+    :return: the path of a temporary board file of the size of **case**, in the packed format of Board.save.
+    """
+    descriptor, path = mkstemp(suffix=".msb")
+    close(descriptor)
+    seeded_board(case, seed).save(path)
+
+    return path
+
+
+def save_board(case, seed):
+    descriptor, path = mkstemp(suffix=".msb")
+    close(descriptor)
+
+    return seeded_board(case, seed), path
+
+
+def first_safe_square(board):
+    """
+    :return: the (row, col) of the square closest to the centre of **board**, in row-major order, without a mine.
+    """
+    start = (board.height() // 2) * board.width() + board.width() // 2
+
+    for index in range(start, start + len(board)):
+        row, col = divmod(index % len(board), board.width())
+
+        if not board.square(row, col).has_bomb:
+            return row, col
+
+
+def neighbors_sample(case, seed):
+    board = seeded_board(case, seed)
+    sampler = random.Random(seed)
+
+    return board, [(sampler.randrange(board.height()), sampler.randrange(board.width()))
+                   for i in range(NEIGHBORS_SAMPLE)]
+
+
+def neighbors(arguments):
+    board, squares = arguments
+
+    for row, col in squares:
+        board.neighbors(row, col)
+
+
+def calls(method, count):
+    """
+    :return: a function calling **method** on a board **count** times, without keeping the results.
+    """
+    def call(board):
+        for i in range(count):
+            method(board)
+
+    return call
+
+
+def iterate(board):
+    for square in board:
+        pass
+
+
+def flood_fill_board(case, seed):
+    board = seeded_board(case, seed, FLOOD_FILL_DENSITY)
+
+    return board, first_safe_square(board)
+
+
+def flood_fill(arguments):
+    board, (row, col) = arguments
+    board.set_state(row, col, State.DUG)
+
+
+# For every operation: a setup function taking the case and the seed, whose result is passed to the function timed,
+# the number of calls made by the function timed, and a predicate telling whether the operation supports a case
+OPERATIONS = {
+    "create_from_difficulty": (seeded, Board.create_from_difficulty, 1, None),
+    "create_from_probability": (seeded,
+                                lambda case: Board.create_from_probability(case[0], case[1], case[2] / case[0] / case[1]),
+                                1, None),
+    "create_from_file": (write_board_file, Board.create_from_file, 1, None),
+    "create_from_packed_file": (write_packed_board_file, Board.create_from_file, 1, None),
+    "save": (save_board, lambda arguments: arguments[0].save(arguments[1]), 1, None),
+    "__str__": (seeded_board, str, 1, None),
+    "neighbors": (neighbors_sample, neighbors, NEIGHBORS_SAMPLE, None),
+    "mines_count": (seeded_board, calls(Board.mines_count, 1000), 1000, None),
+    "__len__": (seeded_board, calls(len, 1000), 1000, None),
+    "__iter__": (seeded_board, iterate, 1, None),
+    "set_state_flood_fill": (flood_fill_board, flood_fill, 1, None),
+    "toggle_dug": (seeded_board, Board.toggle_dug, 1, None),
+}
+
+
+def measure(operation, case, seed, repeat, budget):
+    """
+    Runs **operation** on **case** up to **repeat** times, or until **budget** seconds were spent, then once more
+    under tracemalloc. Setups are neither timed nor traced.
+    :return: a dict of the best and mean seconds per call, and of the peak bytes allocated by a run.
+    """
+    setup, function, calls = OPERATIONS[operation][:3]
+    times = list()
+
+    while len(times) < repeat and sum(times) < budget:
+        arguments = setup(case, seed)
+        start = perf_counter()
+        function(arguments)
+        times.append(perf_counter() - start)
+        cleanup(operation, arguments)
+
+    arguments = setup(case, seed)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    function(arguments)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    cleanup(operation, arguments)
+
+    return {
+        "best_seconds": min(times) / calls,
+        "mean_seconds": sum(times) / len(times) / calls,
+        "peak_bytes": peak,
+        "runs": len(times),
+    }
+
+
+def cleanup(operation, arguments):
+    if operation in ("create_from_file", "create_from_packed_file"):
+        remove(arguments)
+    elif operation == "save":
+        remove(arguments[1])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of the best time and of the peak memory of every operation from **baseline** to **results**.
+    :return: True if any of them grew by more than **tolerance**, a fraction.
+    """
+    regressed = False
+    print("\n%-24s %-13s %-12s %10s %10s" % ("operation", "case", "statistic", "change", ""))
+
+    for operation, cases in results["results"].items():
+        for name, statistics in cases.items():
+            previous = baseline["results"].get(operation, {}).get(name)
+
+            if previous is None:
+                continue
+
+            for statistic in ("best_seconds", "peak_bytes"):
+                if not previous[statistic]:
+                    continue
+
+                change = statistics[statistic] / previous[statistic] - 1
+                flag = ""
+
+                if change > tolerance:
+                    regressed = True
+                    flag = "REGRESSION"
+
+                print("%-24s %-13s %-12s %+9.1f%% %10s" % (operation, name, statistic, change * 100, flag))
+
+    return regressed
+
+
+def main():
+    configs = {
+        "seed": 0,
+        "repeat": 5,
+        # Seconds after which an operation is no longer repeated on a case
+        "budget": 2,
+        "tolerance": 0.2,
+    }
+
+    ap = ArgumentParser("Board microbenchmark suite")
+    ap.add_argument("--cases", default=",".join(name for name, case in CASES),
+                    help="Comma-separated names of the cases to run, among %s" % ", ".join(name for name, case in CASES))
+    ap.add_argument("--operations", default=",".join(OPERATIONS),
+                    help="Comma-separated names of the operations to run, among %s" % ", ".join(OPERATIONS))
+    ap.add_argument("--seed", type=int, default=configs["seed"], help="Seed of the boards")
+    ap.add_argument("--repeat", type=int, default=configs["repeat"], help="Maximum number of timed runs")
+    ap.add_argument("-o", "--output", help="Path of a JSON file to save the results to")
+    ap.add_argument("--compare", help="Path of the JSON results of a previous run to compare this run to")
+    ap.add_argument("--tolerance", type=float, default=configs["tolerance"],
+                    help="Fraction by which a time or a peak memory may grow before --compare fails")
+    arguments = ap.parse_args(argv[1:])
+
+    cases = dict(CASES)
+    names = arguments.cases.split(",")
+    operations = arguments.operations.split(",")
+
+    for name in names:
+        if name not in cases:
+            ap.error("unknown case '%s'" % name)
+    for operation in operations:
+        if operation not in OPERATIONS:
+            ap.error("unknown operation '%s'" % operation)
+
+    results = dict()
+    print("%-24s %-13s %14s %14s %12s" % ("operation", "case", "best (us)", "mean (us)", "peak (KiB)"))
+
+    for operation in operations:
+        results[operation] = dict()
+        supports = OPERATIONS[operation][3]
+
+        for name in names:
+            if supports is not None and not supports(cases[name]):
+                continue
+
+            statistics = measure(operation, cases[name], arguments.seed, arguments.repeat, configs["budget"])
+            results[operation][name] = statistics
+
+            print("%-24s %-13s %14.3f %14.3f %12.1f" % (operation, name, statistics["best_seconds"] * 1e6,
+                                                          statistics["mean_seconds"] * 1e6,
+                                                          statistics["peak_bytes"] / 1024))
+
+    results = {
+        "date": strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": python_version(),
+        "config": {"cases": names, "seed": arguments.seed, "repeat": arguments.repeat},
+        "results": results,
+    }
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as file:
+            if compare(results, json.load(file), arguments.tolerance):
+                exit(1)
+
+
+if __name__ == "__main__":
+    main()
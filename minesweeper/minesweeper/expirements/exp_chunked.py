@@ -0,0 +1,76 @@
+"""
+Compares a Board and a ChunkedBoard of increasing size, with 15% of mines: the time and the peak memory of their
+creation, then of a game exploring a fixed area, a number of digs in a 256 x 256 square of the board, and the time of
+the reply to "look" with an 80 x 40 viewport. The Board is skipped on the largest sizes. Run from the minesweeper
+package directory:
+    python -m expirements.exp_chunked
+"""
+import tracemalloc
+from random import Random
+from time import perf_counter
+
+from board import Board, State
+from chunked import ChunkedBoard
+
+
+def play(board, area, digs, seed):
+    """
+    Digs **digs** random squares of the **area** x **area** square at the top left of **board**.
+    """
+    generator = Random(seed)
+
+    for i in range(digs):
+        board.set_state(generator.randrange(area), generator.randrange(area), State.DUG)
+
+
+def measure(function):
+    """
+    :return: the (result, seconds, peak bytes) of a call of **function**.
+    """
+    tracemalloc.start()
+    start = perf_counter()
+    result = function()
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def main():
+    configs = {
+        "sizes": (1000, 4000, 10 ** 6, ChunkedBoard.MAX_SIZE),
+        # The largest size a Board is created with
+        "board_size": 4000,
+        "density": 0.15,
+        "area": 256,
+        "digs": 200,
+        "viewport": (10, 10, 40, 80),
+        "seed": 0,
+    }
+
+    print("%-12s %-8s %12s %12s %10s %12s %10s %12s" % ("size", "board", "create (s)", "create (MiB)", "play (s)",
+                                                        "play (MiB)", "chunks", "look (ms)"))
+
+    for size in configs["sizes"]:
+        boards = [("chunked", lambda: ChunkedBoard(size, size, configs["density"], seed=configs["seed"]))]
+
+        if size <= configs["board_size"]:
+            boards.insert(0, ("board", lambda: Board.create_from_probability(size, size, configs["density"],
+                                                                             seed=configs["seed"])))
+
+        for name, create in boards:
+            board, create_time, create_peak = measure(create)
+            _, play_time, play_peak = measure(lambda: play(board, configs["area"], configs["digs"], configs["seed"]))
+            start = perf_counter()
+            board.region(*configs["viewport"]).encoded()
+            look_time = perf_counter() - start
+            chunks = board.chunks() if isinstance(board, ChunkedBoard) else 0
+
+            print("%-12d %-8s %12.3f %12.1f %10.3f %12.1f %10d %12.3f" %
+                  (size, name, create_time, create_peak / 2 ** 20, play_time, play_peak / 2 ** 20, chunks,
+                   look_time * 1e3))
+
+
+if __name__ == "__main__":
+    main()
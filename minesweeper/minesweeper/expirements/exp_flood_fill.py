@@ -0,0 +1,38 @@
+"""
+Benchmarks the flood-fill behind Board.set_state(..., State.DUG) on a large board with a low mines density. Run from
+the minesweeper package directory:
+    python -m expirements.exp_flood_fill
+"""
+from sys import getrecursionlimit
+from time import perf_counter
+
+from board import Board, State
+
+
+def main():
+    configs = {
+        "size": 2000,
+        "bomb_probability": 0.002,
+        "digs": 5,
+    }
+    start = perf_counter()
+    board = Board.create_from_probability(configs["size"], configs["size"], configs["bomb_probability"])
+    print("Created a %dx%d board with %d mines in %.3fs" %
+          (configs["size"], configs["size"], board.mines_count(), perf_counter() - start))
+
+    digs = [(i * configs["size"] // configs["digs"], i * configs["size"] // configs["digs"])
+            for i in range(configs["digs"])]
+
+    for row, col in digs:
+        start = perf_counter()
+        revealed = board.set_state(row, col, State.DUG)
+        elapsed = perf_counter() - start
+
+        print("dig %d %d: %d squares revealed in %.3fs (%.0f squares/s, recursion limit is %d)" %
+              (row, col, len(revealed), elapsed, len(revealed) / elapsed if elapsed else 0, getrecursionlimit()))
+
+        del revealed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares the time and the peak memory of the creation of boards of increasing size, with 15% of mines: the mines
+placed from a shuffled list of booleans, split into a grid of lists (the former Board.create_from_difficulty), and
+sampled directly into a bytearray, from a seed, with and without a first-click-safe square. The list-based creation
+is skipped on the largest boards. Run from the minesweeper package directory:
+    python -m expirements.exp_generation
+"""
+import tracemalloc
+from random import shuffle
+from time import perf_counter
+
+from board import Board
+
+
+def legacy(height, width, mines):
+    squares = [False] * (height * width - mines) + [True] * mines
+    shuffle(squares)
+
+    return Board([squares[i * width:(i + 1) * width] for i in range(height)])
+
+
+def measure(create):
+    start = perf_counter()
+    create()
+    elapsed = perf_counter() - start
+
+    tracemalloc.start()
+    create()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+    configs = {
+        "sizes": (100, 1000, 2000, 4000, 8000),
+        "density": 0.15,
+        # The largest size the list-based creation runs on
+        "legacy_size": 2000,
+        "seed": 0,
+    }
+
+    print("%-8s %-10s %12s %12s" % ("size", "creation", "time (s)", "peak (MiB)"))
+
+    for size in configs["sizes"]:
+        difficulty = (size, size, int(size * size * configs["density"]))
+        creations = [("seeded", lambda: Board.create_from_difficulty(difficulty, seed=configs["seed"])),
+                     ("safe", lambda: Board.create_from_difficulty(difficulty, seed=configs["seed"],
+                                                                   safe=(size // 2, size // 2)))]
+
+        if size <= configs["legacy_size"]:
+            creations.insert(0, ("lists", lambda: legacy(*difficulty)))
+
+        for name, create in creations:
+            elapsed, peak = measure(create)
+
+            print("%-8d %-10s %12.3f %12.1f" % (size, name, elapsed, peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures the cost of journaling boards: the time of a mutation of a board with and without a journal attached (the
+changes are only appended to a list in memory, the journal being flushed by its background thread), the time of a
+group commit of the changes of a number of mutations, and the time taken to recover a board from its snapshot and a
+journal of a given size. Run from the minesweeper package directory:
+    python -m expirements.exp_journal
+"""
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from board import Board, State
+from journal import BoardJournal
+
+
+def mutate(board, mutations):
+    """
+    Flags and deflags the squares of the first row of **board**.
+    :return: the seconds spent.
+    """
+    width = board.width()
+    start = perf_counter()
+
+    for i in range(mutations):
+        board.set_state(0, (i // 2) % width, State.FLAGGED if i % 2 == 0 else State.UNTOUCHED)
+
+    return perf_counter() - start
+
+
+def main():
+    configs = {
+        "difficulty": (1000, 1000, 150000),
+        "mutations": 100000,
+        "group_sizes": (1, 10, 100, 1000),
+        "journal_sizes": (10 ** 3, 10 ** 5),
+        "seed": 0,
+    }
+
+    board = Board.create_from_difficulty(configs["difficulty"], seed=configs["seed"])
+
+    with TemporaryDirectory() as directory:
+        journal = BoardJournal(directory, interval=3600, checkpoint_size=float("inf"))
+
+        print("%-10s %14s" % ("journal", "mutation (us)"))
+        print("%-10s %14.2f" % ("off", mutate(board, configs["mutations"]) / configs["mutations"] * 1e6))
+        journal.attach("room", board)
+        journal.flush()
+        print("%-10s %14.2f" % ("on", mutate(board, configs["mutations"]) / configs["mutations"] * 1e6))
+        journal.flush()
+        print()
+
+        print("%-12s %16s %20s" % ("mutations", "group commit (ms)", "per mutation (us)"))
+
+        for group_size in configs["group_sizes"]:
+            mutate(board, group_size)
+            start = perf_counter()
+            journal.flush()
+            elapsed = perf_counter() - start
+
+            print("%-12d %16.3f %20.2f" % (group_size, elapsed * 1e3, elapsed / group_size * 1e6))
+
+        print()
+        print("%-12s %14s" % ("journaled", "recovery (s)"))
+
+        for journal_size in configs["journal_sizes"]:
+            journal.attach("room", board)
+            journal.flush()
+            mutate(board, journal_size)
+            journal.flush()
+            start = perf_counter()
+            journal.recover()
+
+            print("%-12d %14.3f" % (journal_size, perf_counter() - start))
+
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures the throughput of board replies of several megabytes, for the text and the binary protocols, on the
+threaded and the asyncio servers. Every client pipelines a number of "look" commands, and every reply received is
+checked against the snapshot of the board, byte by byte. Run from the minesweeper package directory:
+    python -m expirements.exp_large_payloads
+"""
+from concurrent.futures import ThreadPoolExecutor
+from socket import create_connection
+from time import perf_counter
+
+from board import Board
+from expirements.exp_server_modes import start_asyncio, start_threaded
+from message import STUBoardMessage, UTSLookMessage, UTSByeMessage
+from protocol import TEXT_PROTOCOL, BINARY_PROTOCOL
+
+
+def receive_exactly(client, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+
+    while received < size:
+        chunk = client.recv_into(view[received:])
+
+        if not chunk:
+            raise ConnectionError("Connection closed after %d of %d bytes" % (received, size))
+
+        received += chunk
+
+    return buffer
+
+
+def play(port, protocol, expected, looks):
+    """
+    Sends **looks** pipelined "look" commands and checks every reply against **expected**.
+    :return: the number of bytes received.
+    """
+    with create_connection(("localhost", port)) as client:
+        # The hello message has a variable length: it is skipped up to its empty line
+        buffer = b""
+
+        while not buffer.endswith(b"\n\n"):
+            buffer += client.recv(1)
+
+        if protocol is BINARY_PROTOCOL:
+            client.sendall(b"protocol binary\n")
+            receive_exactly(client, len(b"Using the binary protocol.\n"))
+
+        client.sendall(protocol.encode(UTSLookMessage()) * looks)
+
+        for i in range(looks):
+            if receive_exactly(client, len(expected)) != expected:
+                raise AssertionError("Reply %d differs from the board" % i)
+
+        client.sendall(protocol.encode(UTSByeMessage()))
+
+    return len(expected) * looks
+
+
+def main():
+    configs = {
+        "sizes": (500, 1000, 2000),
+        "clients": 4,
+        "looks": 5,
+    }
+
+    print("%-10s %6s %8s %14s %10s" % ("server", "size", "proto", "reply (bytes)", "MB/s"))
+
+    for size in configs["sizes"]:
+        board = Board.create_from_probability(size, size, 0.2)
+
+        for name, start in (("threaded", start_threaded), ("asyncio", start_asyncio)):
+            server, port = start(board)
+
+            for protocol in (TEXT_PROTOCOL, BINARY_PROTOCOL):
+                expected = protocol.encode(STUBoardMessage(board))
+
+                with ThreadPoolExecutor(configs["clients"]) as executor:
+                    begin = perf_counter()
+                    futures = [executor.submit(play, port, protocol, expected, configs["looks"])
+                               for i in range(configs["clients"])]
+                    received = sum(future.result() for future in futures)
+                    elapsed = perf_counter() - begin
+
+                print("%-10s %6d %8s %14d %10.1f" % (name, size, protocol.NAME, len(expected),
+                                                      received / elapsed / 2 ** 20))
+
+            server.close()
+
+
+if __name__ == "__main__":
+    main()
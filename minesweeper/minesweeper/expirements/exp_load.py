@@ -0,0 +1,274 @@
+"""
+A load generator for the Minesweeper server. It starts a local server in a process of its own (or targets a running
+one with --port), and drives a number of concurrent simulated players over loopback, from a single asyncio event
+loop. Every player sends one command at a time, drawn from a weighted mix of look, dig, flag, deflag and bye, on
+random squares, and waits for its reply. A player whose game ends (bye, or a mine dug) connects again.\n
+The throughput and the latency percentiles are printed, and saved as JSON with the configuration of the run, so
+that runs can be compared over time: with --compare, the run is compared to a previous one, and the exit status is
+1 if the throughput dropped, or the p99 latency grew, by more than --tolerance. Run from the minesweeper package
+directory, e.g.:
+    python -m expirements.exp_load --mode asyncio --players 64 --duration 10 --output results.json
+    python -m expirements.exp_load --mode asyncio --players 64 --compare results.json
+"""
+import asyncio
+import json
+from argparse import ArgumentParser
+from os.path import dirname
+from platform import python_version
+from random import Random
+from signal import SIGINT
+from socket import create_connection, socket
+from statistics import quantiles
+from subprocess import Popen
+from sys import argv, executable, exit
+from time import perf_counter, sleep, strftime
+
+import server
+from message import STUBoomMessage, STUByeMessage
+
+COMMANDS = ("look", "dig", "flag", "deflag", "bye")
+REPLIES_ENDING_GAMES = (STUBoomMessage.REPR.encode(), STUByeMessage.REPR.encode())
+
+
+def parse_mix(mix):
+    """
+    :param mix: comma-separated command=weight pairs, e.g. "look=50,flag=25,deflag=25".
+    :return: a dict of the weight of every command.
+    """
+    weights = dict()
+
+    for pair in mix.split(","):
+        command, weight = pair.split("=")
+
+        if command not in COMMANDS:
+            raise ValueError("Unknown command '%s' in mix, expected one of %s" % (command, ", ".join(COMMANDS)))
+
+        weights[command] = float(weight)
+
+    return weights
+
+
+def free_port():
+    with socket() as probe:
+        probe.bind(("localhost", 0))
+
+        return probe.getsockname()[1]
+
+
+def start_server(mode, port, size, workers, journal=None):
+    """
+    Starts server.py in a new process, and waits until it accepts connections. The server is stopped by a SIGINT,
+    which every mode handles by closing its clients, and its workers in prefork mode.
+    """
+    process = Popen([executable, server.__file__, "-d", "false", "-m", mode, "-p", str(port), "-s", str(size),
+                     "-w", str(workers)] + (["--journal", journal] if journal is not None else []),
+                    cwd=dirname(server.__file__))
+
+    for i in range(100):
+        try:
+            create_connection(("localhost", port)).close()
+            return process
+        except ConnectionRefusedError:
+            sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("The server did not start listening at port %d" % port)
+
+
+async def read_reply(reader):
+    """
+    Reads a reply of the text protocol: a board ends with an empty line, any other reply is a single line.
+    :return: the first line of the reply.
+    """
+    line = await reader.readline()
+
+    if not line:
+        raise ConnectionError("Connection closed by the server")
+
+    # The first line of a board is its header of column indices
+    if line.startswith(b"  "):
+        await reader.readuntil(b"\n\n")
+
+    return line
+
+
+async def play(port, size, weights, deadline, seed, latencies):
+    """
+    Plays until **deadline**, appending the latency of every command, in seconds, to the list of **latencies**
+    of its command.
+    :return: the number of games played.
+    """
+    random = Random(seed)
+    commands, cumulative = list(weights), list()
+    total = 0
+
+    for command in commands:
+        total += weights[command]
+        cumulative.append(total)
+
+    games = 0
+
+    while perf_counter() < deadline:
+        reader, writer = await asyncio.open_connection("localhost", port)
+        games += 1
+
+        try:
+            # The hello message ends with an empty line
+            await reader.readuntil(b"\n\n")
+
+            while perf_counter() < deadline:
+                command = random.choices(commands, cum_weights=cumulative)[0]
+
+                if command in ("dig", "flag", "deflag"):
+                    line = "%s %d %d\n" % (command, random.randrange(size), random.randrange(size))
+                else:
+                    line = command + "\n"
+
+                start = perf_counter()
+                writer.write(line.encode())
+                reply = await read_reply(reader)
+                latencies[command].append(perf_counter() - start)
+
+                if reply in REPLIES_ENDING_GAMES:
+                    break
+        finally:
+            writer.close()
+
+    return games
+
+
+def summarize(latencies, elapsed):
+    """
+    :return: a dict of the throughput and the latency percentiles (in milliseconds) of every command, and of all of
+        them.
+    """
+    def statistics(values):
+        if len(values) < 2:
+            return {"requests": len(values)}
+
+        percentiles = quantiles(values, n=100)
+
+        return {
+            "requests": len(values),
+            "requests_per_second": len(values) / elapsed,
+            "p50_ms": percentiles[49] * 1000,
+            "p95_ms": percentiles[94] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+        }
+
+    summary = {command: statistics(values) for command, values in latencies.items() if values}
+    summary["all"] = statistics([latency for values in latencies.values() for latency in values])
+
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of every statistic from **baseline** to **results**.
+    :return: True if the throughput dropped, or the p99 latency grew, by more than **tolerance**, a fraction.
+    """
+    regressed = False
+    print("\n%-8s %-20s %12s %12s %8s" % ("command", "statistic", "baseline", "run", "change"))
+
+    for command, statistics in results["summary"].items():
+        for statistic, value in statistics.items():
+            previous = baseline["summary"].get(command, {}).get(statistic)
+
+            if not previous or statistic == "requests":
+                continue
+
+            change = value / previous - 1
+            worse = -change if statistic == "requests_per_second" else change
+            flag = ""
+
+            if command == "all" and statistic in ("requests_per_second", "p99_ms") and worse > tolerance:
+                regressed = True
+                flag = " REGRESSION"
+
+            print("%-8s %-20s %12.3f %12.3f %+7.1f%%%s" % (command, statistic, previous, value, change * 100, flag))
+
+    return regressed
+
+
+def main():
+    configs = {
+        "mode": "asyncio",
+        "players": 16,
+        "duration": 10,
+        "board_size": 50,
+        "workers": 2,
+        "mix": "look=40,dig=10,flag=25,deflag=24,bye=1",
+        "seed": 0,
+        "tolerance": 0.1,
+    }
+
+    ap = ArgumentParser("Minesweeper load generator")
+    ap.add_argument("-m", "--mode", choices=("threaded", "asyncio", "prefork"), default=configs["mode"],
+                    help="Mode of the server started. The threaded server serves 4 players at a time, and waits "
+                         "2 seconds for a player to leave whenever it is full: keep to 4 players for it")
+    ap.add_argument("-p", "--port", type=int, help="Port of a running server to target, instead of starting one")
+    ap.add_argument("-n", "--players", type=int, default=configs["players"], help="Number of concurrent players")
+    ap.add_argument("-t", "--duration", type=float, default=configs["duration"], help="Duration of the run, in seconds")
+    ap.add_argument("-s", "--size", type=int, default=configs["board_size"],
+                    help="Height and width of the board of the server started, or of the running server")
+    ap.add_argument("-w", "--workers", type=int, default=configs["workers"], help="Workers of a prefork server")
+    ap.add_argument("--journal", help="Directory of the journal of the server started, if any")
+    ap.add_argument("--mix", default=configs["mix"], help="Weights of the commands sent, as command=weight pairs")
+    ap.add_argument("--seed", type=int, default=configs["seed"], help="Seed of the commands of the players")
+    ap.add_argument("-o", "--output", help="Path of a JSON file to save the results to")
+    ap.add_argument("--compare", help="Path of the JSON results of a previous run to compare this run to")
+    ap.add_argument("--tolerance", type=float, default=configs["tolerance"],
+                    help="Fraction by which the throughput may drop, or the p99 latency grow, before --compare fails")
+    arguments = ap.parse_args(argv[1:])
+
+    weights = parse_mix(arguments.mix)
+    port, process = arguments.port, None
+
+    if port is None:
+        port = free_port()
+        process = start_server(arguments.mode, port, arguments.size, arguments.workers, arguments.journal)
+
+    try:
+        latencies = {command: list() for command in weights}
+        deadline = perf_counter() + arguments.duration
+
+        async def run():
+            return await asyncio.gather(*(play(port, arguments.size, weights, deadline,
+                                               arguments.seed + i, latencies) for i in range(arguments.players)))
+
+        start = perf_counter()
+        games = sum(asyncio.run(run()))
+        elapsed = perf_counter() - start
+    finally:
+        if process is not None:
+            process.send_signal(SIGINT)
+            process.wait()
+
+    results = {
+        "date": strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": python_version(),
+        "config": dict(vars(arguments), mix=weights, output=None, compare=None),
+        "elapsed": elapsed,
+        "games": games,
+        "summary": summarize(latencies, elapsed),
+    }
+
+    print("%-8s %10s %12s %10s %10s %10s" % ("command", "requests", "requests/s", "p50 (ms)", "p95 (ms)", "p99 (ms)"))
+
+    for command, statistics in results["summary"].items():
+        print("%-8s %10d %12.0f %10.3f %10.3f %10.3f" %
+              (command, statistics["requests"], statistics.get("requests_per_second", 0),
+               statistics.get("p50_ms", 0), statistics.get("p95_ms", 0), statistics.get("p99_ms", 0)))
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as file:
+            if compare(results, json.load(file), arguments.tolerance):
+                exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures how players flagging squares are slowed down by a concurrent flood-fill, on a board with a single lock and
+on boards with lock striping. The board is split by a wall of mines: one player digs the empty upper half, while a
+number of other players flag and deflag squares in the lower half. Run from the minesweeper package directory:
+    python -m expirements.exp_lock_striping
+"""
+from threading import Thread, Event
+from time import perf_counter, sleep
+
+from board import Board, State
+
+
+def flag(board, row, stop, latencies, think_time):
+    """
+    Flags and deflags the squares of **row** until **stop** is set, appending the latency of every call. Players
+    wait **think_time** seconds between two calls: without it, Python locks being unfair, a few threads calling
+    set_state in a loop can starve the digger of the board lock indefinitely.
+    """
+    col = 0
+
+    while not stop.is_set():
+        for state in (State.FLAGGED, State.UNTOUCHED):
+            start = perf_counter()
+            board.set_state(row, col, state)
+            latencies.append(perf_counter() - start)
+            sleep(think_time)
+
+        col = (col + 1) % board.width()
+
+
+def run(tile_size, flaggers, configs):
+    """
+    :return: a (dig seconds, flags per second, max flag latency) tuple.
+    """
+    height, width = configs["height"], configs["width"]
+    grid = [[row == height // 2 for col in range(width)] for row in range(height)]
+    board = Board(grid, tile_size)
+    stop = Event()
+    latencies = [list() for i in range(flaggers)]
+    threads = [Thread(target=flag, args=(board, height - 1 - i, stop, latencies[i], configs["think_time"]))
+               for i in range(flaggers)]
+
+    for thread in threads:
+        thread.start()
+
+    start = perf_counter()
+    board.set_state(0, 0, State.DUG)
+    elapsed = perf_counter() - start
+    stop.set()
+
+    for thread in threads:
+        thread.join()
+
+    flags = sum(len(l) for l in latencies)
+
+    return elapsed, flags / elapsed, max(max(l) for l in latencies)
+
+
+def main():
+    configs = {
+        "height": 1000,
+        "width": 1000,
+        "tile_sizes": (None, 250, 50),
+        "flaggers": (1, 4, 16),
+        "think_time": 0.001,
+    }
+
+    print("%-10s %9s %10s %12s %18s" % ("tile size", "flaggers", "dig (s)", "flags/s", "max flag wait (ms)"))
+
+    for tile_size in configs["tile_sizes"]:
+        for flaggers in configs["flaggers"]:
+            elapsed, throughput, max_latency = run(tile_size, flaggers, configs)
+
+            print("%-10s %9d %10.3f %12.0f %18.1f" %
+                  (tile_size or "-", flaggers, elapsed, throughput, max_latency * 1000))
+
+
+if __name__ == "__main__":
+    main()
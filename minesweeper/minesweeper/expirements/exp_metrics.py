@@ -0,0 +1,49 @@
+"""
+Measures the overhead of the metrics of a server: the cost of a single update of a counter and of a histogram, and
+the throughput of "look" commands on the threaded and the asyncio servers, with the metrics updated and with every
+update replaced by a no-op (the clock is still read). Run from the minesweeper package directory:
+    python -m expirements.exp_metrics
+"""
+from timeit import timeit
+
+from board import Board
+from expirements.exp_server_modes import run_clients, start_asyncio, start_threaded
+from metrics import Counter, Histogram, MetricsRegistry
+
+
+def main():
+    configs = {
+        "board_size": 50,
+        "clients": 4,
+        "messages": 2000,
+        "updates": 10 ** 6,
+    }
+
+    registry = MetricsRegistry()
+    counter = registry.counter("exp_events", "Events")
+    histogram = registry.histogram("exp_seconds", "Durations")
+
+    print("%-20s %10s" % ("update", "ns"))
+    print("%-20s %10.1f" % ("Counter.inc", timeit(counter.inc, number=configs["updates"]) / configs["updates"] * 1e9))
+    print("%-20s %10.1f" % ("Histogram.observe", timeit(lambda: histogram.observe(3e-5), number=configs["updates"]) /
+                            configs["updates"] * 1e9))
+    print()
+
+    print("%-10s %8s %12s" % ("server", "metrics", "requests/s"))
+    inc, observe = Counter.inc, Histogram.observe
+
+    for name, start in (("threaded", start_threaded), ("asyncio", start_asyncio)):
+        for enabled in (True, False):
+            Counter.inc, Histogram.observe = (inc, observe) if enabled else (lambda *args: None,) * 2
+            board = Board.create_from_probability(configs["board_size"], configs["board_size"], 0.2)
+            server, port = start(board)
+            throughput, latencies = run_clients(port, configs["clients"], configs["messages"])
+            server.close()
+
+            print("%-10s %8s %12.0f" % (name, "on" if enabled else "off", throughput))
+
+    Counter.inc, Histogram.observe = inc, observe
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measures the time taken by UTSMessage.parse_infer_type to parse every kind of message, against the former parser,
+which tried every class of UTSMessage.message_types in turn and rejected the ones not matching by catching the
+exceptions they raised. Run from the minesweeper package directory:
+    python -m expirements.exp_parsing
+"""
+from timeit import timeit
+
+from message import *
+
+
+def legacy_factory(factory_string):
+    """
+    The former factory methods of the classes in UTSMessage.message_types, in the same order: each returns a message
+    or raises an exception.
+    """
+
+    def look(s):
+        if s.endswith("look", 0):
+            return UTSLookMessage()
+        raise ValueError(s)
+
+    def look_since(s):
+        components = s.split(" ")
+        version = int(components[2])
+
+        if "look since" != " ".join(components[:2]) or len(components) != 3 or version < 0:
+            raise ValueError(s)
+        return UTSLookSinceMessage(version)
+
+    def coordinates(prefix, message_class):
+        def factory(s):
+            components = s.split(" ")
+            x, y = int(components[1]), int(components[2])
+
+            if prefix != components[0]:
+                raise ValueError(s)
+            return message_class(x, y)
+
+        return factory
+
+    def word(prefix, message_class):
+        def factory(s):
+            components = s.split(" ")
+
+            if prefix != components[0] or len(components) != 2:
+                raise ValueError(s)
+            return message_class(components[1])
+
+        return factory
+
+    def help_request(s):
+        if "help" == s:
+            return UTSHelpRequestMessage()
+
+    def bye(s):
+        if "bye" == s or s == "-1":
+            return UTSByeMessage()
+        raise ValueError(s)
+
+    return (look, look_since, coordinates("dig", UTSDigMessage), coordinates("flag", UTSFlagMessage),
+            coordinates("deflag", UTSDeflagMessage), word("join", UTSJoinMessage),
+            word("protocol", UTSProtocolMessage), help_request, bye)
+
+
+LEGACY_FACTORIES = legacy_factory("")
+
+
+def legacy_parse_infer_type(raw_input):
+    result = None
+
+    for factory in LEGACY_FACTORIES:
+        try:
+            result = factory(raw_input.strip())
+
+            if result is not None:
+                break
+        except Exception:
+            continue
+
+    if result is None:
+        result = UTSInvalidMessage(raw_input.strip())
+
+    return result
+
+
+def main():
+    configs = {
+        "inputs": ("look\n", "look since 1024\n", "dig 12 34\n", "flag 12 34\n", "deflag 12 34\n", "join room-1\n",
+                   "help\n", "bye\n", "invalid input\n"),
+        "number": 100000,
+    }
+
+    print("%-18s %14s %14s %8s" % ("message", "legacy (us)", "registry (us)", "speedup"))
+
+    for raw_input in configs["inputs"]:
+        assert type(legacy_parse_infer_type(raw_input)) is type(UTSMessage.parse_infer_type(raw_input))
+
+        legacy = timeit(lambda: legacy_parse_infer_type(raw_input), number=configs["number"])
+        registry = timeit(lambda: UTSMessage.parse_infer_type(raw_input), number=configs["number"])
+
+        print("%-18s %14.3f %14.3f %7.1fx" % (raw_input.strip(), legacy / configs["number"] * 1e6,
+                                              registry / configs["number"] * 1e6, legacy / registry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures the time a bot takes to play a turn of a number of moves (flag and deflag), when it waits for the reply to
+every move before sending the next one, when it sends all the moves of the turn at once (pipelining), and when it
+does so with collapse on, receiving a single board per turn. Run from the minesweeper package directory:
+    python -m expirements.exp_pipelining
+"""
+from socket import create_connection
+from time import perf_counter
+
+from board import Board
+from expirements.exp_server_modes import start_asyncio, start_threaded, REPLY_END
+
+
+def read_replies(client, buffer, count):
+    """
+    Reads **count** replies ending with an empty line, i.e. boards, from **client**.
+    """
+    buffer = bytearray(buffer)
+    offset = 0
+
+    # Replies are searched for once each, from the end of the previous one
+    for i in range(count):
+        end = buffer.find(REPLY_END, offset)
+
+        while end < 0:
+            searched = len(buffer)
+            buffer += client.recv(65536)
+            end = buffer.find(REPLY_END, max(offset, searched - len(REPLY_END) + 1))
+
+        offset = end + len(REPLY_END)
+
+    return bytes(buffer[offset:])
+
+
+def play(port, moves, turns, mode):
+    """
+    :return: the mean duration of a turn, in seconds.
+    """
+    with create_connection(("localhost", port)) as client:
+        buffer = read_replies(client, b"", 1)
+
+        if mode == "collapse":
+            client.sendall(b"collapse on\n")
+
+            while b"\n" not in buffer:
+                buffer += client.recv(65536)
+
+            buffer = buffer[buffer.index(b"\n") + 1:]
+
+        commands = [("%s 0 %d\n" % ("flag" if turn % 2 == 0 else "deflag", i)).encode() for turn in range(2)
+                    for i in range(moves)]
+        start = perf_counter()
+
+        for turn in range(turns):
+            turn_commands = commands[(turn % 2) * moves:(turn % 2 + 1) * moves]
+
+            if mode == "sequential":
+                for command in turn_commands:
+                    client.sendall(command)
+                    buffer = read_replies(client, buffer, 1)
+            else:
+                client.sendall(b"".join(turn_commands))
+                buffer = read_replies(client, buffer, 1 if mode == "collapse" else moves)
+
+        elapsed = perf_counter() - start
+        client.sendall(b"bye\n")
+
+    return elapsed / turns
+
+
+def main():
+    configs = {
+        "board_size": 100,
+        "moves": (1, 10, 50),
+        "turns": 50,
+        "modes": ("sequential", "pipelined", "collapse"),
+    }
+
+    print("%-10s %6s %12s %12s" % ("server", "moves", "mode", "turn (ms)"))
+
+    for name, start in (("threaded", start_threaded), ("asyncio", start_asyncio)):
+        board = Board.create_from_probability(configs["board_size"], configs["board_size"], 0.2)
+        server, port = start(board)
+
+        for moves in configs["moves"]:
+            for mode in configs["modes"]:
+                turn = play(port, moves, configs["turns"], mode)
+
+                print("%-10s %6d %12s %12.3f" % (name, moves, mode, turn * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Measures how the prefork server scales with its number of workers: a prefork server is started with 1, 2, 4...
+workers, up to the number of CPUs, and loaded by players run by a pool of client processes, every one of them
+sending "look", "flag" and "deflag" commands one at a time. Every player joins a room of its own first, since rooms
+are partitioned among workers, and every client starts in the default room, hosted by a single worker: the players
+are handed off to the workers hosting their rooms. The client processes compete with the workers for the CPUs, so
+the throughput only grows with the number of workers while CPUs are left idle. Run from the minesweeper package
+directory:
+    python -m expirements.exp_prefork
+"""
+import asyncio
+from multiprocessing import get_context
+from os import cpu_count
+from random import Random
+from signal import SIGINT
+from time import perf_counter
+
+from expirements.exp_load import free_port, read_reply, start_server
+
+COMMANDS = ("look", "flag", "deflag")
+
+
+async def play(port, room, size, deadline, seed):
+    """
+    Joins **room** and plays until **deadline**.
+    :return: the number of commands replied to.
+    """
+    random = Random(seed)
+    reader, writer = await asyncio.open_connection("localhost", port)
+    replies = 0
+
+    try:
+        # The hello message ends with an empty line
+        await reader.readuntil(b"\n\n")
+        writer.write(b"join %s\n" % room.encode())
+        await reader.readline()
+
+        while perf_counter() < deadline:
+            command = random.choice(COMMANDS)
+
+            if command == "look":
+                line = "look\n"
+            else:
+                line = "%s %d %d\n" % (command, random.randrange(size), random.randrange(size))
+
+            writer.write(line.encode())
+            await read_reply(reader)
+            replies += 1
+    finally:
+        writer.close()
+
+    return replies
+
+
+def run_players(port, client, players, size, duration):
+    """
+    Runs the **players** players of the client process **client**, each in a room of its own.
+    :return: the number of commands replied to.
+    """
+    deadline = perf_counter() + duration
+
+    async def run():
+        return await asyncio.gather(*(play(port, "room-%d-%d" % (client, i), size, deadline, client * players + i)
+                                      for i in range(players)))
+
+    return sum(asyncio.run(run()))
+
+
+def main():
+    configs = {
+        "workers": tuple(2 ** i for i in range(cpu_count().bit_length()) if 2 ** i <= cpu_count()),
+        "clients": max(cpu_count() // 2, 1),
+        "players": 16,
+        "duration": 5,
+        "board_size": 50,
+    }
+
+    print("%-8s %8s %12s" % ("workers", "players", "requests/s"))
+
+    with get_context("spawn").Pool(configs["clients"]) as pool:
+        for workers in configs["workers"]:
+            port = free_port()
+            process = start_server("prefork", port, configs["board_size"], workers)
+            clients = [(port, client, configs["players"], configs["board_size"], configs["duration"])
+                       for client in range(configs["clients"])]
+
+            try:
+                start = perf_counter()
+                replies = sum(pool.starmap(run_players, clients))
+                elapsed = perf_counter() - start
+            finally:
+                process.send_signal(SIGINT)
+                process.wait()
+
+            print("%-8d %8d %12.0f" % (workers, configs["clients"] * configs["players"], replies / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares the text and the binary protocols on board replies, the largest messages sent by a server: bytes on the wire,
+time to encode a board on the server, and time to decode it into one square per item on the client. Encoding is
+measured on fresh snapshots, as after a mutation: snapshots cache their text and their packed squares. Run from the
+minesweeper package directory:
+    python -m expirements.exp_protocol
+"""
+from io import BytesIO
+from timeit import timeit
+
+from board import Board, BoardSnapshot, State
+from message import STUBoardMessage
+from protocol import TEXT_PROTOCOL, BINARY_PROTOCOL, BinaryProtocol
+from utils import digits
+
+
+def fresh_message(board):
+    message = STUBoardMessage(board)
+    snapshot = message.snapshot
+    message.snapshot = BoardSnapshot(snapshot.version, snapshot.width, snapshot._header, snapshot._rows)
+
+    return message
+
+
+def decode_text(data, height):
+    """
+    :return: the text of every square of the board in **data**, as a client of the text protocol would parse it.
+    """
+    rows = data.decode().split("\n")[-height - 2:-2]
+    padding = digits(height - 1) + 1
+
+    return "".join(row[padding:-1:2] for row in rows)
+
+
+def decode_binary(data):
+    reply, payload = BINARY_PROTOCOL.read_reply(BytesIO(data))
+
+    return BinaryProtocol.decode_board(payload)[3]
+
+
+def main():
+    configs = {
+        "sizes": (10, 50, 200, 1000),
+        "repeat": 20,
+    }
+
+    print("%-6s %-7s %12s %14s %14s" % ("size", "proto", "bytes", "encode (ms)", "decode (ms)"))
+
+    for size in configs["sizes"]:
+        board = Board.create_from_probability(size, size, 0.15)
+
+        # Dig a few squares, so that the board shows every kind of square
+        for i in range(0, size, max(1, size // 10)):
+            board.set_state(i, i, State.DUG)
+            board.set_state(i, size - 1 - i, State.FLAGGED)
+
+        for protocol, decode in ((TEXT_PROTOCOL, lambda data: decode_text(data, size)),
+                                 (BINARY_PROTOCOL, decode_binary)):
+            data = protocol.encode(fresh_message(board))
+            encode_time = timeit(lambda: protocol.encode(fresh_message(board)), number=configs["repeat"])
+            decode_time = timeit(lambda: decode(data), number=configs["repeat"])
+
+            print("%-6d %-7s %12d %14.3f %14.3f" % (size, protocol.NAME, len(data),
+                                                      encode_time / configs["repeat"] * 1000,
+                                                      decode_time / configs["repeat"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
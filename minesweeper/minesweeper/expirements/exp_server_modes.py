@@ -0,0 +1,116 @@
+"""
+Compares the throughput and the latency of the threaded MineSweeperServer against the AsyncMineSweeperServer, by
+connecting a number of clients which send "look" messages as fast as they can. The threaded server accepts at most
+MineSweeperServer.DEFAULT_CONFIGS["max_clients"] clients. Clients run as threads of the same process as the servers,
+so absolute figures are lower than over a real network. Run from the minesweeper package directory:
+    python -m expirements.exp_server_modes
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from socket import create_connection
+from statistics import quantiles
+from threading import Thread, Barrier
+from time import perf_counter
+
+from board import Board
+from server import MineSweeperServer, AsyncMineSweeperServer
+
+# Every reply to a "look" message, as well as the hello message, ends with an empty line
+REPLY_END = b"\n\n"
+
+
+def read_reply(client, buffer):
+    while REPLY_END not in buffer:
+        buffer += client.recv(65536)
+
+    return buffer[buffer.index(REPLY_END) + len(REPLY_END):]
+
+
+def play(port, messages, barrier):
+    """
+    Connects to the server at **port**, sends **messages** "look" messages one at a time and returns the latency
+    of every one of them.
+    """
+    latencies = list()
+
+    with create_connection(("localhost", port)) as client:
+        buffer = read_reply(client, b"")
+        barrier.wait()
+
+        for i in range(messages):
+            start = perf_counter()
+            client.sendall(b"look\n")
+            buffer = read_reply(client, buffer)
+            latencies.append(perf_counter() - start)
+
+        client.sendall(b"bye\n")
+
+    return latencies
+
+
+def run_clients(port, clients, messages):
+    """
+    :return: a (requests per second, latencies) tuple, measured over **clients** concurrent clients.
+    """
+    barrier = Barrier(clients + 1)
+
+    with ThreadPoolExecutor(clients) as executor:
+        futures = [executor.submit(play, port, messages, barrier) for i in range(clients)]
+        barrier.wait()
+        start = perf_counter()
+        latencies = [latency for future in futures for latency in future.result()]
+        elapsed = perf_counter() - start
+
+    return len(latencies) / elapsed, latencies
+
+
+def start_threaded(board):
+    server = MineSweeperServer(board, 0)
+
+    def accept_forever():
+        while not server.is_closed:
+            try:
+                if server.is_full():
+                    wait(server.futures(), None, FIRST_COMPLETED)
+                else:
+                    server.next_connection()
+            except OSError:
+                break
+
+    Thread(target=accept_forever, daemon=True).start()
+
+    return server, server._server.getsockname()[1]
+
+
+def start_asyncio(board):
+    server = AsyncMineSweeperServer(board, 0)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    Thread(target=loop.run_forever, daemon=True).start()
+
+    return server, server.port()
+
+
+def main():
+    configs = {
+        "board_size": 50,
+        "messages": 200,
+        "modes": (("threaded", start_threaded, (4,)), ("asyncio", start_asyncio, (4, 64, 256))),
+    }
+    board = Board.create_from_probability(configs["board_size"], configs["board_size"], 0.2)
+
+    print("%-10s %8s %12s %10s %10s" % ("mode", "clients", "requests/s", "p50 (ms)", "p99 (ms)"))
+
+    for name, start, clients_counts in configs["modes"]:
+        server, port = start(board)
+
+        for clients in clients_counts:
+            throughput, latencies = run_clients(port, clients, configs["messages"])
+            percentiles = quantiles(latencies, n=100)
+
+            print("%-10s %8d %12.0f %10.3f %10.3f" %
+                  (name, clients, throughput, percentiles[49] * 1000, percentiles[98] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures the time of the "hint" command on boards of increasing size, with 15% of mines: a game is played by digging
+the squares hinted, a mine dug being cleared as the servers do, and the hints are answered either by a BoardSolver kept
+up to date from the change log of the board, or by a new BoardSolver rebuilding its view from the whole board, as a
+solver parsing the replies of the server would. The rebuilding solver only plays the first moves of the largest games.
+Run from the minesweeper package directory:
+    python -m expirements.exp_solver
+"""
+from time import perf_counter
+
+from board import Board, State
+from solver import BoardSolver
+
+
+def play(board, moves, hint):
+    """
+    Plays **moves** moves on **board**, digging the square returned by **hint**.
+    :return: the sorted list of the seconds spent by every hint.
+    """
+    times = list()
+
+    for i in range(moves):
+        start = perf_counter()
+        square = hint()
+        times.append(perf_counter() - start)
+
+        if square is None:
+            break
+
+        row, col, probability = square
+        board.set_state(row, col, State.DUG)
+
+        if board.square(row, col).has_bomb:
+            board.square(row, col).has_bomb = False
+
+    return sorted(times)
+
+
+def main():
+    configs = {
+        "sizes": (16, 100, 1000, 2000),
+        "density": 0.15,
+        "moves": 500,
+        # The number of moves played with a rebuilding solver on boards larger than rebuild_size
+        "rebuild_moves": 5,
+        "rebuild_size": 100,
+        "seed": 0,
+    }
+
+    print("%-8s %-12s %8s %12s %12s %12s" % ("size", "solver", "moves", "first (ms)", "median (ms)", "max (ms)"))
+
+    for size in configs["sizes"]:
+        difficulty = (size, size, int(size * size * configs["density"]))
+
+        for name in ("incremental", "rebuild"):
+            board = Board.create_from_difficulty(difficulty, seed=configs["seed"], safe=(size // 2, size // 2))
+            board.set_state(size // 2, size // 2, State.DUG)
+
+            if name == "incremental":
+                hint = BoardSolver(board).hint
+                moves = configs["moves"]
+            else:
+                def hint():
+                    return BoardSolver(board).hint()
+
+                moves = configs["moves"] if size <= configs["rebuild_size"] else configs["rebuild_moves"]
+
+            start = perf_counter()
+            first = hint()
+            first_time = perf_counter() - start
+            times = play(board, moves, hint) if first is not None else [0]
+
+            print("%-8d %-12s %8d %12.3f %12.3f %12.3f" % (size, name, len(times), first_time * 1e3,
+                                                           times[len(times) // 2] * 1e3, times[-1] * 1e3))
+
+
+if __name__ == "__main__":
+    main()
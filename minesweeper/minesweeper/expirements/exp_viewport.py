@@ -0,0 +1,51 @@
+"""
+Compares the time of the reply to "look" on boards of increasing size, with the whole board and with an 80 x 40
+viewport, in the text and the binary protocol. Every reply is rendered from a new snapshot, after a square was
+flagged, as a client would receive after each of its commands. Run from the minesweeper package directory:
+    python -m expirements.exp_viewport
+"""
+from time import perf_counter
+
+from board import Board, State
+from message import STUBoardMessage
+from protocol import BINARY_PROTOCOL, TEXT_PROTOCOL
+
+
+def measure(board, protocol, viewport, repetitions):
+    """
+    :return: the mean seconds spent rendering the reply to "look" after a mutation of **board**.
+    """
+    elapsed = 0
+
+    for i in range(repetitions):
+        board.set_state(0, 0, State.FLAGGED if i % 2 == 0 else State.UNTOUCHED)
+        start = perf_counter()
+        protocol.segments(STUBoardMessage(board, viewport))
+        elapsed += perf_counter() - start
+
+    return elapsed / repetitions
+
+
+def main():
+    configs = {
+        "sizes": (100, 1000, 4000),
+        "viewport": (10, 10, 40, 80),
+        "density": 0.15,
+        "repetitions": 20,
+        "seed": 0,
+    }
+
+    print("%-8s %-10s %14s %16s" % ("size", "protocol", "board (ms)", "viewport (ms)"))
+
+    for size in configs["sizes"]:
+        board = Board.create_from_difficulty((size, size, int(size * size * configs["density"])), seed=configs["seed"])
+
+        for protocol in (TEXT_PROTOCOL, BINARY_PROTOCOL):
+            whole = measure(board, protocol, None, configs["repetitions"])
+            region = measure(board, protocol, configs["viewport"], configs["repetitions"])
+
+            print("%-8d %-10s %14.3f %16.3f" % (size, protocol.NAME, whole * 1e3, region * 1e3))
+
+
+if __name__ == "__main__":
+    main()
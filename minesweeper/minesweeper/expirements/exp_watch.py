@@ -0,0 +1,101 @@
+"""
+Measures how fast the changes made by a player reach the other players of a room, when they watch the board (watch
+on, updates pushed by the server) and when they poll it with "look since" commands, for an increasing number of
+watchers. The player makes a number of moves, one at a time, and every watcher reads updates until it saw the last
+one. Watchers use the binary protocol. Run from the minesweeper package directory:
+    python -m expirements.exp_watch
+"""
+from concurrent.futures import ThreadPoolExecutor
+from socket import create_connection
+from threading import Barrier
+from time import perf_counter
+
+from board import Board
+from expirements.exp_pipelining import read_replies
+from expirements.exp_server_modes import start_asyncio, start_threaded
+from message import UTSWatchMessage, UTSLookSinceMessage, UTSByeMessage
+from protocol import BINARY_PROTOCOL, BinaryProtocol
+
+
+def version_of(reply, payload):
+    if reply == BinaryProtocol.REPLY_BOARD:
+        return BinaryProtocol.decode_board(payload)[0]
+
+    return BinaryProtocol.decode_delta(payload)[0]
+
+
+def watch(port, mode, target, barrier):
+    """
+    Reads updates until the board reaches the version **target**.
+    :return: the number of updates received.
+    """
+    with create_connection(("localhost", port)) as client, client.makefile("rb") as stream:
+        read_replies(client, b"", 1)
+        client.sendall(b"protocol binary\n")
+        stream.readline()
+
+        if mode == "watch":
+            client.sendall(BINARY_PROTOCOL.encode(UTSWatchMessage(True)))
+            BINARY_PROTOCOL.read_reply(stream)
+
+        barrier.wait()
+        version, updates = -1, 0
+
+        while version < target:
+            if mode == "poll":
+                client.sendall(BINARY_PROTOCOL.encode(UTSLookSinceMessage(max(version, 0))))
+
+            version = version_of(*BINARY_PROTOCOL.read_reply(stream))
+            updates += 1
+
+        client.sendall(BINARY_PROTOCOL.encode(UTSByeMessage()))
+
+    return updates
+
+
+def play(port, moves, barrier):
+    with create_connection(("localhost", port)) as client:
+        buffer = read_replies(client, b"", 1)
+        barrier.wait()
+
+        for i in range(moves):
+            client.sendall(("%s 0 0\n" % ("flag" if i % 2 == 0 else "deflag")).encode())
+            buffer = read_replies(client, buffer, 1)
+
+        client.sendall(b"bye\n")
+
+
+def main():
+    configs = {
+        "board_size": 100,
+        "moves": 200,
+        "modes": ("poll", "watch"),
+        # The threaded server serves 4 clients at most, the player included
+        "servers": (("threaded", start_threaded, (1, 3)), ("asyncio", start_asyncio, (1, 10, 50))),
+    }
+
+    print("%-10s %9s %6s %12s %16s" % ("server", "watchers", "mode", "total (ms)", "updates/watcher"))
+
+    for name, start, watchers_counts in configs["servers"]:
+        for watchers in watchers_counts:
+            for mode in configs["modes"]:
+                board = Board.create_from_probability(configs["board_size"], configs["board_size"], 0.2)
+                server, port = start(board)
+                target = board.version() + configs["moves"]
+                barrier = Barrier(watchers + 2)
+
+                with ThreadPoolExecutor(watchers + 1) as executor:
+                    futures = [executor.submit(watch, port, mode, target, barrier) for i in range(watchers)]
+                    executor.submit(play, port, configs["moves"], barrier)
+                    barrier.wait()
+                    begin = perf_counter()
+                    updates = sum(future.result() for future in futures)
+                    elapsed = perf_counter() - begin
+
+                server.close()
+
+                print("%-10s %9d %6s %12.1f %16.1f" % (name, watchers, mode, elapsed * 1000, updates / watchers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Crash recovery for the boards of a server. Every mutation of a board is appended to a journal, and every board is
+saved from time to time as a compact snapshot: a restarted server rebuilds the boards by loading their last snapshot
+and replaying the tail of their journal.
+"""
+from os import O_RDONLY, close as close_fd, fsync, listdir, makedirs, open as open_fd, remove, replace
+from os.path import exists, join
+from struct import Struct
+from threading import Event, Lock, Thread
+from time import perf_counter
+from zlib import crc32
+
+from board import Board
+from metrics import METRICS
+
+_FLUSH_SECONDS = METRICS.histogram("minesweeper_journal_flush_seconds",
+                                   "Time spent writing and syncing the journals of the boards, once per group commit")
+_JOURNAL_BYTES = METRICS.counter("minesweeper_journal_bytes", "Bytes appended to the journals of the boards")
+_CHECKPOINTS = METRICS.counter("minesweeper_journal_checkpoints", "Snapshots of boards written by the journal")
+
+
+class BoardJournal:
+    """
+    The journals and the snapshots of the boards of the rooms of a server, kept in a directory: <room id>.board is
+    the last snapshot of the board of a room, in the packed format of Board.save, and <room id>.journal holds the
+    changes of the board since then, as a sequence of records. A record is its length and its CRC-32, then the
+    changes, as passed to the journal of the board: a torn record, left at the end of a journal by a crash, is
+    ignored.\n
+    Group commit: boards append their changes to a list in memory, and a background thread writes them every
+    **interval** seconds, as a single record per board, with a single fsync per journal. Commands therefore never
+    wait for the disk, and a crash loses the changes of the last **interval** seconds at most.\n
+    Checkpoints: once the journal of a board grows beyond **checkpoint_size** bytes, the background thread writes a
+    snapshot of the board to a temporary file, moves the journal aside, replaces the snapshot with the temporary
+    file, then removes the journal moved aside. On recovery, a journal moved aside is moved back if the temporary
+    file is still there, and removed otherwise: the records of a journal are never replayed over a snapshot taken
+    after them, which may hold later changes of their squares. The changes made while the snapshot is taken may be
+    in both the snapshot and the next journal: replaying them again is harmless, since every change holds the whole
+    content of its square, and the journal holds the later changes of the square too.\n
+    Thread safety: the pending changes are only accessed under the lock of the BoardJournal, which is never held
+    while acquiring another lock, so that boards can append to it while holding their own locks. The files are
+    only accessed by the thread flushing the journal, under the flush lock.
+    """
+
+    DEFAULT_INTERVAL = 0.05
+    DEFAULT_CHECKPOINT_SIZE = 2 ** 20
+    SNAPSHOT_EXTENSION = ".board"
+    JOURNAL_EXTENSION = ".journal"
+    TEMPORARY_EXTENSION = ".tmp"
+    ASIDE_EXTENSION = ".old"
+    _RECORD_HEADER = Struct("<II")
+
+    def __init__(self, directory, interval=DEFAULT_INTERVAL, checkpoint_size=DEFAULT_CHECKPOINT_SIZE, tile_size=None):
+        """
+        :param tile_size: the tile size of the boards recovered, as in Board.
+        """
+        self.directory = directory
+        self.interval = interval
+        self.checkpoint_size = checkpoint_size
+        self.tile_size = tile_size
+
+        makedirs(directory, exist_ok=True)
+
+        self._lock = Lock()
+        # The operations not flushed yet, in order: (room id, board, changes) tuples, where changes is None for a
+        # board to snapshot, and board and changes are None for a room removed
+        self._pending = list()
+        self._stopped = Event()
+        self._thread = None
+        self._flush_lock = Lock()
+        # The boards journaled, and the open journal files, by room id
+        self._boards = dict()
+        self._files = dict()
+
+    def __repr__(self):
+        with self._lock:
+            return "<'%s.%s' object, directory=%s, pending=%d>" % \
+                   (self.__class__.__module__, self.__class__.__name__, self.directory, len(self._pending))
+
+    def recover(self):
+        """
+        Rebuilds the board of every room found in the directory, from its snapshot and its journal, once the
+        checkpoints interrupted by a crash are rolled back or completed.
+        :return: a dict of the boards rebuilt, by room id.
+        """
+        boards = dict()
+        aside = self.JOURNAL_EXTENSION + self.ASIDE_EXTENSION
+
+        for name in listdir(self.directory):
+            if name.endswith(aside):
+                self._recover_checkpoint(name[:-len(aside)])
+
+        for name in listdir(self.directory):
+            if not name.endswith(self.SNAPSHOT_EXTENSION):
+                continue
+
+            room_id = name[:-len(self.SNAPSHOT_EXTENSION)]
+            board = Board.create_from_file(join(self.directory, name), self.tile_size)
+            changes = self._read_journal(self._journal_path(room_id))
+
+            if changes:
+                board.replay(changes)
+
+            boards[room_id] = board
+
+        return boards
+
+    def attach(self, room_id, board):
+        """
+        Starts journaling **board**, the board of the room **room_id**. A snapshot of the board is written first,
+        replacing the snapshot and the journal of any previous board of the room. The locks of **board** are not
+        acquired: the changes made before the snapshot is taken are in the snapshot.
+        """
+        def append(changes):
+            with self._lock:
+                self._pending.append((room_id, board, changes))
+
+        board.journal = append
+
+        with self._lock:
+            self._pending.append((room_id, board, None))
+
+    def detach(self, room_id, board):
+        """
+        Stops journaling **board**, and removes the snapshot and the journal of the room **room_id**.
+        """
+        board.journal = None
+
+        with self._lock:
+            self._pending.append((room_id, None, None))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._flush_forever, name=repr(self), daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """
+        Stops the background thread, and flushes the changes still pending.
+        """
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.flush()
+
+        with self._flush_lock:
+            for file in self._files.values():
+                file.close()
+
+            self._files.clear()
+
+    def flush(self):
+        """
+        Writes and syncs the changes pending, then takes the snapshots due.
+        """
+        with self._flush_lock:
+            start = perf_counter()
+
+            with self._lock:
+                pending, self._pending = self._pending, list()
+
+            records, snapshots = dict(), set()
+
+            for room_id, board, changes in pending:
+                if changes is not None:
+                    records.setdefault(room_id, list()).append(changes)
+                    continue
+
+                # The snapshot of a board attached includes the changes pending, taken before it
+                records.pop(room_id, None)
+
+                if board is None:
+                    snapshots.discard(room_id)
+                    self._remove(room_id)
+                else:
+                    self._boards[room_id] = board
+                    snapshots.add(room_id)
+
+            for room_id, changes in records.items():
+                changes = b"".join(changes)
+                file = self._file(room_id)
+                file.write(self._RECORD_HEADER.pack(len(changes), crc32(changes)) + changes)
+                file.flush()
+                fsync(file.fileno())
+                _JOURNAL_BYTES.inc(self._RECORD_HEADER.size + len(changes))
+
+                if file.tell() > self.checkpoint_size:
+                    snapshots.add(room_id)
+
+            for room_id in snapshots:
+                self._checkpoint(room_id)
+
+            if records or snapshots:
+                _FLUSH_SECONDS.observe(perf_counter() - start)
+
+    def _flush_forever(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def _checkpoint(self, room_id):
+        """
+        Replaces the snapshot of the room **room_id** with the current board, then empties its journal. Every step
+        is synced before the next one, so that _recover_checkpoint can tell how far a crash left the checkpoint.
+        """
+        path, journal_path = self._snapshot_path(room_id), self._journal_path(room_id)
+        temporary, aside = path + self.TEMPORARY_EXTENSION, journal_path + self.ASIDE_EXTENSION
+
+        with open(temporary, "wb") as file:
+            file.write(self._boards[room_id].to_bytes())
+            file.flush()
+            fsync(file.fileno())
+
+        file = self._files.pop(room_id, None)
+
+        if file is not None:
+            file.close()
+
+        if exists(journal_path):
+            replace(journal_path, aside)
+            self._sync_directory()
+
+        replace(temporary, path)
+        self._sync_directory()
+
+        if exists(aside):
+            remove(aside)
+
+        # The journal of the snapshot, empty
+        self._file(room_id)
+        _CHECKPOINTS.inc()
+
+    def _recover_checkpoint(self, room_id):
+        """
+        Completes the checkpoint of the room **room_id** interrupted by a crash after its journal was moved aside:
+        the journal is moved back if the snapshot was not replaced yet, and removed otherwise.
+        """
+        temporary = self._snapshot_path(room_id) + self.TEMPORARY_EXTENSION
+        aside = self._journal_path(room_id) + self.ASIDE_EXTENSION
+
+        if exists(temporary):
+            replace(aside, self._journal_path(room_id))
+            remove(temporary)
+        else:
+            remove(aside)
+
+        self._sync_directory()
+
+    def _remove(self, room_id):
+        self._boards.pop(room_id, None)
+        file = self._files.pop(room_id, None)
+
+        if file is not None:
+            file.close()
+
+        for path in (self._snapshot_path(room_id), self._journal_path(room_id),
+                     self._snapshot_path(room_id) + self.TEMPORARY_EXTENSION,
+                     self._journal_path(room_id) + self.ASIDE_EXTENSION):
+            if exists(path):
+                remove(path)
+
+    def _file(self, room_id):
+        """
+        :return: the journal file of the room **room_id**, opened for appending the first time it is needed.
+        """
+        if room_id not in self._files:
+            self._files[room_id] = open(self._journal_path(room_id), "ab")
+
+        return self._files[room_id]
+
+    def _sync_directory(self):
+        """
+        Syncs the directory, so that the snapshots renamed survive a crash.
+        """
+        descriptor = open_fd(self.directory, O_RDONLY)
+
+        try:
+            fsync(descriptor)
+        finally:
+            close_fd(descriptor)
+
+    def _snapshot_path(self, room_id):
+        return join(self.directory, room_id + self.SNAPSHOT_EXTENSION)
+
+    def _journal_path(self, room_id):
+        return join(self.directory, room_id + self.JOURNAL_EXTENSION)
+
+    @classmethod
+    def _read_journal(cls, path):
+        """
+        :return: the changes of the records of the journal at **path**, up to the first torn or corrupt one.
+        """
+        if not exists(path):
+            return b""
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        changes, offset = list(), 0
+
+        while offset + cls._RECORD_HEADER.size <= len(data):
+            length, checksum = cls._RECORD_HEADER.unpack_from(data, offset)
+            start = offset + cls._RECORD_HEADER.size
+            record = data[start:start + length]
+
+            if len(record) != length or crc32(record) != checksum:
+                break
+
+            changes.append(record)
+            offset = start + length
+
+        return b"".join(changes)
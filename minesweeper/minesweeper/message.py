@@ -1,3 +1,8 @@
+from re import compile
+
+from room import RoomRegistry
+
+
 class Message(object):
 
     def get_representation(self):
@@ -14,31 +19,42 @@ class UTSMessage(Message):
     """
 
     message_types = ()  # Assigned at the bottom of the file
+    # The concrete classes in message_types whose messages have no arguments, indexed by their messages, and the
+    # others, as (GRAMMAR.fullmatch, class) tuples indexed by the first word of their messages. Filled at the bottom
+    # of the file as well
+    _literals = dict()
+    _parsers = dict()
+
+    # The first words a message of this class can start with, and the grammar of the whole message. Every group of
+    # the grammar is an argument of the constructor, converted to an integer if INTEGER_ARGUMENTS is True. A grammar
+    # without groups must match exactly the keywords of the class
+    KEYWORDS = ()
+    GRAMMAR = None
+    INTEGER_ARGUMENTS = False
 
     @staticmethod
     def parse_infer_type(raw_input):
         """
-        Takes a raw_input string and returns the first concrete UTSMessage instance where raw_input
-        was a valid string for static instantiation.
+        Takes a raw_input string and returns the concrete UTSMessage instance for which raw_input is a valid
+        string. Only the classes whose messages start with the first word of raw_input are tried, and no exception
+        is raised.
         :param raw_input: string to feed into a factory method.
         :return: object of a concrete UTSMessage class, or an instance of UTSInvalidMessage if the method fails
             (e.g. raw_input is "invalid").
         """
-        result = None
+        factory_string = raw_input.strip()
+        message_class = UTSMessage._literals.get(factory_string)
 
-        for i in UTSMessage.message_types:
-            try:
-                result = i.parse(raw_input)
+        if message_class is not None:
+            return message_class()
 
-                if result is not None:
-                    break
-            except Exception:
-                continue
+        for fullmatch, message_class in UTSMessage._parsers.get(factory_string.partition(" ")[0], ()):
+            match = fullmatch(factory_string)
 
-        if result is None:
-            result = UTSInvalidMessage.parse(raw_input)
+            if match is not None:
+                return message_class._from_match(match)
 
-        return result
+        return UTSInvalidMessage(factory_string)
 
     @classmethod
     def parse(cls, raw_input):
@@ -50,8 +66,18 @@ class UTSMessage(Message):
         Creates an instance of a concrete UTSMessage class by using a factory method.
         :param factory_string: string to construct a new object from.
         :return: a new instance whose class is a subtype of UTSMessage.
+        :raise: ValueError in case factory_string does not comply to the grammar of the class.
         """
-        raise NotImplementedError()
+        match = cls.GRAMMAR.fullmatch(factory_string)
+
+        if match is None:
+            raise ValueError("Expected \"%s\", found \"%s\"" % (cls.GRAMMAR.pattern, factory_string))
+
+        return cls._from_match(match)
+
+    @classmethod
+    def _from_match(cls, match):
+        return cls(*map(int, match.groups())) if cls.INTEGER_ARGUMENTS else cls(*match.groups())
 
     def find_errors(self, board):
         """
@@ -66,14 +92,8 @@ class UTSMessage(Message):
 
 class UTSLookMessage(UTSMessage):
     REPR = "look"
-
-    @classmethod
-    def _message_factory(cls, factory_string):
-        if factory_string.endswith(UTSLookMessage.REPR, 0):
-            return UTSLookMessage()
-        else:
-            raise ValueError("required \"%s\", found \"%s\"" %
-                             (UTSLookMessage.REPR, factory_string))
+    KEYWORDS = (REPR,)
+    GRAMMAR = compile(REPR)
 
     def find_errors(self, board):
         return None
@@ -82,31 +102,38 @@ class UTSLookMessage(UTSMessage):
         return self.REPR
 
 
+class UTSLookSinceMessage(UTSMessage):
+
+    REPR_PREFIX = "look since"
+    KEYWORDS = ("look",)
+    # "look <space> since <space> [0-9]+"
+    GRAMMAR = compile(REPR_PREFIX + " ([0-9]+)")
+    INTEGER_ARGUMENTS = True
+
+    def __init__(self, version):
+        self.version = version
+
+    def get_representation(self):
+        return "%s %d" % (self.REPR_PREFIX, self.version)
+
+    def find_errors(self, board):
+        return None
+
+
 class UTSDigMessage(UTSMessage):
 
     REPR_PREFIX = "dig"
+    KEYWORDS = (REPR_PREFIX,)
+    # "dig <space> -?[0-9]+ <space> -?[0-9]+". <space> refers to a single space only. Negative coordinates are
+    # parsed, to be reported as out of bounds by find_errors
+    GRAMMAR = compile(REPR_PREFIX + " (-?[0-9]+) (-?[0-9]+)")
+    INTEGER_ARGUMENTS = True
     ERROR_OUT_OF_BOUNDS = "Error. The coordinates %d, %d are not contained within the board."
 
     def __init__(self, row, col):
         self.row = row
         self.col = col
 
-    @classmethod
-    def _message_factory(cls, factory_string):
-        """
-        Creates a new instance of UTSDigMessage from factory_string.
-        :param factory_string: a string of the form "dig <space> [0-9]+ <space> [0-9]+". <space> refers to a single space only.
-        :return: an UTSDigMessage instance created according to the method arguments.
-        :raise: ValueError in case factory_string does not comply to the grammar.
-        """
-        components = factory_string.split(" ")
-        x, y = int(components[1]), int(components[2])
-
-        if cls.REPR_PREFIX != components[0]:
-            raise ValueError("Expected %s, found %s" % (cls.REPR_PREFIX, components[0]))
-
-        return UTSDigMessage(x, y)
-
     def get_representation(self):
         return "%s %d %d" % (self.REPR_PREFIX, self.row, self.col)
 
@@ -119,22 +146,15 @@ class UTSDigMessage(UTSMessage):
 class UTSFlagMessage(UTSMessage):
 
     REPR_PREFIX = "flag"
+    KEYWORDS = (REPR_PREFIX,)
+    GRAMMAR = compile(REPR_PREFIX + " (-?[0-9]+) (-?[0-9]+)")
+    INTEGER_ARGUMENTS = True
     ERROR_OUT_OF_BOUNDS = UTSDigMessage.ERROR_OUT_OF_BOUNDS
 
     def __init__(self, row, col):
         self.row = row
         self.col = col
 
-    @classmethod
-    def _message_factory(cls, factory_string):
-        components = factory_string.split(" ")
-        x, y = int(components[1]), int(components[2])
-
-        if cls.REPR_PREFIX != components[0]:
-            raise ValueError("Expected %s, found %s" % (cls.REPR_PREFIX, components[0]))
-
-        return UTSFlagMessage(x, y)
-
     def get_representation(self):
         return "%s %d %d" % (self.REPR_PREFIX, self.row, self.col)
 
@@ -144,36 +164,185 @@ class UTSFlagMessage(UTSMessage):
 class UTSDeflagMessage(UTSMessage):
 
     REPR_PREFIX = "deflag"
+    KEYWORDS = (REPR_PREFIX,)
+    GRAMMAR = compile(REPR_PREFIX + " (-?[0-9]+) (-?[0-9]+)")
+    INTEGER_ARGUMENTS = True
     ERROR_OUT_OF_BOUNDS = UTSDigMessage.ERROR_OUT_OF_BOUNDS
 
     def __init__(self, row, col):
         self.row = row
         self.col = col
 
+    def get_representation(self):
+        return "%s %d %d" % (self.REPR_PREFIX, self.row, self.col)
+
+    find_errors = UTSDigMessage.find_errors
+
+
+class UTSJoinMessage(UTSMessage):
+
+    REPR_PREFIX = "join"
+    KEYWORDS = (REPR_PREFIX,)
+    # "join <space> <room id>". Any room id without spaces is parsed, to be validated by find_errors
+    GRAMMAR = compile(REPR_PREFIX + " ([^ ]*)")
+    ERROR_INVALID_ID = "Error. '%s' is not a valid room id: use 1 to 32 letters, digits, '_' or '-'."
+    ERROR_NOT_JOINED = "Error. Room '%s' could not be joined: wait for the replies to your commands, and join again."
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+
+    def get_representation(self):
+        return "%s %s" % (self.REPR_PREFIX, self.room_id)
+
+    def find_errors(self, board):
+        if not RoomRegistry.ROOM_ID_PATTERN.fullmatch(self.room_id):
+            return self.ERROR_INVALID_ID % self.room_id
+        return None
+
+
+class UTSProtocolMessage(UTSMessage):
+
+    REPR_PREFIX = "protocol"
+    KEYWORDS = (REPR_PREFIX,)
+    # "protocol <space> <name>"
+    GRAMMAR = compile(REPR_PREFIX + " ([^ ]*)")
+    PROTOCOLS = ("text", "binary")
+    ERROR_UNKNOWN_PROTOCOL = "Error. '%s' is not a protocol: use one of %s."
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_representation(self):
+        return "%s %s" % (self.REPR_PREFIX, self.name)
+
+    def find_errors(self, board):
+        if self.name not in self.PROTOCOLS:
+            return self.ERROR_UNKNOWN_PROTOCOL % (self.name, ", ".join(self.PROTOCOLS))
+        return None
+
+
+class UTSCollapseMessage(UTSMessage):
+
+    REPR_PREFIX = "collapse"
+    KEYWORDS = (REPR_PREFIX,)
+    # "collapse <space> (on|off)"
+    GRAMMAR = compile(REPR_PREFIX + " (on|off)")
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
     @classmethod
-    def _message_factory(cls, factory_string):
-        components = factory_string.split(" ")
-        x, y = int(components[1]), int(components[2])
+    def _from_match(cls, match):
+        return cls(match[1] == "on")
+
+    def get_representation(self):
+        return "%s %s" % (self.REPR_PREFIX, "on" if self.enabled else "off")
+
+    def find_errors(self, board):
+        return None
+
+
+class UTSWatchMessage(UTSMessage):
 
-        if cls.REPR_PREFIX != components[0]:
-            raise ValueError("Expected %s, found %s" % (cls.REPR_PREFIX, components[0]))
+    REPR_PREFIX = "watch"
+    KEYWORDS = (REPR_PREFIX,)
+    # "watch <space> (on|off)"
+    GRAMMAR = compile(REPR_PREFIX + " (on|off)")
 
-        return UTSDeflagMessage(x, y)
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    @classmethod
+    def _from_match(cls, match):
+        return cls(match[1] == "on")
 
     def get_representation(self):
-        return "%s %d %d" % (self.REPR_PREFIX, self.row, self.col)
+        return "%s %s" % (self.REPR_PREFIX, "on" if self.enabled else "off")
 
-    find_errors = UTSDigMessage.find_errors
+    def find_errors(self, board):
+        return None
 
 
-class UTSHelpRequestMessage(UTSMessage):
+class UTSStatsMessage(UTSMessage):
 
-    REPR = "help"
+    REPR = "stats"
+    KEYWORDS = (REPR,)
+    GRAMMAR = compile(REPR)
+    ERROR_NOT_ADMIN = "Error. Stats are only available to clients connected from the host of the server."
+
+    def get_representation(self):
+        return self.REPR
+
+    def find_errors(self, board):
+        return None
+
+
+class UTSHintMessage(UTSMessage):
+
+    REPR = "hint"
+    KEYWORDS = (REPR,)
+    GRAMMAR = compile(REPR)
+    ERROR_NO_SOLVER = "Error. Hints are not available on this board."
+    ERROR_NO_SQUARE = "Error. No square is left to dig."
+
+    def get_representation(self):
+        return self.REPR
+
+    def find_errors(self, board):
+        return None
+
+
+class UTSViewMessage(UTSMessage):
+
+    REPR_PREFIX = "view"
+    KEYWORDS = (REPR_PREFIX,)
+    # "view <space> <row> <space> <col> <space> <height> <space> <width>", or "view <space> off" for the whole board.
+    # Negative coordinates are parsed, to be reported by find_errors
+    GRAMMAR = compile(REPR_PREFIX + " (?:(-?[0-9]+) (-?[0-9]+) ([0-9]+) ([0-9]+)|off)")
+    ERROR_INVALID_VIEWPORT = "Error. The viewport of %d x %d squares from %d, %d is empty or starts outside the board."
+
+    def __init__(self, row, col, height, width):
+        """
+        A viewport of 0 x 0 squares stands for the whole board.
+        """
+        self.row = row
+        self.col = col
+        self.height = height
+        self.width = width
 
     @classmethod
-    def _message_factory(cls, factory_string):
-        if cls.REPR == factory_string:
-            return UTSHelpRequestMessage()
+    def _from_match(cls, match):
+        if match[1] is None:
+            return cls(0, 0, 0, 0)
+
+        return cls(*map(int, match.groups()))
+
+    def viewport(self):
+        """
+        :return: a (row, col, height, width) tuple, or None for the whole board.
+        """
+        if self.height == self.width == 0:
+            return None
+
+        return self.row, self.col, self.height, self.width
+
+    def get_representation(self):
+        if self.viewport() is None:
+            return "%s off" % self.REPR_PREFIX
+
+        return "%s %d %d %d %d" % (self.REPR_PREFIX, self.row, self.col, self.height, self.width)
+
+    def find_errors(self, board):
+        if self.viewport() is not None and ((self.row, self.col) not in board or self.height <= 0 or self.width <= 0):
+            return self.ERROR_INVALID_VIEWPORT % (self.height, self.width, self.row, self.col)
+        return None
+
+
+class UTSHelpRequestMessage(UTSMessage):
+
+    REPR = "help"
+    KEYWORDS = (REPR,)
+    GRAMMAR = compile(REPR)
 
     def get_representation(self):
         return self.REPR
@@ -185,13 +354,8 @@ class UTSHelpRequestMessage(UTSMessage):
 class UTSByeMessage(UTSMessage):
 
     REPR = "bye"
-
-    @classmethod
-    def _message_factory(cls, factory_string):
-        if cls.REPR == factory_string or factory_string == "-1":
-            return UTSByeMessage()
-        else:
-            raise ValueError("Expected %s, found %s" % (cls.REPR, factory_string))
+    KEYWORDS = (REPR, "-1")
+    GRAMMAR = compile(REPR + "|-1")
 
     def get_representation(self):
         return self.REPR
@@ -232,12 +396,58 @@ class STUMessage(Message):
 
 
 class STUBoardMessage(STUMessage):
+    """
+    The board as it was when the message was created: the snapshot published by the board is captured, so that
+    rendering the message later needs no lock and always shows a consistent board. With a viewport, a (row, col,
+    height, width) tuple, only the BoardRegion of the snapshot within the viewport is sent.
+    """
+
+    def __init__(self, board, viewport=None):
+        self.snapshot = board.snapshot() if viewport is None else board.region(*viewport)
+
+    def get_representation(self):
+        return str(self.snapshot) + "\n"
+
+
+class STUBoardSnapshotMessage(STUMessage):
+    """
+    A full board, or the region of a viewport, preceded by a "board <version>" line. Sent in reply to a "look
+    since" message when the changes requested are no longer available.
+    """
+
+    REPR_PREFIX = "board"
+
+    def __init__(self, board, viewport=None):
+        self.snapshot = board.snapshot() if viewport is None else board.region(*viewport)
+
+    def get_representation(self):
+        return "%s %d\n%s\n" % (self.REPR_PREFIX, self.snapshot.version, self.snapshot)
+
+
+class STUBoardDeltaMessage(STUMessage):
+    """
+    The squares changed since the version requested by a "look since" message: a "delta <version> <count>" line,
+    followed by <count> lines of the form "<row> <col> <square>". With a viewport, a (row, col, height, width)
+    tuple, only the squares within the viewport are sent.
+    """
+
+    REPR_PREFIX = "delta"
 
-    def __init__(self, board):
-        self.board = board
+    def __init__(self, version, changes, viewport=None):
+        self.version = version
+
+        if viewport is not None:
+            row, col, height, width = viewport
+            changes = [(change_row, change_col, representation) for change_row, change_col, representation in changes
+                       if row <= change_row < row + height and col <= change_col < col + width]
+
+        self.changes = changes
 
     def get_representation(self):
-        return str(self.board) + "\n"
+        lines = ["%s %d %d" % (self.REPR_PREFIX, self.version, len(self.changes))]
+        lines.extend("%d %d %s" % change for change in self.changes)
+
+        return "\n".join(lines) + "\n"
 
 
 class STUBoomMessage(STUMessage):
@@ -254,6 +464,10 @@ class STUHelpMessage(STUMessage):
 *** MINESWEEPER COMMANDS HELP ***
 look
 \tReturns a representation of the board. No mutation occurs on the board.
+look since <version>
+\tReturns the squares changed since <version> as a "delta <version> <count>" line followed by
+\t<count> "<row> <col> <square>" lines. If the changes are no longer available, or <version> is 0,
+\ta "board <version>" line followed by the whole board is returned instead.
 dig <row> <col>
 \tAttempts to dig a given square. Index errors or a dug mine are indicated automatically
 \tif any of them occurs. Else a response like from a "look" message is sent.
@@ -262,6 +476,29 @@ flag <row> <col>
 \ton the same square will not unflag it.
 deflag <row> <col>
 \tDeflags the indicated square, or leaves it unchanged if it was already unflagged.
+join <room id>
+\tLeaves the current game and joins the game of room <room id>, creating it if it does not exist.
+\tEvery player starts in room 'default'.
+protocol <name>
+\tSwitches the encoding of every following message, both ways, to <name>: text (the default) or binary.
+\tThe reply to this message still uses the current encoding. The binary encoding is described in protocol.py.
+collapse <on|off>
+\tCommands sent together, without waiting for the replies, are applied to the board at once. With
+\tcollapse on, only the last board of the replies to such commands is sent. Off by default.
+watch <on|off>
+\tWith watch on, the changes made to the board by any player are pushed as they happen, as replies to
+\t"look since" messages: a "board <version>" line followed by the whole board first, then "delta" replies.
+\tChanges made while the previous ones are still being received are merged into a single reply. Off by default.
+stats
+\tReturns the metrics of the server in the Prometheus text format, followed by an empty line. Only available
+\tto clients connected from the host of the server.
+view <row> <col> <height> <width>
+\tRestricts the boards sent in the following replies, including the changes pushed and the replies to "look
+\tsince", to the <height> x <width> squares from <row>, <col>, and returns them. Useful for boards larger than
+\ta terminal. "view off" restores the whole board, which is sent by default.
+hint
+\tReturns a "hint <row> <col> <probability>" line: a square proven safe to dig, with a probability of 0, or
+\telse the square least likely to hide a mine, with the probability that it does. Flags are not trusted.
 help
 \tDisplays this message.
 bye
@@ -272,6 +509,29 @@ bye
         return self.REPR
 
 
+class STUStatsMessage(STUMessage):
+
+    def __init__(self, registry):
+        # The metrics are only collected when the reply is encoded, outside of the batch of the command
+        self.registry = registry
+
+    def get_representation(self):
+        return self.registry.exposition() + "\n"
+
+
+class STUHintMessage(STUMessage):
+
+    REPR_PREFIX = "hint"
+
+    def __init__(self, row, col, probability):
+        self.row = row
+        self.col = col
+        self.probability = probability
+
+    def get_representation(self):
+        return "%s %d %d %.3f\n" % (self.REPR_PREFIX, self.row, self.col, self.probability)
+
+
 class STUHelloMessage(STUMessage):
 
     REPR = """
@@ -286,6 +546,51 @@ Type 'help' for help.\n
         return self.REPR % self.users
 
 
+class STUJoinMessage(STUMessage):
+
+    REPR = "Joined room '%s'. %d people are playing in it including you.\n"
+
+    def __init__(self, room_id, players):
+        self.room_id = room_id
+        self.players = players
+
+    def get_representation(self):
+        return self.REPR % (self.room_id, self.players)
+
+
+class STUProtocolMessage(STUMessage):
+
+    REPR = "Using the %s protocol.\n"
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_representation(self):
+        return self.REPR % self.name
+
+
+class STUCollapseMessage(STUMessage):
+
+    REPR = "Board replies are %s.\n"
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    def get_representation(self):
+        return self.REPR % ("collapsed" if self.enabled else "not collapsed")
+
+
+class STUWatchMessage(STUMessage):
+
+    REPR = "Board changes are %s.\n"
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    def get_representation(self):
+        return self.REPR % ("pushed" if self.enabled else "not pushed")
+
+
 class STUErrorMessage(STUMessage):
 
     def __init__(self, error_msg):
@@ -303,5 +608,14 @@ class STUByeMessage(STUMessage):
         return self.REPR
 
 
-UTSMessage.message_types = (UTSLookMessage, UTSDigMessage, UTSFlagMessage, UTSDeflagMessage,
-                            UTSHelpRequestMessage, UTSByeMessage)
\ No newline at end of file
+UTSMessage.message_types = (UTSLookMessage, UTSLookSinceMessage, UTSDigMessage, UTSFlagMessage,
+                            UTSDeflagMessage, UTSJoinMessage, UTSProtocolMessage, UTSCollapseMessage,
+                            UTSWatchMessage, UTSStatsMessage, UTSViewMessage, UTSHintMessage, UTSHelpRequestMessage,
+                            UTSByeMessage)
+
+for message_type in UTSMessage.message_types:
+    for keyword in message_type.KEYWORDS:
+        if message_type.GRAMMAR.groups == 0:
+            UTSMessage._literals[keyword] = message_type
+        else:
+            UTSMessage._parsers.setdefault(keyword, list()).append((message_type.GRAMMAR.fullmatch, message_type))
\ No newline at end of file
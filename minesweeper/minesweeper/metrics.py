@@ -0,0 +1,268 @@
+"""
+Counters, gauges and histograms cheap enough to be updated on the hot paths of a server, and left on permanently.
+Updating a metric never takes a lock: every thread updates a shard of its own, and the shards are only summed when
+the metrics are collected, in the Prometheus text format, by a "stats" command or a MetricsFileWriter.
+"""
+from bisect import bisect_left
+from os import replace
+from threading import Lock, Thread, Event, current_thread, local
+
+
+class _ShardedMetric:
+    """
+    A metric made of one list of numbers per thread updating it. The shards of the threads which exited are merged
+    into a single one when the metric is collected, so that a server starting a thread per client does not
+    accumulate them.
+    """
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._local = local()
+        self._lock = Lock()
+        self._shards = list()
+        self._retired = self._new_shard()
+
+    def __repr__(self):
+        return "<'%s.%s' object, name=%s, labels=%s>" % \
+               (self.__class__.__module__, self.__class__.__name__, self.name, self.labels)
+
+    def _new_shard(self):
+        raise NotImplementedError()
+
+    def _shard(self):
+        """
+        :return: the shard of the current thread, created the first time the thread updates the metric.
+        """
+        shard = self._new_shard()
+
+        with self._lock:
+            self._shards.append((current_thread(), shard))
+
+        self._local.shard = shard
+
+        return shard
+
+    def _total(self):
+        """
+        :return: the sum of every shard.
+        """
+        with self._lock:
+            alive = list()
+
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._retired = [total + value for total, value in zip(self._retired, shard)]
+
+            self._shards = alive
+            shards = [shard for thread, shard in alive]
+
+        # Shards still alive are read while being updated: each of their numbers is read atomically
+        return [sum(values) for values in zip(self._retired, *shards)]
+
+    def samples(self):
+        """
+        :return: a list of (suffix, labels, value) tuples, one for every line of the metric in the text format.
+        """
+        raise NotImplementedError()
+
+
+class Counter(_ShardedMetric):
+    """
+    A number which only increases, e.g. a number of bytes sent.
+    """
+
+    TYPE = "counter"
+
+    def _new_shard(self):
+        return [0]
+
+    def inc(self, amount=1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+
+        shard[0] += amount
+
+    def value(self):
+        return self._total()[0]
+
+    def samples(self):
+        return [("_total", self.labels, self.value())]
+
+
+class Gauge(Counter):
+    """
+    A number which increases and decreases, e.g. a number of connections. A gauge may be increased by a thread and
+    decreased by another one: only the sum of the shards is meaningful.
+    """
+
+    TYPE = "gauge"
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self):
+        return [("", self.labels, self.value())]
+
+
+class Histogram(_ShardedMetric):
+    """
+    The distribution of a duration, in seconds, as the number of observations in each of a fixed set of buckets.
+    """
+
+    TYPE = "histogram"
+    # 1 microsecond to about 1 second, every bucket 4 times as wide as the previous one
+    DEFAULT_BUCKETS = tuple(4 ** i / 10 ** 6 for i in range(11))
+
+    def __init__(self, name, documentation, labels, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        super().__init__(name, documentation, labels)
+
+    def _new_shard(self):
+        # A count for every bucket, the count of the observations above the last bucket, and their sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def samples(self):
+        total = self._total()
+        samples, count = list(), 0
+
+        for bound, observations in zip(self.buckets + (float("inf"),), total):
+            count += observations
+            samples.append(("_bucket", dict(self.labels, le="+Inf" if bound == float("inf") else repr(bound)),
+                            count))
+
+        samples.append(("_sum", self.labels, total[-1]))
+        samples.append(("_count", self.labels, count))
+
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process, indexed by name and labels. Metrics are created once, typically when a module is
+    imported, and kept by their users, which update them without going through the registry.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = dict()
+
+    def __repr__(self):
+        with self._lock:
+            return "<'%s.%s' object, metrics=%d>" % \
+                   (self.__class__.__module__, self.__class__.__name__, len(self._metrics))
+
+    def counter(self, name, documentation, **labels):
+        return self._metric(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, **labels):
+        return self._metric(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, **labels):
+        return self._metric(Histogram, name, documentation, labels)
+
+    def exposition(self):
+        """
+        :return: every metric in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines, name = list(), None
+
+        for metric in metrics:
+            if metric.name != name:
+                name = metric.name
+                lines.append("# HELP %s %s" % (name, metric.documentation))
+                lines.append("# TYPE %s %s" % (name, metric.TYPE))
+
+            for suffix, labels, value in metric.samples():
+                lines.append("%s%s%s %s" % (name, suffix, self._format_labels(labels), value))
+
+        return "".join(line + "\n" for line in lines)
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+
+        return "{%s}" % ",".join('%s="%s"' % (key, value) for key, value in sorted(labels.items()))
+
+    def _metric(self, metric_type, name, documentation, labels):
+        """
+        :return: the metric **name** with **labels**, created if it does not exist yet.
+        """
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            metric = self._metrics.get(key)
+
+            if metric is None:
+                metric = self._metrics[key] = metric_type(name, documentation, labels)
+            elif not isinstance(metric, metric_type):
+                raise ValueError("%s is a %s, not a %s" % (name, metric.TYPE, metric_type.TYPE))
+
+            return metric
+
+
+class MetricsFileWriter:
+    """
+    Writes the metrics of a registry to a file every **interval** seconds, from a daemon thread, e.g. for the
+    textfile collector of the Prometheus node exporter. The file is replaced atomically, so that it is never read
+    half-written.
+    """
+
+    DEFAULT_INTERVAL = 10
+
+    def __init__(self, registry, path, interval=DEFAULT_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stopped = Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "<'%s.%s' object, path=%s, interval=%s>" % \
+               (self.__class__.__module__, self.__class__.__name__, self.path, self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._write_forever, name=repr(self), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def write(self):
+        temporary = self.path + ".tmp"
+
+        with open(temporary, "w") as file:
+            file.write(self.registry.exposition())
+
+        replace(temporary, self.path)
+
+    def _write_forever(self):
+        self.write()
+
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+
+# The metrics of the process
+METRICS = MetricsRegistry()
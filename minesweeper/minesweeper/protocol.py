@@ -0,0 +1,324 @@
+"""
+The encodings of the messages exchanged by a client and a server. Every client starts with the text protocol, and can
+switch to the binary one by sending "protocol binary": the reply is still sent as text, and every following message,
+both ways, is binary.\n
+Binary messages from the client to the server are a command byte followed by the fixed-size arguments of the command,
+in network byte order:
+    1 look, 2 look since (uint64 version), 3 dig, 4 flag, 5 deflag (int32 row, int32 col), 6 join (room id),
+    7 help, 8 bye, 9 protocol (name), 10 collapse (uint8 enabled), 11 watch (uint8 enabled), 12 stats,
+    13 view (int32 row, int32 col, uint32 height, uint32 width, 0 x 0 for the whole board), 14 hint
+where strings are a length byte followed by as many UTF-8 bytes.\n
+Binary messages from the server to the client are a reply byte and the uint32 length of the payload, followed by the
+payload:
+    1 board: uint64 version, uint32 height, uint32 width, then the squares packed two per byte (see
+      BoardSnapshot.packed)
+    2 delta: uint64 version, uint32 count, then count times int32 row, int32 col, uint8 square code
+    3 boom, 4 bye: no payload
+    5 join: uint32 players, then the UTF-8 room id
+    6 text (help, stats), 7 error: UTF-8 text
+    8 protocol: the UTF-8 name of the protocol
+    9 hello: uint32 users
+    10 collapse, 11 watch: uint8 enabled
+    12 view: the region of a board within the viewport of the client, as a board but for uint64 version, uint32 row,
+      uint32 col, uint32 height, uint32 width, where height and width are clipped to the board
+    13 hint: int32 row, int32 col, float64 probability of a mine
+The code of a square is the index of its text in board.CELL_REPRESENTATIONS: 0 to 8 for a dug square with as many
+mined neighbours, then untouched, flagged and dug mine.
+"""
+from struct import Struct
+
+from board import CELL_REPRESENTATIONS, BoardRegion
+from message import *
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the bytes received from a client cannot be parsed, and the connection should be closed.
+    """
+    pass
+
+
+class TextProtocol:
+    """
+    The human-readable protocol: one command per line, replies as displayed by a terminal.
+    """
+
+    NAME = "text"
+    MAX_LINE_LENGTH = 2 ** 16
+
+    def parse(self, buffer, start=0):
+        """
+        Parses the message of the client starting at **start** in **buffer**.
+        :param buffer: the bytes received from the client.
+        :return: a (message, end) tuple, where end is the offset following the message in **buffer**, or None if
+            the message is not complete yet.
+        :raise: ProtocolError if the message is too long.
+        """
+        end = buffer.find(b"\n", start)
+
+        if end < 0:
+            if len(buffer) - start > self.MAX_LINE_LENGTH:
+                raise ProtocolError("Line longer than %d bytes" % self.MAX_LINE_LENGTH)
+            return None
+
+        return UTSMessage.parse_infer_type(buffer[start:end].decode(errors="replace")), end + 1
+
+    def encode(self, message):
+        """
+        :return: **message**, either a UTSMessage or a STUMessage, as bytes to be sent.
+        """
+        return b"".join(self.segments(message))
+
+    def segments(self, message):
+        """
+        :return: **message**, either a UTSMessage or a STUMessage, as a list of bytes segments to be sent in order.
+            Boards are sent as encoded and cached by their snapshot, without being copied.
+        """
+        if isinstance(message, UTSMessage):
+            return [(message.get_representation() + "\n").encode()]
+        if isinstance(message, STUBoardMessage):
+            return [message.snapshot.encoded(), b"\n"]
+        if isinstance(message, STUBoardSnapshotMessage):
+            return [("%s %d\n" % (message.REPR_PREFIX, message.snapshot.version)).encode(), message.snapshot.encoded(),
+                    b"\n"]
+
+        return [message.get_representation().encode()]
+
+
+class BinaryProtocol:
+    """
+    The compact protocol described in the documentation of this module. Commands are decoded to the same UTSMessage
+    objects as their text counterparts, so that servers process them in the same way.
+    """
+
+    NAME = "binary"
+
+    COMMAND_LOOK = 1
+    COMMAND_LOOK_SINCE = 2
+    COMMAND_DIG = 3
+    COMMAND_FLAG = 4
+    COMMAND_DEFLAG = 5
+    COMMAND_JOIN = 6
+    COMMAND_HELP = 7
+    COMMAND_BYE = 8
+    COMMAND_PROTOCOL = 9
+    COMMAND_COLLAPSE = 10
+    COMMAND_WATCH = 11
+    COMMAND_STATS = 12
+    COMMAND_VIEW = 13
+    COMMAND_HINT = 14
+
+    REPLY_BOARD = 1
+    REPLY_DELTA = 2
+    REPLY_BOOM = 3
+    REPLY_BYE = 4
+    REPLY_JOIN = 5
+    REPLY_TEXT = 6
+    REPLY_ERROR = 7
+    REPLY_PROTOCOL = 8
+    REPLY_HELLO = 9
+    REPLY_COLLAPSE = 10
+    REPLY_WATCH = 11
+    REPLY_VIEW = 12
+    REPLY_HINT = 13
+
+    # For every command: the message class, the format of its fixed-size arguments (None for a single string
+    # argument) and the attributes of the message holding them
+    COMMANDS = {
+        COMMAND_LOOK: (UTSLookMessage, Struct("!"), ()),
+        COMMAND_LOOK_SINCE: (UTSLookSinceMessage, Struct("!Q"), ("version",)),
+        COMMAND_DIG: (UTSDigMessage, Struct("!ii"), ("row", "col")),
+        COMMAND_FLAG: (UTSFlagMessage, Struct("!ii"), ("row", "col")),
+        COMMAND_DEFLAG: (UTSDeflagMessage, Struct("!ii"), ("row", "col")),
+        COMMAND_JOIN: (UTSJoinMessage, None, ("room_id",)),
+        COMMAND_HELP: (UTSHelpRequestMessage, Struct("!"), ()),
+        COMMAND_BYE: (UTSByeMessage, Struct("!"), ()),
+        COMMAND_PROTOCOL: (UTSProtocolMessage, None, ("name",)),
+        COMMAND_COLLAPSE: (UTSCollapseMessage, Struct("!?"), ("enabled",)),
+        COMMAND_WATCH: (UTSWatchMessage, Struct("!?"), ("enabled",)),
+        COMMAND_STATS: (UTSStatsMessage, Struct("!"), ()),
+        COMMAND_VIEW: (UTSViewMessage, Struct("!iiII"), ("row", "col", "height", "width")),
+        COMMAND_HINT: (UTSHintMessage, Struct("!"), ()),
+    }
+    _COMMAND_CODES = {message_class: command for command, (message_class, fmt, attributes) in COMMANDS.items()}
+
+    REPLY_HEADER = Struct("!BI")
+    BOARD_HEADER = Struct("!QII")
+    VIEW_HEADER = Struct("!QIIII")
+    DELTA_HEADER = Struct("!QI")
+    DELTA_SQUARE = Struct("!iiB")
+    HINT = Struct("!iid")
+    COUNT = Struct("!I")
+
+    _SQUARE_CODES = {representation: code for code, representation in enumerate(CELL_REPRESENTATIONS)}
+    _HIGH_NIBBLES = bytes(byte >> 4 for byte in range(256))
+    _LOW_NIBBLES = bytes(byte & 0xF for byte in range(256))
+
+    def parse(self, buffer, start=0):
+        """
+        Parses the message of the client starting at **start** in **buffer**.
+        :param buffer: the bytes received from the client.
+        :return: a (message, end) tuple, where end is the offset following the message in **buffer**, or None if
+            the message is not complete yet. An unknown command byte is parsed as an UTSInvalidMessage on its own.
+        """
+        if start >= len(buffer):
+            return None
+
+        command = buffer[start]
+
+        if command not in self.COMMANDS:
+            return UTSInvalidMessage("command %d" % command), start + 1
+
+        message_class, fmt, attributes = self.COMMANDS[command]
+
+        if fmt is None:
+            if start + 1 >= len(buffer) or start + 2 + buffer[start + 1] > len(buffer):
+                return None
+
+            end = start + 2 + buffer[start + 1]
+
+            return message_class(buffer[start + 2:end].decode(errors="replace")), end
+
+        end = start + 1 + fmt.size
+
+        if end > len(buffer):
+            return None
+
+        return message_class(*fmt.unpack_from(buffer, start + 1)), end
+
+    def encode(self, message):
+        """
+        :return: **message**, either a UTSMessage or a STUMessage, as bytes to be sent.
+        """
+        return b"".join(self.segments(message))
+
+    def segments(self, message):
+        """
+        :return: **message**, either a UTSMessage or a STUMessage, as a list of bytes segments to be sent in order.
+            Boards are sent as packed and cached by their snapshot, without being copied.
+        """
+        if isinstance(message, UTSMessage):
+            return [self._encode_command(message)]
+        if isinstance(message, (STUBoardMessage, STUBoardSnapshotMessage)):
+            snapshot = message.snapshot
+
+            if isinstance(snapshot, BoardRegion):
+                reply = self.REPLY_VIEW
+                header = self.VIEW_HEADER.pack(snapshot.version, snapshot.row, snapshot.col, snapshot.height(),
+                                               snapshot.width)
+            else:
+                reply = self.REPLY_BOARD
+                header = self.BOARD_HEADER.pack(snapshot.version, snapshot.height(), snapshot.width)
+
+            packed = snapshot.packed()
+
+            return [self.REPLY_HEADER.pack(reply, len(header) + len(packed)) + header, packed]
+
+        reply, payload = self._encode_reply(message)
+
+        return [self.REPLY_HEADER.pack(reply, len(payload)) + payload]
+
+    def read_reply(self, stream):
+        """
+        Reads a reply of the server, as a client would.
+        :param stream: a binary file object reading from the server.
+        :return: a (reply, payload) tuple, or None if the server closed the connection.
+        """
+        header = stream.read(self.REPLY_HEADER.size)
+
+        if len(header) < self.REPLY_HEADER.size:
+            return None
+
+        reply, length = self.REPLY_HEADER.unpack(header)
+
+        return reply, stream.read(length)
+
+    @classmethod
+    def decode_board(cls, payload):
+        """
+        :param payload: the payload of a board reply.
+        :return: a (version, height, width, codes) tuple, where codes holds the code of every square, one per byte.
+        """
+        version, height, width = cls.BOARD_HEADER.unpack_from(payload)
+        packed = payload[cls.BOARD_HEADER.size:]
+        codes = bytearray(len(packed) * 2)
+        codes[0::2] = packed.translate(cls._HIGH_NIBBLES)
+        codes[1::2] = packed.translate(cls._LOW_NIBBLES)
+
+        return version, height, width, bytes(codes[:height * width])
+
+    @classmethod
+    def decode_view(cls, payload):
+        """
+        :param payload: the payload of a view reply.
+        :return: a (version, row, col, height, width, codes) tuple, where codes holds the code of every square of
+            the region, one per byte.
+        """
+        version, row, col, height, width = cls.VIEW_HEADER.unpack_from(payload)
+        packed = payload[cls.VIEW_HEADER.size:]
+        codes = bytearray(len(packed) * 2)
+        codes[0::2] = packed.translate(cls._HIGH_NIBBLES)
+        codes[1::2] = packed.translate(cls._LOW_NIBBLES)
+
+        return version, row, col, height, width, bytes(codes[:height * width])
+
+    @classmethod
+    def decode_delta(cls, payload):
+        """
+        :param payload: the payload of a delta reply.
+        :return: a (version, changes) tuple, where changes is a list of (row, col, code) tuples.
+        """
+        version, count = cls.DELTA_HEADER.unpack_from(payload)
+
+        return version, list(cls.DELTA_SQUARE.iter_unpack(payload[cls.DELTA_HEADER.size:]))
+
+    def _encode_command(self, message):
+        command = self._COMMAND_CODES[type(message)]
+        message_class, fmt, attributes = self.COMMANDS[command]
+        arguments = [getattr(message, attribute) for attribute in attributes]
+
+        if fmt is None:
+            data = arguments[0].encode()
+
+            return bytes((command, len(data))) + data
+
+        return bytes((command,)) + fmt.pack(*arguments)
+
+    def _encode_reply(self, message):
+        """
+        :return: a (reply, payload) tuple, for any message but boards.
+        """
+        if isinstance(message, STUBoardDeltaMessage):
+            squares = [self.DELTA_SQUARE.pack(row, col, self._SQUARE_CODES[representation])
+                       for row, col, representation in message.changes]
+
+            return self.REPLY_DELTA, self.DELTA_HEADER.pack(message.version, len(squares)) + b"".join(squares)
+        if isinstance(message, STUBoomMessage):
+            return self.REPLY_BOOM, b""
+        if isinstance(message, STUByeMessage):
+            return self.REPLY_BYE, b""
+        if isinstance(message, STUJoinMessage):
+            return self.REPLY_JOIN, self.COUNT.pack(message.players) + message.room_id.encode()
+        if isinstance(message, STUHelpMessage):
+            return self.REPLY_TEXT, message.get_representation().encode()
+        if isinstance(message, STUStatsMessage):
+            return self.REPLY_TEXT, message.registry.exposition().encode()
+        if isinstance(message, STUErrorMessage):
+            return self.REPLY_ERROR, message.msg.encode()
+        if isinstance(message, STUProtocolMessage):
+            return self.REPLY_PROTOCOL, message.name.encode()
+        if isinstance(message, STUHelloMessage):
+            return self.REPLY_HELLO, self.COUNT.pack(message.users)
+        if isinstance(message, STUCollapseMessage):
+            return self.REPLY_COLLAPSE, bytes((message.enabled,))
+        if isinstance(message, STUWatchMessage):
+            return self.REPLY_WATCH, bytes((message.enabled,))
+        if isinstance(message, STUHintMessage):
+            return self.REPLY_HINT, self.HINT.pack(message.row, message.col, message.probability)
+
+        raise ValueError("%s has no binary encoding" % type(message).__name__)
+
+
+TEXT_PROTOCOL = TextProtocol()
+BINARY_PROTOCOL = BinaryProtocol()
+PROTOCOLS = {protocol.NAME: protocol for protocol in (TEXT_PROTOCOL, BINARY_PROTOCOL)}
@@ -0,0 +1,260 @@
+from collections import OrderedDict
+from re import compile
+from threading import Lock
+from time import monotonic
+
+from board import Board
+from solver import BoardSolver
+
+
+class RoomWatchers:
+    """
+    The players of a room watching its board, to which every change of the board is pushed. Watchers are notified
+    without blocking: notify() only wakes them up, and each watcher sends the update itself, whenever it is ready.
+    A watcher slower than the changes of the board is woken up several times before sending anything, and sends a
+    single update bringing it up to date: updates are coalesced, and the other watchers never wait for it.\n
+    Updates are rendered once for every distinct (version, key) pair of the watchers of a board version, and shared
+    among them: since most watchers are up to date, most of them share the same update.\n
+    Thread safety: the watchers are only accessed under the lock of the RoomWatchers, which is never held while
+    acquiring another lock, so that players can (un)subscribe while holding the locks of the board. The cache of
+    updates has a lock of its own, held while rendering updates, i.e. while acquiring the locks of the board.
+    """
+
+    def __init__(self, board):
+        self._board = board
+        self._lock = Lock()
+        self._watchers = set()
+        # The updates rendered for the current version of the board, indexed by (version, key)
+        self._updates_lock = Lock()
+        self._updates = dict()
+        self._updates_version = None
+
+    def __repr__(self):
+        with self._lock:
+            return "<'%s.%s' object, watchers=%d>" % \
+                   (self.__class__.__module__, self.__class__.__name__, len(self._watchers))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._watchers)
+
+    def subscribe(self, watcher):
+        """
+        Adds **watcher**, an object with a non-blocking wake() method, which is invoked at once.
+        """
+        with self._lock:
+            self._watchers.add(watcher)
+
+        watcher.wake()
+
+    def unsubscribe(self, watcher):
+        with self._lock:
+            self._watchers.discard(watcher)
+
+    def notify(self):
+        """
+        Wakes every watcher up, after a change of the board.
+        """
+        with self._lock:
+            watchers = list(self._watchers)
+
+        for watcher in watchers:
+            watcher.wake()
+
+    def update(self, version, key, render):
+        """
+        :param version: the version of the board last sent to a watcher.
+        :param key: identifies the encoding of the update, e.g. the protocol of the watcher.
+        :param render: a callable taking **version** and returning a (version, update) tuple, where update brings a
+            watcher at **version** up to date. It is only invoked if no other watcher with the same version and key
+            did since the last change of the board.
+        :return: the (version, update) tuple returned by **render**, or None if **version** is up to date.
+        """
+        with self._updates_lock:
+            current = self._board.version()
+
+            if version == current:
+                return None
+
+            if self._updates_version != current:
+                self._updates.clear()
+                self._updates_version = current
+
+            if (version, key) not in self._updates:
+                self._updates[version, key] = render(version)
+
+            return self._updates[version, key]
+
+
+class Room:
+    """
+    A game hosted by a server: a board shared by the players which joined the room. Every board has a lock of
+    its own, so that games in different rooms never contend. The solver of the board answers the hints of the
+    players, and is None for the boards it cannot solve, such as chunked boards.
+    """
+
+    def __init__(self, room_id, board):
+        self.id = room_id
+        self.board = board
+        self.players = 0
+        self.watchers = RoomWatchers(board)
+        self.solver = BoardSolver(board) if isinstance(board, Board) else None
+
+    def __repr__(self):
+        return "<'%s.%s' object, id=%s, players=%d, board=%s>" % \
+               (self.__class__.__module__, self.__class__.__name__, self.id, self.players, repr(self.board))
+
+
+class RoomRegistry:
+    """
+    The rooms hosted by a server, created on demand when a player joins them. A room left by its last player is
+    garbage-collected once it has been idle for **idle_timeout** seconds, except for the default room, where every
+    player starts.\n
+    With a journal, the boards of the rooms are journaled, and the rooms found in the journal when the registry is
+    created are restored: the default room replaces **default_board**, and the other rooms are kept until they have
+    been idle for **idle_timeout** seconds, as if they had just been emptied.\n
+    Thread safety: rooms are created, joined, left and collected under the registry lock. The count of players of
+    a room is only accessed under that lock as well. Players join rooms while holding the locks of their board, so
+    that the locks of a board are never acquired under the registry lock: boards are attached to the journal, and
+    detached from it, without acquiring them.
+    """
+
+    DEFAULT_ROOM = "default"
+    ROOM_ID_PATTERN = compile(r"[A-Za-z0-9_-]{1,32}")
+    DEFAULT_IDLE_TIMEOUT = 300
+
+    def __init__(self, default_board, board_factory=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, journal=None):
+        """
+        :param default_board: the board of the default room.
+        :param board_factory: a callable returning a new Board, invoked whenever a new room is created. By default,
+            new boards have the size and the mines density of **default_board**.
+        :param idle_timeout: the number of seconds an empty room is kept before being garbage-collected.
+        :param journal: a BoardJournal, which is started, or None.
+        """
+        boards = journal.recover() if journal is not None else dict()
+        default_board = boards.pop(self.DEFAULT_ROOM, default_board)
+
+        if board_factory is None:
+            height, width = default_board.height(), default_board.width()
+            bomb_probability = default_board.mines_count() / len(default_board)
+
+            def board_factory():
+                return Board.create_from_probability(height, width, bomb_probability)
+
+        self._lock = Lock()
+        self._board_factory = board_factory
+        self._idle_timeout = idle_timeout
+        self._journal = journal
+        self._rooms = {self.DEFAULT_ROOM: Room(self.DEFAULT_ROOM, default_board)}
+        # The ids of the rooms without players, in the order they were emptied, mapped to the time they were emptied
+        self._empty = OrderedDict()
+
+        for room_id, board in boards.items():
+            self._rooms[room_id] = Room(room_id, board)
+            self._empty[room_id] = monotonic()
+
+        if journal is not None:
+            for room in self._rooms.values():
+                journal.attach(room.id, room.board)
+
+            journal.start()
+
+    def __repr__(self):
+        with self._lock:
+            return "<'%s.%s' object, rooms=%d, empty=%d>" % \
+                   (self.__class__.__module__, self.__class__.__name__, len(self._rooms), len(self._empty))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rooms)
+
+    def __contains__(self, room_id):
+        with self._lock:
+            return room_id in self._rooms
+
+    def default_room(self):
+        with self._lock:
+            return self._rooms[self.DEFAULT_ROOM]
+
+    def join(self, room_id, previous=None):
+        """
+        Adds a player to the room **room_id**, creating the room if it does not exist.
+        :param room_id: a string matching ROOM_ID_PATTERN.
+        :param previous: the room the player is leaving, if any.
+        :return: the Room joined.
+        """
+        if not self.ROOM_ID_PATTERN.fullmatch(room_id):
+            raise ValueError("Invalid room id '%s'" % room_id)
+
+        with self._lock:
+            if previous is not None:
+                self._leave(previous)
+
+            if room_id in self._rooms:
+                return self._enter(self._rooms[room_id])
+
+        # Boards are created without holding the registry lock, so that creating a large one does not block the
+        # other players. If two players create the same room at the same time, the first board stored wins.
+        board = self._board_factory()
+
+        with self._lock:
+            room = self._rooms.get(room_id)
+
+            if room is None:
+                room = self._rooms[room_id] = Room(room_id, board)
+
+                if self._journal is not None:
+                    self._journal.attach(room_id, board)
+
+            return self._enter(room)
+
+    def leave(self, room):
+        """
+        Removes a player from **room**.
+        """
+        with self._lock:
+            self._leave(room)
+            self._collect()
+
+    def close(self):
+        """
+        Flushes and closes the journal, if any.
+        """
+        if self._journal is not None:
+            self._journal.close()
+
+    def collect(self):
+        """
+        Garbage-collects the rooms which have been empty for longer than the idle timeout.
+        :return: the number of rooms removed.
+        """
+        with self._lock:
+            return self._collect()
+
+    def _enter(self, room):
+        self._empty.pop(room.id, None)
+        room.players += 1
+        self._collect()
+
+        return room
+
+    def _leave(self, room):
+        room.players -= 1
+
+        if room.players == 0 and room.id != self.DEFAULT_ROOM:
+            self._empty[room.id] = monotonic()
+
+    def _collect(self):
+        deadline = monotonic() - self._idle_timeout
+        removed = 0
+
+        # Rooms are sorted by the time they were emptied: only the expired ones at the front are visited
+        while self._empty and next(iter(self._empty.values())) <= deadline:
+            room_id, emptied = self._empty.popitem(last=False)
+            room = self._rooms.pop(room_id)
+            removed += 1
+
+            if self._journal is not None:
+                self._journal.detach(room_id, room.board)
+
+        return removed
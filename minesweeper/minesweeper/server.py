@@ -1,15 +1,44 @@
+import asyncio
 import concurrent.futures
+import socket as socket_module
 from argparse import ArgumentParser
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from ipaddress import ip_address
 from logging import *
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from os import close as close_fd, cpu_count
+from os.path import join, splitext
 from socket import *
 from sys import argv, stdout
-from time import sleep
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep
+from zlib import crc32
 
 from board import Board, State
+from chunked import ChunkedBoard
+from journal import BoardJournal
 from message import *
+from metrics import METRICS, MetricsFileWriter
+from protocol import PROTOCOLS, TEXT_PROTOCOL, ProtocolError
+from room import RoomRegistry
+from transport import BufferedSocketWriter
 from utils import is_boolean
 
+_PARSE_SECONDS = {name: METRICS.histogram("minesweeper_parse_seconds", "Time spent parsing a command", protocol=name)
+                  for name in PROTOCOLS}
+_COMMAND_SECONDS = {message_type: METRICS.histogram("minesweeper_command_seconds",
+                                                    "Time spent processing a command, every lock of the board held",
+                                                    command=message_type.__name__[3:-len("Message")].lower())
+                    for message_type in UTSMessage.message_types + (UTSInvalidMessage,)}
+_SENT_BYTES = METRICS.counter("minesweeper_sent_bytes", "Bytes of replies and updates sent to clients")
+_CONNECTIONS = METRICS.gauge("minesweeper_connections", "Clients being served")
+_QUEUED_CONNECTIONS = METRICS.gauge("minesweeper_queued_connections",
+                                    "Clients accepted by a threaded server, and waiting for a thread to serve them")
+_REJECTED_CONNECTIONS = METRICS.counter("minesweeper_rejected_connections",
+                                        "Clients disconnected at once by an asyncio server, because it was full")
+
 
 class MineSweeperServer:
 
@@ -20,8 +49,14 @@ class MineSweeperServer:
         "max_clients": 4
     }
 
-    def __init__(self, board, port=DEFAULT_CONFIGS["port"], debug=False):
+    def __init__(self, board, port=DEFAULT_CONFIGS["port"], debug=False, board_factory=None, journal=None):
+        """
+        :param board: the board of the default room, where every client starts.
+        :param board_factory: a callable returning the board of every new room (see RoomRegistry).
+        :param journal: a BoardJournal the rooms are restored from and journaled to, or None (see RoomRegistry).
+        """
         self._board = board
+        self._rooms = RoomRegistry(board, board_factory, journal=journal)
         self._futures_to_connections = dict()
         self.max_clients = self.DEFAULT_CONFIGS["max_clients"]
 
@@ -63,6 +98,7 @@ class MineSweeperServer:
             self._server.shutdown(SHUT_RDWR)
             self._server.close()
             del self._server
+            self._rooms.close()
 
             self.is_closed = True
 
@@ -71,6 +107,9 @@ class MineSweeperServer:
     def futures(self):
         return self._futures_to_connections.keys()
 
+    def rooms(self):
+        return self._rooms
+
     def connections(self):
         return self._futures_to_connections.values()
 
@@ -87,6 +126,7 @@ class MineSweeperServer:
                 self._server.accept()[0],
                 self.is_debug_enabled()
             )
+            _QUEUED_CONNECTIONS.inc()
             future = self._executor.submit(connection)
             future.add_done_callback(self._make_callback_shutdown_client())
 
@@ -118,15 +158,53 @@ class MineSweeperServer:
 
 
 class Connection:
+    """
+    A client of a server. Commands are pipelined: every command received and complete is processed in a batch,
+    and the replies to the batch are sent at once. A batch with several commands changing the board holds every
+    lock of the board once for the whole batch, so that its changes are applied together; other batches only take
+    the locks of the squares their commands touch, so that clients playing on different tiles of a board with lock
+    striping do not wait for each other. A batch ends after a command changing the board or the protocol of the
+    following commands (join, protocol) or ending the connection (bye). With collapse on, only the last board of
+    the replies to a batch is sent.\n
+    With watch on, the changes of the board are pushed to the client by a thread of its own, woken up by the
+    RoomWatchers of its room. Replies and pushed updates are sent under a lock of the connection, so that they
+    never interleave, and updates are never pushed in a protocol the client did not switch to yet.
+    """
+
+    RECEIVE_SIZE = 2 ** 16
+    # The maximum number of bytes of replies buffered for a client, before waiting for the client to read them
+    OUTPUT_LIMIT = BufferedSocketWriter.DEFAULT_LIMIT
+    # The commands after which the commands received next are processed in another batch
+    BATCH_END_TYPES = (UTSJoinMessage, UTSProtocolMessage, UTSByeMessage)
+    # The commands changing the board
+    MUTATING_TYPES = (UTSDigMessage, UTSFlagMessage, UTSDeflagMessage)
 
     def __init__(self, ms_server: MineSweeperServer, client: socket, debug=False):
         self.server = ms_server
-        self.board = self.server._board
+        self.room = self.board = None
         self.client: socket = client
+        # The encoding of the messages exchanged with the client, which can switch it with a "protocol" message
+        self.protocol = TEXT_PROTOCOL
+        self.collapse = False
+        # The (row, col, height, width) region of the board sent to the client, or None for the whole board
+        self.viewport = None
+        # The bytes received from the client and not processed yet, and the chunk the client socket is read into
+        self._buffer = bytearray()
+        self._chunk = memoryview(bytearray(self.RECEIVE_SIZE))
+        self._writer = BufferedSocketWriter(client, self.OUTPUT_LIMIT)
+        # The version of the board last pushed to the client while watching it (-1 before the first push, which is
+        # the whole board), and the thread pushing updates
+        self.watching = False
+        self._watch_version = -1
+        self._wake = Event()
+        self._pusher = None
+        self._send_lock = Lock()
 
         self.is_closed = False
         self.logger = getLogger(__name__)
 
+        self._join_room(RoomRegistry.DEFAULT_ROOM)
+
     def __repr__(self):
         return repr(self.client)
 
@@ -138,6 +216,15 @@ class Connection:
         return self.run()
 
     def run(self):
+        _QUEUED_CONNECTIONS.dec()
+        _CONNECTIONS.inc()
+
+        try:
+            self._run()
+        finally:
+            _CONNECTIONS.dec()
+
+    def _run(self):
         self.logger.debug("%s:%s connected", *self.client.getpeername())
 
         # TO-DO Could the line of code below be subject to a race condition?
@@ -145,26 +232,35 @@ class Connection:
         if self not in self.server.connections():
             connections += 1
 
-        self.client.send(
-            STUHelloMessage(connections).get_representation().encode()
-        )
+        self._send(STUHelloMessage(connections))
 
-        # TO-DO Verify open() is being used correctly
-        with open(self.client.fileno()) as stream:
-            in_message = UTSMessage.parse_infer_type(stream.readline())
+        try:
+            while True:
+                in_messages = self._next_batch()
 
-            while in_message is not None:
-                self.logger.debug("%s:%s: %s", *self.client.getpeername(), in_message)
+                if not in_messages:
+                    received = self.client.recv_into(self._chunk)
 
-                out_message = self._process_in_message(in_message)
-                self.client.send(out_message.get_representation().encode())
+                    # No data is only received at EOF, i.e. when the client closed the connection
+                    if not received:
+                        break
 
-                if isinstance(out_message, STUBoomMessage):
-                    in_message = None
-                elif isinstance(out_message, STUByeMessage):
-                    in_message = None
-                else:
-                    in_message = UTSMessage.parse_infer_type(stream.readline())
+                    self._buffer += self._chunk[:received]
+                    continue
+
+                for in_message in in_messages:
+                    self.logger.debug("%s:%s: %s", *self.client.getpeername(), in_message)
+
+                # Updates are only pushed once the replies to the batch were sent, in the protocol they switch to
+                with self._send_lock:
+                    out_messages = self._process_batch(in_messages)
+                    self._send(*out_messages)
+                    self._switch_protocol(out_messages[-1])
+
+                if isinstance(out_messages[-1], (STUBoomMessage, STUByeMessage)):
+                    break
+        except ProtocolError as e:
+            self.logger.debug("%s: %s", self, e)
 
     def close(self):
         if not self.is_closed:
@@ -177,18 +273,226 @@ class Connection:
                 except OSError:
                     pass
 
+            self._leave_room()
             self.is_closed = True
+            self._wake.set()
 
             self.logger.debug("'%s' closed", addrinfo)
 
     def is_debug_enabled(self):
         return NullHandler not in (type(h) for h in self.logger.handlers)
 
+    def wake(self):
+        """
+        Invoked by the RoomWatchers of the room whenever the board changed, while watching it. Never blocks.
+        """
+        self._wake.set()
+
+    def _send(self, *out_messages):
+        """
+        Sends **out_messages**, blocking until the client received all of them.
+        """
+        for out_message in out_messages:
+            self._writer.write(self._encode(out_message))
+
+        self._writer.flush()
+
+    def _encode(self, out_message):
+        """
+        :return: the segments of **out_message** in the protocol of the client, counted as sent.
+        """
+        segments = self.protocol.segments(out_message)
+        _SENT_BYTES.inc(sum(map(len, segments)))
+
+        return segments
+
+    def _peer_host(self):
+        return self.client.getpeername()[0]
+
+    def _next_batch(self):
+        """
+        Takes the commands received and complete out of the buffer, up to the end of a batch.
+        :return: a list of UTSMessage objects, empty if no command is complete.
+        """
+        in_messages, offset = list(), 0
+        parse_seconds = _PARSE_SECONDS[self.protocol.NAME]
+        start = perf_counter()
+
+        while not in_messages or not isinstance(in_messages[-1], self.BATCH_END_TYPES):
+            parsed = self.protocol.parse(self._buffer, offset)
+
+            if parsed is None:
+                break
+
+            in_message, offset = parsed
+            in_messages.append(in_message)
+            end = perf_counter()
+            parse_seconds.observe(end - start)
+            start = end
+
+        del self._buffer[:offset]
+
+        return in_messages
+
+    def _process_batch(self, in_messages):
+        """
+        Processes **in_messages**, stopping at the first one ending the game, while holding every lock of the board
+        if more than one of them changes the board.
+        :return: the list of the replies to send, in order. With collapse on when the batch starts, the board
+            replies but the last one are left out.
+        """
+        room, collapse = self.room, self.collapse
+        board, version = room.board, room.board.version()
+        out_messages = list()
+
+        mutations = sum(1 for in_message in in_messages if isinstance(in_message, self.MUTATING_TYPES))
+
+        # Without collapse, every board reply shows the board as left by its command, so snapshots are not deferred
+        with board.batch(deferred=collapse) if mutations > 1 else nullcontext():
+            for in_message in in_messages:
+                start = perf_counter()
+                out_messages.append(self._process_in_message(in_message))
+                _COMMAND_SECONDS[type(in_message)].observe(perf_counter() - start)
+
+                if isinstance(out_messages[-1], (STUBoomMessage, STUByeMessage)):
+                    break
+
+        if collapse:
+            boards = [i for i, out_message in enumerate(out_messages) if isinstance(out_message, STUBoardMessage)]
+
+            if boards:
+                # Taken after the batch, once its snapshot was published
+                out_messages[boards[-1]] = STUBoardMessage(board, self.viewport)
+                out_messages = [out_message for i, out_message in enumerate(out_messages)
+                                if i == boards[-1] or not isinstance(out_message, STUBoardMessage)]
+
+        if board.version() != version:
+            room.watchers.notify()
+
+        return out_messages
+
+    def _switch_protocol(self, out_message):
+        """
+        Switches to the protocol requested by the client once **out_message**, the reply to its request, was sent.
+        """
+        if isinstance(out_message, STUProtocolMessage):
+            self.protocol = PROTOCOLS[out_message.name]
+
+    def _join_room(self, room_id):
+        if self.watching:
+            self.room.watchers.unsubscribe(self)
+
+        self.room = self.server.rooms().join(room_id, self.room)
+        self.board = self.room.board
+        self._watch_version = -1
+
+        if self.watching:
+            self.room.watchers.subscribe(self)
+
+    def _leave_room(self):
+        if self.room is not None:
+            self.room.watchers.unsubscribe(self)
+            self.server.rooms().leave(self.room)
+            self.room = self.board = None
+
+    def _watch(self, enabled):
+        """
+        Starts or stops pushing the changes of the board to the client. The first update pushed is the whole board.
+        """
+        if enabled != self.watching:
+            self.watching = enabled
+
+            if enabled:
+                self._watch_version = -1
+                self._start_pushing()
+                self.room.watchers.subscribe(self)
+            else:
+                self.room.watchers.unsubscribe(self)
+
+    def _view(self, viewport):
+        """
+        Restricts the boards sent to the client to **viewport**. While watching, the region of the viewport is pushed
+        as a whole first.
+        """
+        self.viewport = viewport
+        self._watch_version = -1
+
+        if self.watching:
+            self._wake.set()
+
+    def _start_pushing(self):
+        if self._pusher is None:
+            self._pusher = Thread(target=self._push_forever, name="%s pusher" % self, daemon=True)
+            self._pusher.start()
+
+    def _push_forever(self):
+        """
+        Pushes an update to the client whenever woken up while watching, until the connection is closed. The
+        changes made while an update is being sent are pushed at once afterwards.
+        """
+        try:
+            while True:
+                self._wake.wait()
+                self._wake.clear()
+
+                if self.is_closed:
+                    break
+
+                with self._send_lock:
+                    segments = self._next_update() if self.watching else None
+
+                    if segments is not None:
+                        self._writer.write(segments)
+                        self._writer.flush()
+        except OSError as e:
+            self.logger.debug("%s: %s", self, e)
+
+    def _next_update(self):
+        """
+        :return: the encoded update bringing the client up to date, shared with the other watchers of the room at
+            the same version and using the same protocol, or None if the client is up to date.
+        """
+        room, protocol, viewport = self.room, self.protocol, self.viewport
+        update = room.watchers.update(self._watch_version, (protocol.NAME, viewport),
+                                      lambda version: self._render_update(room.board, protocol, version, viewport))
+
+        if update is None:
+            return None
+
+        self._watch_version, segments = update
+        _SENT_BYTES.inc(sum(map(len, segments)))
+
+        return segments
+
+    @staticmethod
+    def _render_update(board, protocol, version, viewport):
+        """
+        :return: a (version, segments) tuple, where segments encode in **protocol** the reply to "look since
+            **version**" with **viewport**, or the whole board (or viewport) if **version** is -1.
+        """
+        changes = board.changes_since(version) if version >= 0 else None
+
+        if changes is None:
+            message = STUBoardSnapshotMessage(board, viewport)
+
+            return message.snapshot.version, protocol.segments(message)
+
+        message = STUBoardDeltaMessage(*changes, viewport)
+
+        return message.version, protocol.segments(message)
+
     def _process_in_message(self, in_message):
         result = None
 
         if isinstance(in_message, UTSLookMessage):
-            result = STUBoardMessage(self.board)
+            result = STUBoardMessage(self.board, self.viewport)
+        elif isinstance(in_message, UTSLookSinceMessage):
+            changes = self.board.changes_since(in_message.version) if in_message.version > 0 else None
+
+            if changes is None:
+                result = STUBoardSnapshotMessage(self.board, self.viewport)
+            else:
+                result = STUBoardDeltaMessage(*changes, self.viewport)
         elif isinstance(in_message, UTSDigMessage):
             error = in_message.find_errors(self.board)
 
@@ -200,7 +504,7 @@ class Connection:
                     square.has_bomb = False
                     result = STUBoomMessage()
                 else:
-                    result = STUBoardMessage(self.board)
+                    result = STUBoardMessage(self.board, self.viewport)
             else:
                 result = STUErrorMessage(error)
         elif isinstance(in_message, UTSFlagMessage):
@@ -209,7 +513,7 @@ class Connection:
             if error is None:
                 self.board.set_state(in_message.row, in_message.col, State.FLAGGED)
 
-                result = STUBoardMessage(self.board)
+                result = STUBoardMessage(self.board, self.viewport)
             else:
                 result = STUErrorMessage(error)
         elif isinstance(in_message, UTSDeflagMessage):
@@ -221,9 +525,56 @@ class Connection:
                 if square.state == State.FLAGGED:
                     self.board.set_state(in_message.row, in_message.col, State.UNTOUCHED)
 
-                result = STUBoardMessage(self.board)
+                result = STUBoardMessage(self.board, self.viewport)
+            else:
+                result = STUErrorMessage(error)
+        elif isinstance(in_message, UTSJoinMessage):
+            error = in_message.find_errors(self.board)
+
+            if error is None:
+                self._join_room(in_message.room_id)
+
+                result = STUJoinMessage(self.room.id, self.room.players)
+            else:
+                result = STUErrorMessage(error)
+        elif isinstance(in_message, UTSProtocolMessage):
+            error = in_message.find_errors(self.board)
+
+            if error is None:
+                result = STUProtocolMessage(in_message.name)
             else:
                 result = STUErrorMessage(error)
+        elif isinstance(in_message, UTSCollapseMessage):
+            self.collapse = in_message.enabled
+
+            result = STUCollapseMessage(self.collapse)
+        elif isinstance(in_message, UTSWatchMessage):
+            self._watch(in_message.enabled)
+
+            result = STUWatchMessage(self.watching)
+        elif isinstance(in_message, UTSViewMessage):
+            error = in_message.find_errors(self.board)
+
+            if error is None:
+                self._view(in_message.viewport())
+
+                result = STUBoardMessage(self.board, self.viewport)
+            else:
+                result = STUErrorMessage(error)
+        elif isinstance(in_message, UTSHintMessage):
+            hint = self.room.solver.hint() if self.room.solver is not None else None
+
+            if hint is not None:
+                result = STUHintMessage(*hint)
+            elif self.room.solver is None:
+                result = STUErrorMessage(UTSHintMessage.ERROR_NO_SOLVER)
+            else:
+                result = STUErrorMessage(UTSHintMessage.ERROR_NO_SQUARE)
+        elif isinstance(in_message, UTSStatsMessage):
+            if ip_address(self._peer_host()).is_loopback:
+                result = STUStatsMessage(METRICS)
+            else:
+                result = STUErrorMessage(UTSStatsMessage.ERROR_NOT_ADMIN)
         elif isinstance(in_message, UTSHelpRequestMessage):
             result = STUHelpMessage()
         elif isinstance(in_message, UTSByeMessage):
@@ -234,12 +585,575 @@ class Connection:
         return result
 
 
+class AsyncMineSweeperServer:
+    """
+    A MineSweeperServer alternative serving every client from a single thread, through an asyncio event loop and
+    its streams. Idle clients only cost a pair of streams, so many more of them can be connected at the same time.
+    The board is only accessed by the thread running the event loop, and every message is processed without
+    yielding to other clients, so that board mutations stay atomic as with the threaded server.
+    """
+
+    DEFAULT_CONFIGS = {
+        "host": '',
+        "port": MineSweeperServer.DEFAULT_CONFIGS["port"],
+        "listen_backlog": 1024,
+        "max_clients": 10000
+    }
+
+    def __init__(self, board, port=DEFAULT_CONFIGS["port"], debug=False, max_clients=DEFAULT_CONFIGS["max_clients"],
+                 board_factory=None, journal=None):
+        self._board = board
+        self._rooms = RoomRegistry(board, board_factory, journal=journal)
+        self._port = port
+        self._connections = set()
+        self.max_clients = max_clients
+
+        self._server = None
+        self.is_closed = False
+
+        self._logger = getLogger(__name__)
+        self._logger.setLevel(DEBUG)
+        self._logger.addHandler(StreamHandler(stdout) if debug else NullHandler())
+
+    def __repr__(self):
+        repr_unknown = "unknown"
+
+        if self._server is not None and not self.is_closed:
+            host, port = self._server.sockets[0].getsockname()[:2]
+        else:
+            host = port = repr_unknown
+
+        return "<'%s.%s' object, host=%s, port=%s, debug=%s>" % \
+               (AsyncMineSweeperServer.__module__, self.__class__.__name__, host or repr_unknown, port,
+                self.is_debug_enabled())
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_client,
+            sock=self._listener(),
+            backlog=self.DEFAULT_CONFIGS["listen_backlog"]
+        )
+
+        self._logger.debug("Listening at port %d...", self.port())
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if not self.is_closed:
+            if self._server is not None:
+                self._server.close()
+
+            for connection in list(self._connections):
+                connection.close()
+
+            self._rooms.close()
+            self.is_closed = True
+
+            self._logger.debug("%s was closed" % repr(self))
+
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    def connections(self):
+        return self._connections
+
+    def rooms(self):
+        return self._rooms
+
+    def is_full(self):
+        return len(self._connections) >= self.max_clients
+
+    def is_local(self, room_id):
+        """
+        :return: True if the room **room_id** is hosted by this server, which hosts every room. Servers hosting some
+            rooms only transfer the clients joining the other ones with a hand_off(connection, room_id) method.
+        """
+        return True
+
+    def is_debug_enabled(self):
+        return NullHandler not in (type(h) for h in self._logger.handlers)
+
+    def _listener(self):
+        """
+        :return: the socket to accept clients from, bound as the one of MineSweeperServer, on IPv4 only.
+        """
+        listener = socket(AF_INET, SOCK_STREAM)
+        listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        listener.bind((self.DEFAULT_CONFIGS["host"], self._port))
+
+        return listener
+
+    async def _handle_client(self, reader, writer):
+        if self.is_full():
+            self._logger.debug("Reached maximum number of connections: %d/%d occupied",
+                               len(self._connections), self.max_clients)
+            _REJECTED_CONNECTIONS.inc()
+            writer.close()
+            return
+
+        await self._serve(reader, writer, RoomRegistry.DEFAULT_ROOM)
+
+    async def _serve(self, reader, writer, room_id, joined=False, protocol=TEXT_PROTOCOL, collapse=False,
+                     watching=False, viewport=None):
+        """
+        Serves a client in the room **room_id** until it disconnects.
+        :param joined: True if the client joined the room with a "join" message, to be replied to, rather than
+            connecting to the server.
+        :param protocol: the protocol used by the client.
+        :param collapse: True if the client turned collapse on.
+        :param watching: True if the client turned watch on.
+        :param viewport: the viewport of the client, or None.
+        """
+        connection = AsyncConnection(self, reader, writer, room_id, protocol)
+        connection.collapse = collapse
+        connection.viewport = viewport
+        connection._watch(watching)
+        self._connections.add(connection)
+        _CONNECTIONS.inc()
+        # drain() waits for the client whenever more than OUTPUT_LIMIT bytes of replies are buffered
+        writer.transport.set_write_buffer_limits(high=AsyncConnection.OUTPUT_LIMIT)
+
+        try:
+            await connection.run(STUJoinMessage(connection.room.id, connection.room.players) if joined else None)
+        except (ConnectionError, ProtocolError) as e:
+            self._logger.debug("%s: %s", connection, e)
+        finally:
+            self._connections.discard(connection)
+            _CONNECTIONS.dec()
+            connection.close()
+
+            self._logger.debug("Connection closed: %d/%d still running", len(self._connections), self.max_clients)
+
+
+class AsyncConnection(Connection):
+    """
+    A Connection served by an AsyncMineSweeperServer through a pair of asyncio streams. With watch on, updates are
+    pushed by a task of its own. Replies are written to the stream, and the protocol switched, before waiting for
+    the client to read them, so that updates written meanwhile never interleave with replies or use a stale
+    protocol.
+    """
+
+    def __init__(self, ms_server: AsyncMineSweeperServer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 room_id=RoomRegistry.DEFAULT_ROOM, protocol=TEXT_PROTOCOL):
+        self.server = ms_server
+        self.room = self.board = None
+        self.client = None
+        self.protocol = protocol
+        self.collapse = False
+        self.viewport = None
+        self._buffer = bytearray()
+        self.reader, self.writer = reader, writer
+        self.peername = writer.get_extra_info("peername")
+        self.watching = False
+        self._watch_version = -1
+        self._wake = asyncio.Event()
+        self._pusher = None
+
+        self.is_closed = False
+        self.logger = getLogger(__name__)
+
+        self._join_room(room_id)
+
+    def __repr__(self):
+        return "<'%s.%s' object, peer=%s>" % (self.__class__.__module__, self.__class__.__name__, self.peername)
+
+    async def run(self, greeting=None):
+        """
+        :param greeting: the first message to send to the client, a STUHelloMessage by default.
+        """
+        self.logger.debug("%s connected", self.peername)
+
+        await self._send(greeting or STUHelloMessage(len(self.server.connections())))
+
+        while True:
+            in_messages = self._next_batch()
+
+            if not in_messages:
+                data = await self.reader.read(self.RECEIVE_SIZE)
+
+                # No data is only returned at EOF, i.e. when the client closed the connection
+                if not data:
+                    break
+
+                self._buffer += data
+                continue
+
+            for in_message in in_messages:
+                self.logger.debug("%s: %s", self.peername, in_message)
+
+            # A join ends a batch, so that it can only be the last command of the batch
+            last = in_messages[-1]
+            hand_off = isinstance(last, UTSJoinMessage) and last.find_errors(self.board) is None and \
+                not self.server.is_local(last.room_id)
+
+            out_messages = self._process_batch(in_messages[:-1] if hand_off else in_messages)
+
+            if out_messages:
+                self._write(*out_messages)
+                self._switch_protocol(out_messages[-1])
+                await self.writer.drain()
+
+                if isinstance(out_messages[-1], (STUBoomMessage, STUByeMessage)):
+                    break
+
+            if hand_off:
+                # The replies sent by the worker receiving the client must not overtake the ones buffered here, and
+                # the bytes received from the client must not be read here once they are handed off
+                await self._flush()
+                self.writer.transport.pause_reading()
+
+                if self.server.hand_off(self, last.room_id):
+                    break
+
+                # Kept by this worker, in its room
+                self.writer.transport.resume_reading()
+                await self._send(STUErrorMessage(UTSJoinMessage.ERROR_NOT_JOINED % last.room_id))
+
+    def close(self):
+        if not self.is_closed:
+            if self._pusher is not None:
+                self._pusher.cancel()
+
+            self.writer.close()
+            self._leave_room()
+            self.is_closed = True
+
+            self.logger.debug("'%s' closed", self.peername)
+
+    def pending(self):
+        """
+        :return: the bytes received from the client and not processed yet, or None if they cannot be known.
+        """
+        # asyncio offers no public way to take the bytes buffered by a StreamReader back: this depends on the
+        # private StreamReader._buffer, a bytearray in every CPython release with asyncio streams. Without it, the
+        # client is not handed off.
+        buffered = getattr(self.reader, "_buffer", None)
+
+        if not isinstance(buffered, bytearray):
+            return None
+
+        return bytes(self._buffer) + bytes(buffered)
+
+    async def _flush(self):
+        """
+        Waits until every byte written to the client is passed to the kernel, whereas drain() returns as soon as
+        the write buffer of the transport is below its high-water mark.
+        """
+        transport = self.writer.transport
+        low, high = transport.get_write_buffer_limits()
+        # With no high-water mark, drain() waits until the buffer is empty
+        transport.set_write_buffer_limits(0)
+
+        try:
+            # Updates pushed meanwhile are flushed as well
+            while transport.get_write_buffer_size():
+                await self.writer.drain()
+        finally:
+            transport.set_write_buffer_limits(high, low)
+
+    async def _send(self, *out_messages):
+        self._write(*out_messages)
+        await self.writer.drain()
+
+    def _write(self, *out_messages):
+        for out_message in out_messages:
+            self.writer.writelines(self._encode(out_message))
+
+    def _peer_host(self):
+        return self.peername[0]
+
+    def _start_pushing(self):
+        if self._pusher is None:
+            self._pusher = asyncio.ensure_future(self._push_forever())
+
+    async def _push_forever(self):
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+
+                segments = self._next_update() if self.watching else None
+
+                if segments is not None:
+                    self.writer.writelines(segments)
+                    await self.writer.drain()
+        except ConnectionError as e:
+            self.logger.debug("%s: %s", self, e)
+
+
+class WorkerMineSweeperServer(AsyncMineSweeperServer):
+    """
+    An AsyncMineSweeperServer run by one of the worker processes of a PreforkSupervisor. Rooms are partitioned
+    among workers by a hash of their id. Clients are accepted by whichever worker the kernel picks, and a client
+    which joins a room hosted by another worker (every client starts in the default room) is handed off to it:
+    the client socket is passed over a Unix datagram socket, together with the bytes already read from it.
+    """
+
+    HANDOFF_HELLO = "hello"
+    HANDOFF_JOIN = "join"
+    # Maximum size of a hand-off datagram: the header line and the bytes read from the client but not processed.
+    # A client with more bytes pending is not handed off.
+    HANDOFF_SIZE = 2 ** 18
+
+    def __init__(self, board, port, debug, board_factory, worker, handoffs, listener=None, journal=None):
+        """
+        :param worker: the index of this worker.
+        :param handoffs: a list with a (send, receive) pair of Unix datagram sockets for every worker, used to
+            hand off clients to it.
+        :param listener: a listening socket inherited from the supervisor, or None to bind a new one with
+            SO_REUSEPORT.
+        :param journal: a BoardJournal of the rooms of this worker only, or None.
+        """
+        super().__init__(board, port, debug, board_factory=board_factory, journal=journal)
+        self.worker = worker
+        self._handoffs = handoffs
+        self._inherited_listener = listener
+
+    async def start(self):
+        await super().start()
+        asyncio.get_running_loop().add_reader(self._handoffs[self.worker][1], self._receive_handoff)
+
+    def owner(self, room_id):
+        """
+        :return: the index of the worker hosting the room **room_id**. crc32 is used rather than hash(), which is
+            salted differently by every Python process.
+        """
+        return crc32(room_id.encode()) % len(self._handoffs)
+
+    def is_local(self, room_id):
+        return self.owner(room_id) == self.worker
+
+    def hand_off(self, connection, room_id):
+        """
+        Transfers **connection** to the worker hosting the room **room_id**, which is not hosted by this worker.
+        :return: True if the connection was transferred, False if it is kept by this worker, because the bytes it
+            received and did not process yet are unknown or do not fit in a hand-off, or the hand-off could not be
+            sent.
+        """
+        pending = connection.pending()
+
+        if pending is None:
+            self._logger.debug("Worker %d: %s not handed off: the bytes pending are unknown", self.worker, connection)
+            return False
+
+        return self._send_handoff(connection.writer, self.HANDOFF_JOIN, room_id, connection.protocol, pending,
+                                  connection.collapse, connection.watching, connection.viewport)
+
+    def _listener(self):
+        if self._inherited_listener is not None:
+            return self._inherited_listener
+
+        # SO_REUSEPORT has to be set before binding
+        listener = socket(AF_INET, SOCK_STREAM)
+        listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        listener.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        listener.bind((self.DEFAULT_CONFIGS["host"], self._port))
+
+        return listener
+
+    async def _handle_client(self, reader, writer):
+        if self.is_local(RoomRegistry.DEFAULT_ROOM):
+            await super()._handle_client(reader, writer)
+        else:
+            # A client which cannot be handed off is closed, as this worker does not host the default room
+            self._send_handoff(writer, self.HANDOFF_HELLO, RoomRegistry.DEFAULT_ROOM, TEXT_PROTOCOL, b"")
+            writer.close()
+
+    def _send_handoff(self, writer, kind, room_id, protocol, pending, collapse=False, watching=False, viewport=None):
+        """
+        Passes the client socket of **writer** to the worker hosting **room_id**, with the options of the client.
+        The socket is closed by this worker afterwards, which does not end the connection, still open in the
+        receiving worker.
+        :return: True if the socket was passed, False if the hand-off exceeds HANDOFF_SIZE, or could not be sent.
+        """
+        header = ("%s %s %s %d %d %s\n" % (kind, room_id, protocol.NAME, collapse, watching,
+                                           ",".join(map(str, viewport)) if viewport is not None else "-")).encode()
+        peername = writer.get_extra_info("peername")
+
+        if len(header) + len(pending) > self.HANDOFF_SIZE:
+            self._logger.debug("Worker %d: %s not handed off to worker %d: %d bytes pending", self.worker, peername,
+                               self.owner(room_id), len(pending))
+            return False
+
+        try:
+            send_fds(self._handoffs[self.owner(room_id)][0], [header + pending],
+                     [writer.get_extra_info("socket").fileno()])
+        except OSError as e:
+            self._logger.debug("Worker %d: %s not handed off to worker %d: %s", self.worker, peername,
+                               self.owner(room_id), e)
+            return False
+
+        self._logger.debug("Worker %d: handed off %s to worker %d", self.worker, peername, self.owner(room_id))
+
+        return True
+
+    def _receive_handoff(self):
+        """
+        Adopts the client of a hand-off received from another worker. A hand-off which is truncated, malformed or
+        does not carry exactly one socket is discarded, and every socket it carries is closed.
+        """
+        try:
+            message, fds, flags, address = recv_fds(self._handoffs[self.worker][1], self.HANDOFF_SIZE, 1)
+        except OSError as e:
+            self._logger.debug("Worker %d: hand-off not received: %s", self.worker, e)
+            return
+
+        try:
+            if flags & (MSG_TRUNC | MSG_CTRUNC) or len(fds) != 1:
+                raise ValueError("truncated, or carrying %d sockets" % len(fds))
+
+            header, pending = message.split(b"\n", 1)
+            kind, room_id, protocol, collapse, watching, viewport = header.decode().split(" ")
+
+            if kind not in (self.HANDOFF_HELLO, self.HANDOFF_JOIN) or protocol not in PROTOCOLS:
+                raise ValueError("unknown kind '%s' or protocol '%s'" % (kind, protocol))
+
+            viewport = tuple(map(int, viewport.split(","))) if viewport != "-" else None
+
+            if viewport is not None and len(viewport) != 4:
+                raise ValueError("viewport of %d values" % len(viewport))
+        except ValueError as e:
+            self._logger.debug("Worker %d: bad hand-off discarded: %s", self.worker, e)
+
+            for fd in fds:
+                close_fd(fd)
+
+            return
+
+        asyncio.ensure_future(self._adopt(socket(fileno=fds[0]), room_id, kind == self.HANDOFF_JOIN,
+                                          PROTOCOLS[protocol], pending, collapse == "1", watching == "1", viewport))
+
+    async def _adopt(self, client, room_id, joined, protocol, pending, collapse=False, watching=False,
+                     viewport=None):
+        """
+        Serves a client handed off by another worker. The bytes it read from the client are fed to the reader before
+        the socket is attached to the event loop, so that they are processed first.
+        """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        reader.feed_data(pending)
+        stream_protocol = asyncio.StreamReaderProtocol(reader)
+        transport, stream_protocol = await loop.connect_accepted_socket(lambda: stream_protocol, client)
+        writer = asyncio.StreamWriter(transport, stream_protocol, reader, loop)
+
+        await self._serve(reader, writer, room_id, joined, protocol, collapse, watching, viewport)
+
+
+class PreforkSupervisor:
+    """
+    Runs a WorkerMineSweeperServer in each of **workers** forked processes, so that clients are served by every
+    CPU core. Workers share the listening port through SO_REUSEPORT, or through a listening socket inherited from
+    the supervisor where SO_REUSEPORT is not available. Rooms are partitioned among workers (see
+    WorkerMineSweeperServer). The supervisor restarts every worker which exits; the rooms hosted by a crashed
+    worker are lost, and created again on demand, unless they are journaled: every worker then journals its rooms
+    to a directory of its own, and a restarted worker restores them.
+    """
+
+    RESTART_DELAY = 1
+
+    def __init__(self, board_factory, port=MineSweeperServer.DEFAULT_CONFIGS["port"], debug=False,
+                 workers=cpu_count(), metrics_file=None, journal_directory=None, tile_size=None):
+        """
+        :param metrics_file: the path of a file to which every worker writes its metrics, with the index of the
+            worker inserted before the extension, or None.
+        :param journal_directory: the path of a directory with a subdirectory journaling the rooms of every worker,
+            named after the index of the worker, or None. The rooms of a worker are restored from the same
+            subdirectory only as long as the number of workers does not change.
+        :param tile_size: the tile size of the boards restored from the journal, as in Board.
+        """
+        self._board_factory = board_factory
+        self._port = port
+        self._metrics_file = metrics_file
+        self._journal_directory = journal_directory
+        self._tile_size = tile_size
+        self._debug = debug
+        self.workers = workers
+
+        # A logger of its own, whose handler is not inherited by the loggers of the forked workers
+        self._logger = getLogger(__name__ + ".supervisor")
+        self._logger.propagate = False
+        self._logger.setLevel(DEBUG)
+        self._logger.addHandler(StreamHandler(stdout) if debug else NullHandler())
+
+    def run(self):
+        # Created before forking, so that a restarted worker inherits the same sockets, and the hand-offs queued
+        # while it was down. Hand-offs are sent without blocking: a client is kept by its worker while the queue of
+        # the other worker is full.
+        handoffs = [socketpair(AF_UNIX, SOCK_DGRAM) for i in range(self.workers)]
+
+        for send, receive in handoffs:
+            send.setblocking(False)
+        listener = None
+
+        if not hasattr(socket_module, "SO_REUSEPORT"):
+            listener = socket(AF_INET, SOCK_STREAM)
+            listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            listener.bind((MineSweeperServer.DEFAULT_CONFIGS["host"], self._port))
+            listener.listen(AsyncMineSweeperServer.DEFAULT_CONFIGS["listen_backlog"])
+
+        context = get_context("fork")
+        processes = dict()
+
+        def start(worker):
+            process = context.Process(target=self._run_worker, args=(worker, handoffs, listener), daemon=True)
+            process.start()
+            processes[worker] = process
+
+            self._logger.debug("Worker %d started (pid %d)", worker, process.pid)
+
+        for i in range(self.workers):
+            start(i)
+
+        try:
+            while True:
+                wait([process.sentinel for process in processes.values()])
+
+                for worker, process in list(processes.items()):
+                    if not process.is_alive():
+                        self._logger.debug("Worker %d exited with code %s, restarting it...", worker, process.exitcode)
+                        process.join()
+                        sleep(self.RESTART_DELAY)
+                        start(worker)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes.values():
+                process.terminate()
+                process.join()
+
+    def _run_worker(self, worker, handoffs, listener):
+        journal = None
+
+        if self._journal_directory is not None:
+            journal = BoardJournal(join(self._journal_directory, str(worker)), tile_size=self._tile_size)
+
+        server = WorkerMineSweeperServer(self._board_factory(), self._port, self._debug, self._board_factory,
+                                         worker, handoffs, listener, journal)
+
+        if self._metrics_file is not None:
+            root, extension = splitext(self._metrics_file)
+            MetricsFileWriter(METRICS, "%s.%d%s" % (root, worker, extension)).start()
+
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+
+
 def main():
     configs = {
         "size": 10,
         "port": MineSweeperServer.DEFAULT_CONFIGS["port"],
         "program_name": "Minesweeper server",
         "bomb_probability": 0.20,
+        "tile_size": 32,
         "sleep": 2,
     }
     logger = getLogger(__name__)
@@ -249,27 +1163,79 @@ def main():
                     required=True, help="Debug flag for server")
     ap.add_argument("-p", "--port", dest="port", action="store", type=int,
                     default=configs["port"], help="Local port where to bind the server")
+    ap.add_argument("-m", "--mode", dest="mode", action="store", choices=("threaded", "asyncio", "prefork"),
+                    default="threaded", help="Serve clients from a thread pool, from a single asyncio event loop, or "
+                                             "from an asyncio event loop in each of a number of worker processes")
+    ap.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=cpu_count(),
+                    help="Number of worker processes in prefork mode")
+    ap.add_argument("--metrics-file", dest="metrics_file", action="store", type=str,
+                    help="Path of a file to write the metrics of the server to, in the Prometheus text format, every "
+                         "%d seconds" % MetricsFileWriter.DEFAULT_INTERVAL)
+    ap.add_argument("--journal", dest="journal", action="store", type=str,
+                    help="Path of a directory to journal the boards of the rooms to, and to restore them from when "
+                         "the server starts")
+    ap.add_argument("-t", "--tile-size", dest="tile_size", action="store", type=int, default=configs["tile_size"],
+                    help="Size of the square tiles of the boards, each guarded by a lock of its own, so that players "
+                         "on different tiles do not wait for each other, or 0 for a single lock per board")
 
     creation_group = ap.add_mutually_exclusive_group()
     creation_group.add_argument("-s", "--size", dest="size", action="store", type=int,
                                 help="Value of the height and width of the grid")
     creation_group.add_argument("-f", "--file", dest="file", action="store", type=str,
-                                help="Path pointing to a board file")
+                                help="Path pointing to a board file, in the text format or in the packed binary "
+                                     "format written by Board.save")
+    creation_group.add_argument("--chunked", dest="chunked", action="store", type=int, nargs="?",
+                                const=ChunkedBoard.DEFAULT_CHUNK_SIZE, metavar="CHUNK_SIZE",
+                                help="Play on unbounded boards, generated lazily in chunks of CHUNK_SIZE x CHUNK_SIZE "
+                                     "squares (%d by default)" % ChunkedBoard.DEFAULT_CHUNK_SIZE)
 
     arguments = ap.parse_args(argv[1:])
 
+    if arguments.chunked is not None and arguments.journal is not None:
+        ap.error("chunked boards cannot be journaled")
+    if arguments.tile_size < 0:
+        ap.error("the tile size must be 0 or greater")
+
+    tile_size = arguments.tile_size or None
+
     if arguments.size is not None:
-        board = Board.create_from_probability(
-            arguments.size,
-            arguments.size,
-            configs["bomb_probability"]
-        )
+        def board_factory():
+            return Board.create_from_probability(arguments.size, arguments.size, configs["bomb_probability"],
+                                                 tile_size=tile_size)
     elif arguments.file is not None:
-        board = Board.create_from_file(arguments.file)
+        def board_factory():
+            return Board.create_from_file(arguments.file, tile_size)
+    elif arguments.chunked is not None:
+        def board_factory():
+            return ChunkedBoard(bomb_probability=configs["bomb_probability"], chunk_size=arguments.chunked)
     else:
-        board = Board.create_from_probability(configs["size"], configs["size"])
+        def board_factory():
+            return Board.create_from_probability(configs["size"], configs["size"], tile_size=tile_size)
+
+    if arguments.mode == "prefork":
+        PreforkSupervisor(board_factory, arguments.port, arguments.debug, arguments.workers,
+                          arguments.metrics_file, arguments.journal, tile_size).run()
+        return
+
+    if arguments.metrics_file is not None:
+        MetricsFileWriter(METRICS, arguments.metrics_file).start()
+
+    board = board_factory()
+    journal = BoardJournal(arguments.journal, tile_size=tile_size) if arguments.journal is not None else None
+
+    if arguments.mode == "asyncio":
+        server = AsyncMineSweeperServer(board, arguments.port, arguments.debug, board_factory=board_factory,
+                                        journal=journal)
+
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+        server.close()
+        return
 
-    server = MineSweeperServer(board, arguments.port, arguments.debug)
+    server = MineSweeperServer(board, arguments.port, arguments.debug, board_factory, journal)
 
     while True:
         try:
@@ -0,0 +1,311 @@
+"""
+A headless runner of simulated games, to tune the difficulties of the boards: games are played directly against
+Board by a player strategy, with no server in between, in batches spread across a pool of processes. Every game is
+seeded from the seed of the run and its number, so that a run is reproducible whatever the number of processes.
+Only aggregated results are kept: every batch returns the counts and the histograms of its games, which are written
+to a JSON lines file as soon as the batch is done, and merged into the totals of the run.
+Run from the minesweeper package directory, e.g.:
+    python simulation.py --difficulty hard --strategy solver --games 100000 --output hard.jsonl
+    python simulation.py --difficulty 10,10,0 --probability 0.2 --games 100000
+"""
+import json
+from argparse import ArgumentParser
+from collections import Counter
+from multiprocessing import get_context
+from os import cpu_count
+from random import Random
+from time import perf_counter
+
+from board import Board, CELL_REPRESENTATIONS, State
+from solver import BoardSolver
+
+_UNTOUCHED = CELL_REPRESENTATIONS.index(State.UNTOUCHED.representation)
+
+DIFFICULTIES = {
+    "easy": Board.DIFF_EASY,
+    "intermediate": Board.DIFF_INTERMEDIATE,
+    "hard": Board.DIFF_HARD,
+}
+
+
+class RandomStrategy:
+    """
+    Digs an untouched square drawn at random, a baseline for the other strategies.\n
+    Strategies are created for every game with its board and the random generator of the game, and are asked for
+    the (row, col) of the square to dig next by move, or None to give up. They are passed to the processes of a pool
+    by reference, so they must be classes defined at the top level of a module.
+    """
+
+    def __init__(self, board, random):
+        self._board = board
+        self._random = random
+
+    def move(self):
+        untouched = [index for index, code in enumerate(self._board.snapshot().codes()) if code == _UNTOUCHED]
+
+        if not untouched:
+            return None
+
+        return divmod(self._random.choice(untouched), self._board.width())
+
+
+class SolverStrategy:
+    """
+    Digs the square hinted by a BoardSolver: a square proven safe, or else the one least likely to be mined.
+    """
+
+    def __init__(self, board, random):
+        self._solver = BoardSolver(board)
+
+    def move(self):
+        hint = self._solver.hint()
+
+        return hint[:2] if hint is not None else None
+
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "solver": SolverStrategy,
+}
+
+
+class SimulationResults:
+    """
+    The aggregated results of a number of games: the games won, the moves played, i.e. the squares dug, and the
+    histograms of the moves of every game and of the size of every reveal cascade, i.e. the number of squares turned
+    into DUG by a move which did not hit a mine. The size of the histograms is bounded by the size of the boards,
+    whatever the number of games.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.moves = 0
+        self.seconds = 0.0
+        self.moves_histogram = Counter()
+        self.cascades_histogram = Counter()
+
+    def __repr__(self):
+        return "<'%s.%s' object, games=%d, wins=%d, moves=%d>" % \
+               (self.__module__, type(self).__name__, self.games, self.wins, self.moves)
+
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    def mean_moves(self):
+        return self.moves / self.games if self.games else 0.0
+
+    def mean_cascade(self):
+        cascades = sum(self.cascades_histogram.values())
+
+        return sum(size * count for size, count in self.cascades_histogram.items()) / cascades if cascades else 0.0
+
+    def add_game(self, won, moves, cascades):
+        """
+        :param won: whether the game was won.
+        :param moves: the number of squares dug.
+        :param cascades: the number of squares revealed by every move which did not hit a mine.
+        """
+        self.games += 1
+        self.wins += 1 if won else 0
+        self.moves += moves
+        self.moves_histogram[moves] += 1
+        self.cascades_histogram.update(cascades)
+
+    def merge(self, other):
+        """
+        Adds the games of the **other** SimulationResults to these ones.
+        """
+        self.games += other.games
+        self.wins += other.wins
+        self.moves += other.moves
+        self.seconds += other.seconds
+        self.moves_histogram.update(other.moves_histogram)
+        self.cascades_histogram.update(other.cascades_histogram)
+
+    def to_dict(self):
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "win_rate": self.win_rate(),
+            "moves": self.moves,
+            "mean_moves": self.mean_moves(),
+            "mean_cascade": self.mean_cascade(),
+            "seconds": self.seconds,
+            "moves_histogram": {str(moves): count for moves, count in sorted(self.moves_histogram.items())},
+            "cascades_histogram": {str(size): count for size, count in sorted(self.cascades_histogram.items())},
+        }
+
+
+def create_board(difficulty, seed, bomb_probability=None):
+    """
+    :param difficulty: a (height, width, mines) tuple.
+    :param seed: the seed of the mines.
+    :param bomb_probability: the probability of a square being mined, replacing the number of mines of
+        **difficulty** if not None.
+    :return: a new Board, its center and the neighbours of its center being free of mines, the center being the
+        first square dug by play_game.
+    """
+    height, width, mines = difficulty
+    center = (height // 2, width // 2)
+
+    if bomb_probability is not None:
+        return Board.create_from_probability(height, width, bomb_probability, seed=seed, safe=center)
+
+    return Board.create_from_difficulty(difficulty, seed=seed, safe=center)
+
+
+def play_game(difficulty, seed, strategy, bomb_probability=None):
+    """
+    Plays a game on a new board: the center of the board is dug, then the squares returned by the moves of
+    **strategy**, until every square free of mines is dug, a mine is dug, or the strategy gives up.
+    :param seed: the seed of the game, which the board and the random generator of the strategy are drawn from.
+    :param strategy: a strategy class, e.g. RandomStrategy.
+    :return: a (won, moves, cascades) tuple, as in SimulationResults.add_game.
+    """
+    random = Random(seed)
+    board = create_board(difficulty, random.getrandbits(64), bomb_probability)
+    player = strategy(board, random)
+    left = board.height() * board.width() - board.mines_count()
+    square = (board.height() // 2, board.width() // 2)
+    cascades = list()
+
+    while square is not None:
+        revealed = board.set_state(square[0], square[1], State.DUG)
+
+        if board.square(*square).has_bomb:
+            return False, len(cascades) + 1, cascades
+
+        cascades.append(len(revealed))
+        left -= len(revealed)
+
+        if left == 0:
+            return True, len(cascades), cascades
+
+        square = player.move()
+
+    return False, len(cascades), cascades
+
+
+def play_batch(difficulty, seed, first, games, strategy, bomb_probability=None):
+    """
+    Plays the games numbered from **first** to **first** + **games** - 1 of a run.
+    :param seed: the seed of the run, every game being seeded from it and the number of the game.
+    :return: the SimulationResults of the games.
+    """
+    results = SimulationResults()
+    start = perf_counter()
+
+    for game in range(first, first + games):
+        results.add_game(*play_game(difficulty, "%d %d" % (seed, game), strategy, bomb_probability))
+
+    results.seconds = perf_counter() - start
+
+    return results
+
+
+def _play_batch(arguments):
+    return play_batch(*arguments)
+
+
+def simulate(difficulty, games, strategy=SolverStrategy, seed=0, bomb_probability=None, processes=None,
+             batch_size=1000, output=None):
+    """
+    Plays **games** games, in batches of **batch_size** games spread across a pool of **processes** processes.
+    :param output: a text file to write the results to as JSON lines, or None: the configuration of the run first,
+        then the results of every batch, in the order of the batches, as soon as they are done, then the totals.
+    :param processes: the number of processes of the pool, the number of CPUs by default. The batches are played by
+        the calling process if 1.
+    :return: the SimulationResults of every game.
+    """
+    processes = processes or cpu_count()
+    batches = [(difficulty, seed, first, min(batch_size, games - first), strategy, bomb_probability)
+               for first in range(0, games, batch_size)]
+    totals = SimulationResults()
+    start = perf_counter()
+
+    if output is not None:
+        json.dump({"kind": "config", "difficulty": difficulty, "bomb_probability": bomb_probability,
+                   "strategy": strategy.__name__, "seed": seed, "games": games, "batch_size": batch_size}, output)
+        output.write("\n")
+
+    def collect(results):
+        for number, batch in enumerate(results):
+            totals.merge(batch)
+
+            if output is not None:
+                json.dump(dict(kind="batch", batch=number, first=batches[number][2], **batch.to_dict()), output)
+                output.write("\n")
+                output.flush()
+
+    if processes == 1:
+        collect(_play_batch(batch) for batch in batches)
+    else:
+        with get_context().Pool(processes) as pool:
+            collect(pool.imap(_play_batch, batches))
+
+    if output is not None:
+        json.dump(dict(kind="total", elapsed=perf_counter() - start, **totals.to_dict()), output)
+        output.write("\n")
+
+    return totals
+
+
+def parse_difficulty(difficulty):
+    """
+    :param difficulty: the name of a difficulty, e.g. "hard", or a height,width,mines triple, e.g. "16,30,99".
+    :return: a (height, width, mines) tuple.
+    """
+    if difficulty in DIFFICULTIES:
+        return DIFFICULTIES[difficulty]
+
+    height, width, mines = (int(value) for value in difficulty.split(","))
+
+    return height, width, mines
+
+
+def main():
+    configs = {
+        "difficulty": "intermediate",
+        "strategy": "solver",
+        "games": 10000,
+        "batch_size": 1000,
+        "seed": 0,
+    }
+
+    ap = ArgumentParser("Minesweeper simulation")
+    ap.add_argument("--difficulty", type=parse_difficulty, default=configs["difficulty"],
+                    help="One of %s, or a height,width,mines triple" % ", ".join(DIFFICULTIES))
+    ap.add_argument("--probability", type=float,
+                    help="Probability of a square being mined, replacing the number of mines of the difficulty")
+    ap.add_argument("--strategy", choices=sorted(STRATEGIES), default=configs["strategy"],
+                    help="Strategy of the player")
+    ap.add_argument("-n", "--games", type=int, default=configs["games"], help="Number of games to play")
+    ap.add_argument("-b", "--batch-size", type=int, default=configs["batch_size"],
+                    help="Number of games of every batch sent to a process")
+    ap.add_argument("-w", "--processes", type=int, default=cpu_count(), help="Number of processes of the pool")
+    ap.add_argument("--seed", type=int, default=configs["seed"], help="Seed of the run")
+    ap.add_argument("-o", "--output", help="Path of a file to write the results to, as JSON lines")
+    arguments = ap.parse_args()
+
+    if arguments.games <= 0 or arguments.batch_size <= 0:
+        ap.error("The number of games and the batch size must be greater than 0")
+
+    output = open(arguments.output, "w") if arguments.output is not None else None
+
+    try:
+        start = perf_counter()
+        results = simulate(arguments.difficulty, arguments.games, STRATEGIES[arguments.strategy], arguments.seed,
+                           arguments.probability, arguments.processes, arguments.batch_size, output)
+        elapsed = perf_counter() - start
+    finally:
+        if output is not None:
+            output.close()
+
+    print("%-10s %10s %10s %12s %14s %10s" % ("games", "win rate", "moves", "cascade", "games/s", "seconds"))
+    print("%-10d %10.4f %10.2f %12.2f %14.1f %10.2f" % (results.games, results.win_rate(), results.mean_moves(),
+                                                        results.mean_cascade(), results.games / elapsed, elapsed))
+
+
+if __name__ == "__main__":
+    main()
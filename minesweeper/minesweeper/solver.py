@@ -0,0 +1,450 @@
+"""
+A solver of boards, for hints and bots. The solver reads the squares as the players see them, never the mines, and
+keeps its view of a board up to date from the change log of the board, rather than parsing and scanning the whole
+board after every move.
+"""
+from threading import Lock
+
+from board import CELL_REPRESENTATIONS, Square, State, _count_neighbours
+
+# The codes of the squares, as in CELL_REPRESENTATIONS: 0 to 8 for a dug square with as many mined neighbours
+_UNTOUCHED = CELL_REPRESENTATIONS.index(State.UNTOUCHED.representation)
+_FLAGGED = CELL_REPRESENTATIONS.index(State.FLAGGED.representation)
+_MINE = CELL_REPRESENTATIONS.index(Square.REPR_BOMB)
+_SQUARE_CODES = {representation: code for code, representation in enumerate(CELL_REPRESENTATIONS)}
+# Translation tables from codes to 1 for undug squares, untouched or flagged, and to 1 for numbered dug squares
+_UNDUG = bytes(1 if code in (_UNTOUCHED, _FLAGGED) else 0 for code in range(256))
+_NUMBERED = bytes(1 if code < _UNTOUCHED else 0 for code in range(256))
+_NONZERO = bytes(1 if code else 0 for code in range(256))
+
+
+def _ones(mask):
+    """
+    :return: the number of bits set in **mask**.
+    """
+    return bin(mask).count("1")
+
+
+def _bits(mask):
+    """
+    :return: the bits set in **mask**, each as an int with that bit only.
+    """
+    while mask:
+        bit = mask & -mask
+        yield bit
+        mask ^= bit
+
+
+class BoardSolver:
+    """
+    Finds the squares of a Board to dig next, from what the players see.\n
+    Frontier: the numbered dug squares with undug neighbours. Every square of the frontier is a constraint: its undug
+    neighbours hold as many mines as its number, less the mines dug around it. Flags are placed by the players, and
+    may be wrong: flagged squares are undug squares like the untouched ones, but they are never hinted. The view of
+    the board and its frontier are updated with the squares changed since the previous hint, as returned by
+    Board.changes_since, and only rebuilt from a snapshot when the change log no longer holds them.\n
+    Solving: the constraints are split into connected components, those sharing undug squares, and the squares of a
+    component are numbered, so that the squares of a constraint are an int with a bit set for every square.
+    Constraint propagation finds the squares which are safe or mined in every solution, with bitwise operations:
+    a constraint without mines left makes its squares safe, one with as many mines as squares makes them mined, and a
+    constraint included in another one leaves the difference of their mines in the difference of their squares. The
+    squares left ambiguous are split into components again, and the solutions of the components of at most
+    MAX_ENUMERATED squares are enumerated, weighting every solution by the density of the mines left, to find the
+    probability of every square being mined. The larger components are estimated from their constraints only.\n
+    The squares found safe stay safe whatever is dug afterwards, as the servers only ever remove mines: they are
+    kept to answer the next hints, until none is left untouched.\n
+    Thread safety: a hint holds every lock of the board, then the lock of the solver, so that the view of the
+    solver never lags behind a command processed at the same time.
+    """
+    # The largest number of squares of a component whose solutions are enumerated
+    MAX_ENUMERATED = 16
+
+    def __init__(self, board):
+        self._board = board
+        self._lock = Lock()
+        self._width = board.width()
+        # The view of the board: the code of every square at self._version, or None before the first hint
+        self._codes = None
+        self._version = None
+        # The flat indices of the squares of the frontier
+        self._frontier = set()
+        # The number of mines of the board, the undug squares and the mines dug, in the view
+        self._mines = 0
+        self._undug = 0
+        self._mines_dug = 0
+        # The untouched squares found safe, the smallest index last
+        self._safe = list()
+        # The squares of the frontier in the components left ambiguous by propagation, mapped to the (members,
+        # indices, mined, constraints) tuple of their component (see _solve)
+        self._ambiguous = dict()
+
+    def __repr__(self):
+        with self._lock:
+            return "<'%s.%s' object, version=%s, frontier=%d, safe=%d>" % \
+                   (self.__class__.__module__, self.__class__.__name__, self._version, len(self._frontier),
+                    len(self._safe))
+
+    def hint(self):
+        """
+        :return: a (row, col, probability) tuple: an untouched square proven safe, with a probability of 0, or else
+            the untouched square least likely to be mined, with the probability estimated. None is returned if no
+            square is left untouched.
+        """
+        with self._board.batch(), self._lock:
+            self._update()
+
+            while self._safe:
+                index = self._safe.pop()
+
+                if self._codes[index] == _UNTOUCHED:
+                    return index // self._width, index % self._width, 0.0
+
+            return self._solve()
+
+    def frontier(self):
+        """
+        :return: the (row, col) coordinates of the squares of the frontier, up to date.
+        """
+        with self._board.batch(), self._lock:
+            self._update()
+
+            return sorted(divmod(index, self._width) for index in self._frontier)
+
+    def _update(self):
+        """
+        Applies the changes of the board since the view was last updated to the view and to the frontier.
+        """
+        changes = self._board.changes_since(self._version) if self._version is not None else None
+
+        if changes is None:
+            self._rebuild()
+            return
+
+        self._version, changes = changes
+        codes, width = self._codes, self._width
+        touched = set()
+
+        for row, col, representation in changes:
+            index = row * width + col
+            self._count(codes[index], -1)
+            codes[index] = _SQUARE_CODES[representation]
+            self._count(codes[index], 1)
+            touched.add(index)
+            touched.update(self._neighbours(index))
+
+            # A change reaches the components sharing an undug square with the squares around it
+            for x in range(max(row - 2, 0), min(row + 3, len(codes) // width)):
+                for y in range(max(col - 2, 0), min(col + 3, width)):
+                    component = self._ambiguous.get(x * width + y)
+
+                    if component is not None:
+                        for member in component[0]:
+                            del self._ambiguous[member]
+
+        for index in touched:
+            if codes[index] < _UNTOUCHED and any(_UNDUG[codes[n]] for n in self._neighbours(index)):
+                self._frontier.add(index)
+            else:
+                self._frontier.discard(index)
+
+    def _rebuild(self):
+        """
+        Builds the view from the last snapshot of the board. The frontier is found without visiting the squares one
+        by one: the undug neighbours of every square are counted at once, as the mined neighbours of a board are.
+        """
+        snapshot = self._board.snapshot()
+        codes = bytearray(snapshot.codes())
+        undug = codes.translate(_UNDUG)
+        neighbours = _count_neighbours(undug, snapshot.height(), self._width).translate(_NONZERO)
+        frontier = (int.from_bytes(neighbours, "big") & int.from_bytes(codes.translate(_NUMBERED), "big"))\
+            .to_bytes(len(codes), "big")
+
+        self._frontier.clear()
+        index = frontier.find(1)
+
+        while index != -1:
+            self._frontier.add(index)
+            index = frontier.find(1, index + 1)
+
+        self._codes, self._version = codes, snapshot.version
+        self._mines = self._board.mines_count()
+        self._undug = undug.count(1)
+        self._mines_dug = codes.count(_MINE)
+        self._safe.clear()
+        self._ambiguous.clear()
+
+    def _count(self, code, delta):
+        if _UNDUG[code]:
+            self._undug += delta
+        elif code == _MINE:
+            self._mines_dug += delta
+
+    def _neighbours(self, index):
+        """
+        :return: the flat indices of the neighbours of the square at the flat **index**.
+        """
+        row, col = divmod(index, self._width)
+        height = len(self._codes) // self._width
+
+        return [x * self._width + y
+                for x in range(max(row - 1, 0), min(row + 2, height))
+                for y in range(max(col - 1, 0), min(col + 2, self._width))
+                if (x, y) != (row, col)]
+
+    def _solve(self):
+        """
+        :return: the hint to return, as hint does, once no square found safe is left. The components of the frontier
+            are propagated in turn, up to the first one with untouched squares found safe: the components left
+            ambiguous are kept, until a square near them changes. Only when no component has safe squares are the
+            ambiguous ones enumerated.
+        """
+        codes = self._codes
+
+        for index in sorted(self._frontier):
+            if index in self._ambiguous:
+                continue
+
+            members, constraints = self._component(index)
+            safe, indices, mined, constraints = self._propagate_component(constraints)
+            safe = [square for square in safe if codes[square] == _UNTOUCHED]
+
+            if safe:
+                self._safe = sorted(safe, reverse=True)
+                index = self._safe.pop()
+
+                return index // self._width, index % self._width, 0.0
+
+            component = (members, indices, mined, constraints)
+
+            for member in members:
+                self._ambiguous[member] = component
+
+        density = min(max((self._mines - self._mines_dug) / self._undug, 0), 1) if self._undug else 0
+        safe, probabilities = set(), dict()
+
+        for members, indices, mined, constraints in {id(component): component
+                                                     for component in self._ambiguous.values()}.values():
+            probabilities.update(dict.fromkeys(mined, 1.0))
+            self._enumerate_component(indices, constraints, density, safe, probabilities)
+
+        safe = [index for index in safe if codes[index] == _UNTOUCHED]
+
+        if safe:
+            self._safe = sorted(safe, reverse=True)
+            index = self._safe.pop()
+
+            return index // self._width, index % self._width, 0.0
+
+        candidates = [(probability, index) for index, probability in probabilities.items()
+                      if codes[index] == _UNTOUCHED]
+        # The squares away from the frontier are as likely as any to be mined: the first one stands for them all
+        index = codes.find(_UNTOUCHED)
+
+        while index != -1 and index in probabilities:
+            index = codes.find(_UNTOUCHED, index + 1)
+
+        if index != -1:
+            candidates.append((density, index))
+
+        if not candidates:
+            return None
+
+        probability, index = min(candidates)
+
+        return index // self._width, index % self._width, probability
+
+    def _component(self, start):
+        """
+        :return: a (members, constraints) tuple: the set of the squares of the frontier connected to the square at
+            the flat **start** index through their undug neighbours, and their constraints, as (squares, mines) tuples
+            where squares is a list of flat indices.
+        """
+        codes = self._codes
+        members, constraints, stack = {start}, list(), [start]
+
+        while stack:
+            index = stack.pop()
+            neighbours = self._neighbours(index)
+            squares = [n for n in neighbours if _UNDUG[codes[n]]]
+            constraints.append((squares, codes[index] - sum(1 for n in neighbours if codes[n] == _MINE)))
+
+            for square in squares:
+                for n in self._neighbours(square):
+                    if n in self._frontier and n not in members:
+                        members.add(n)
+                        stack.append(n)
+
+        return members, constraints
+
+    def _propagate_component(self, constraints):
+        """
+        Propagates the constraints of a component of the frontier.
+        :param constraints: a list of (squares, mines) tuples, where squares is a list of flat indices.
+        :return: a (safe, indices, mined, constraints) tuple: the flat indices of the squares found safe, the flat
+            indices of the squares of the component by bit, the flat indices of the squares found mined and the
+            constraints left, as (mask, mines) tuples.
+        """
+        squares = sorted({square for members, mines in constraints for square in members})
+        bits = {square: 1 << i for i, square in enumerate(squares)}
+        indices = {bit: square for square, bit in bits.items()}
+        safe, mined, constraints = self._propagate({(sum(bits[square] for square in members), mines)
+                                                    for members, mines in constraints})
+
+        return [indices[bit] for bit in _bits(safe)], indices, [indices[bit] for bit in _bits(mined)], constraints
+
+    def _enumerate_component(self, indices, constraints, density, safe, probabilities):
+        """
+        Enumerates the solutions of the **constraints** left on a component of the frontier by propagation, adding
+        the squares found safe to **safe** and the probability of the other squares being mined to
+        **probabilities**, by flat index. The squares are split into components again, the components too large to
+        be enumerated being estimated from their constraints.
+        :param indices: the flat indices of the squares of the component, by bit.
+        """
+        components = self._components([(list(_bits(mask)), mines) for mask, mines in constraints])
+
+        for component in components:
+            masks = [(sum(members), mines) for members, mines in component]
+            variables = sorted({bit for members, mines in component for bit in members})
+            component_probabilities = None
+
+            if len(variables) <= self.MAX_ENUMERATED:
+                component_probabilities = self._enumerate(masks, variables, density)
+
+            if component_probabilities is None:
+                # Estimated from the constraints only: the most constrained estimate of every square is kept
+                component_probabilities = dict()
+
+                for mask, mines in masks:
+                    for bit in _bits(mask):
+                        component_probabilities[bit] = max(component_probabilities.get(bit, 0), mines / _ones(mask))
+
+            for bit, probability in component_probabilities.items():
+                if probability == 0:
+                    safe.add(indices[bit])
+                else:
+                    probabilities[indices[bit]] = probability
+
+    @staticmethod
+    def _components(constraints):
+        """
+        :param constraints: a list of (squares, mines) tuples, where squares is a non-empty list of ids.
+        :return: the lists of the constraints of the connected components, the constraints sharing squares.
+        """
+        parents = dict()
+
+        def find(square):
+            while parents[square] != square:
+                parents[square] = parents[parents[square]]
+                square = parents[square]
+
+            return square
+
+        for squares, mines in constraints:
+            for square in squares:
+                parents.setdefault(square, square)
+
+            root = find(squares[0])
+
+            for square in squares[1:]:
+                parents[find(square)] = root
+
+        components = dict()
+
+        for constraint in constraints:
+            components.setdefault(find(constraint[0][0]), list()).append(constraint)
+
+        return list(components.values())
+
+    @staticmethod
+    def _propagate(constraints):
+        """
+        Applies the rules of constraint propagation until no square is found safe or mined, and no constraint is
+        found included in another one.
+        :param constraints: a set of (mask, mines) tuples.
+        :return: a (safe, mined, constraints) tuple: the masks of the squares found safe and mined, and the set of
+            the constraints left on the other squares.
+        """
+        safe = mined = 0
+
+        while True:
+            reduced, found = set(), False
+
+            for mask, mines in constraints:
+                mines -= _ones(mask & mined)
+                mask &= ~(safe | mined)
+
+                if not mask:
+                    continue
+
+                if mines == 0:
+                    safe |= mask
+                    found = True
+                elif mines == _ones(mask):
+                    mined |= mask
+                    found = True
+                else:
+                    reduced.add((mask, mines))
+
+            constraints = reduced
+
+            if found:
+                continue
+
+            # A constraint can only be included in the constraints holding its lowest square
+            by_square = dict()
+
+            for constraint in constraints:
+                for bit in _bits(constraint[0]):
+                    by_square.setdefault(bit, list()).append(constraint)
+
+            derived = set()
+
+            for mask, mines in constraints:
+                for other_mask, other_mines in by_square[mask & -mask]:
+                    if other_mask != mask and mask & ~other_mask == 0:
+                        constraint = (other_mask & ~mask, other_mines - mines)
+
+                        if constraint not in constraints:
+                            derived.add(constraint)
+
+            if not derived:
+                return safe, mined, constraints
+
+            constraints |= derived
+
+    @staticmethod
+    def _enumerate(constraints, variables, density):
+        """
+        Enumerates the solutions of **constraints**, (mask, mines) tuples, on the **variables** bits, depth first,
+        dropping the partial solutions which already break a constraint.
+        :return: a dict of the probability of every variable being mined, every solution weighted by the odds of the
+            density of the mines to the power of its mines, or None if there is no solution.
+        """
+        odds = density / (1 - density) if 0 < density < 1 else 1
+        # The constraints to check after assigning every variable, and the mask of the variables not assigned yet
+        checks = [[constraint for constraint in constraints if constraint[0] & variable] for variable in variables]
+        unassigned = [sum(variables[position + 1:]) for position in range(len(variables))]
+        totals = dict.fromkeys(variables, 0.0)
+        total = 0.0
+        stack = [(0, 0, 0)]
+
+        while stack:
+            position, mined, count = stack.pop()
+
+            if position == len(variables):
+                weight = odds ** count
+                total += weight
+
+                for variable in _bits(mined):
+                    totals[variable] += weight
+                continue
+
+            for assignment, assignment_count in ((mined, count), (mined | variables[position], count + 1)):
+                if all(_ones(mask & assignment) <= mines <= _ones(mask & (assignment | unassigned[position]))
+                       for mask, mines in checks[position]):
+                    stack.append((position + 1, assignment, assignment_count))
+
+        if total == 0:
+            return None
+
+        return {variable: weight / total for variable, weight in totals.items()}
@@ -3,23 +3,30 @@ from concurrent.futures import ALL_COMPLETED
 from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import wait
 from unittest import TestCase, SkipTest
-from random import randint
+from random import randint, choice
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Thread, Event
 from board import *
+from metrics import METRICS
 
 
 class BoardTest(TestCase):
 
     def test_mines_distribution(self):
-        empty, mined = randint(10, 100), randint(10, 100)
-        distribution = Board._random_mines_distribution(empty, mined)
+        height, width = randint(10, 100), randint(10, 100)
+        mined = randint(1, height * width - 1)
 
         self.assertEqual(
-            len([i for i in distribution if not i]),
-            empty
+            Board.create_from_difficulty((height, width, mined)).mines_count(),
+            mined
         )
         self.assertEqual(
-            len([i for i in distribution if i]),
-            mined
+            Board.create_from_probability(height, width, 0).mines_count(),
+            0
+        )
+        self.assertTrue(
+            0 < Board.create_from_probability(height, width, 0.5, seed=0).mines_count() < height * width
         )
 
     def test_contains(self):
@@ -90,6 +97,361 @@ class BoardTest(TestCase):
                 root + file
             )
 
+    def test_text_file(self):
+        """
+        Text files are parsed a line at a time, into rectangular boards.
+        """
+        with TemporaryDirectory() as directory:
+            path = join(directory, "board.txt")
+
+            with open(path, "w") as file:
+                file.write("0 1 0\n1 0 0\n")
+
+            b = Board.create_from_file(path)
+            self.assertEqual((2, 3), (b.height(), b.width()))
+            self.assertEqual([(0, 1), (1, 0)], [(s.row, s.col) for s in b if s.has_bomb])
+            self.assertEqual(2, b.nearby_bombs(0, 0))
+            self.assertIsNone(b.seed())
+
+            for content in ("0 1 0\n1 0\n", "0 2 0\n", "0  1\n", "01\n", "0 1\n\n1 0\n"):
+                with open(path, "w") as file:
+                    file.write(content)
+
+                self.assertRaises(ValueError, Board.create_from_file, path)
+
+    def test_packed_file(self):
+        """
+        Boards saved in the packed binary format are read back with their mines, their states and their seed.
+        """
+        with TemporaryDirectory() as directory:
+            path = join(directory, "board.msb")
+
+            for height, width in ((1, 1), (3, 7), (16, 30)):
+                b = Board.create_from_probability(height, width, 0.3, seed=height)
+                b.set_state(0, 0, State.FLAGGED)
+                b.set_state(height - 1, width - 1, State.DUG)
+                b.save(path)
+                loaded = Board.create_from_file(path)
+
+                self.assertEqual((height, width), (loaded.height(), loaded.width()))
+                self.assertEqual(b._mines, loaded._mines)
+                self.assertEqual(b._states, loaded._states)
+                self.assertEqual(height, loaded.seed())
+                self.assertEqual(str(b), str(loaded))
+
+                b.save(path, states=False)
+                self.assertEqual(bytearray(height * width), Board.create_from_file(path)._states)
+
+            with open(path, "r+b") as file:
+                file.truncate(file.seek(0, 2) - 1)
+
+            self.assertRaises(ValueError, Board.create_from_file, path)
+
+    def test_square_view(self):
+        """
+        Squares are views over the board storage: writes done through a Square must be seen by the board.
+        """
+        b = Board([[True, False], [False, False]])
+        square = b.square(0, 0)
+
+        self.assertEqual(square, b.square(0, 0))
+        self.assertEqual(1, b.mines_count())
+
+        square.has_bomb = False
+        square.state = State.FLAGGED
+
+        self.assertEqual(0, b.mines_count())
+        self.assertEqual(State.FLAGGED, b.square(0, 0).state)
+        self.assertEqual(
+            [(s.row, s.col) for s in b],
+            [(0, 0), (0, 1), (1, 0), (1, 1)]
+        )
+        self.assertRaises(IndexError, b.square, 2, 0)
+
+    def test_nearby_bombs_index(self):
+        """
+        The adjacent-mines index must match a recount of the neighbours, also after mines are removed through a Square.
+        """
+        b = Board.create_from_difficulty(Board.DIFF_HARD)
+
+        def assert_index_consistent():
+            for s in b:
+                self.assertEqual(
+                    len([n for n in b.neighbors(s.row, s.col) if n.has_bomb]),
+                    b.nearby_bombs(s.row, s.col)
+                )
+
+        assert_index_consistent()
+
+        for s in b:
+            if s.has_bomb and s.row % 2 == 0:
+                s.has_bomb = False
+
+        assert_index_consistent()
+
+        for height, width in ((1, 1), (1, 7), (7, 1), (5, 6)):
+            b = Board.create_from_probability(height, width, 0.5)
+            assert_index_consistent()
+
+    def test_seeded_generation(self):
+        """
+        Boards created with the same seed are identical, whatever the state of the global random generator.
+        """
+        for create in (lambda seed: Board.create_from_difficulty(Board.DIFF_HARD, seed=seed),
+                       lambda seed: Board.create_from_probability(40, 60, 0.3, seed=seed)):
+            self.assertEqual(create(42)._mines, create(42)._mines)
+            self.assertNotEqual(create(42)._mines, create(43)._mines)
+
+    def test_generation_mines(self):
+        """
+        Difficulty boards hold exactly their number of mines, and a safe square and its neighbours are never mined.
+        """
+        for seed in range(20):
+            height, width, mines = Board.DIFF_INTERMEDIATE
+            b = Board.create_from_difficulty(Board.DIFF_INTERMEDIATE, seed=seed, safe=(seed % height, 0))
+
+            self.assertEqual(mines, b.mines_count())
+            self.assertEqual(0, b.nearby_bombs(seed % height, 0))
+            self.assertFalse(b.square(seed % height, 0).has_bomb)
+
+            b = Board.create_from_probability(20, 20, 0.9, seed=seed, safe=(19, 19))
+            self.assertEqual(0, b.nearby_bombs(19, 19))
+            self.assertFalse(b.square(19, 19).has_bomb)
+
+        self.assertEqual(11, Board.create_from_difficulty((4, 5, 11), seed=0, safe=(1, 1)).mines_count())
+        self.assertRaises(ValueError, Board.create_from_difficulty, (4, 5, 12), safe=(1, 1))
+        self.assertRaises(ValueError, Board.create_from_difficulty, Board.DIFF_EASY, safe=(9, 0))
+
+    def test_flood_fill(self):
+        """
+        Digging a square of a large empty region must reveal the whole region without hitting the recursion limit.
+        """
+        size = 300
+        grid = [[False] * size for i in range(size)]
+        grid[0][0] = True
+        b = Board(grid)
+
+        revealed = b.set_state(size - 1, size - 1, State.DUG)
+
+        self.assertEqual(len(b) - 1, len(revealed))
+        self.assertNotIn((0, 0), revealed)
+        self.assertEqual(State.UNTOUCHED, b.square(0, 0).state)
+        self.assertEqual(set(), b.set_state(size - 1, size - 1, State.DUG))
+        self.assertEqual(set(), b.set_state(0, 0, State.FLAGGED))
+
+    def test_render_cache(self):
+        """
+        An unchanged board is served from the rendering cache, while mutations invalidate the rows they touch.
+        """
+        b = Board([[False, False, True], [False, False, False], [False, False, False]])
+        rendered = str(b)
+
+        self.assertIs(rendered, str(b))
+
+        b.set_state(2, 0, State.DUG)
+        self.assertEqual("  0 1 2\n0   1 - \n1   1 1 \n2       \n", str(b))
+
+        b.square(0, 2).has_bomb = False
+        self.assertEqual("  0 1 2\n0     - \n1       \n2       \n", str(b))
+
+    def test_changes_since(self):
+        """
+        Every mutation increases the board version, and the change log returns the squares changed since a given
+        version until it is truncated.
+        """
+        b = Board([[False, True], [False, False]])
+
+        b.set_state(1, 0, State.DUG)
+        b.set_state(0, 0, State.FLAGGED)
+        b.set_state(0, 0, State.FLAGGED)
+
+        self.assertEqual(2, b.version())
+        self.assertEqual((2, [(0, 0, "F"), (1, 0, "1")]), b.changes_since(0))
+        self.assertEqual((2, [(0, 0, "F")]), b.changes_since(1))
+        self.assertEqual((2, []), b.changes_since(2))
+        self.assertIsNone(b.changes_since(3))
+
+        for i in range(Board.CHANGELOG_SIZE + 1):
+            b.set_state(1, 1, State.FLAGGED if i % 2 == 0 else State.UNTOUCHED)
+
+        self.assertIsNone(b.changes_since(2))
+        self.assertEqual((b.version(), [(1, 1, "F")]), b.changes_since(b.version() - 1))
+
+        b.toggle_dug()
+        self.assertIsNone(b.changes_since(b.version() - 1))
+
+    def test_lock_striping(self):
+        """
+        A board with lock striping behaves as a board without it, and a flood-fill reaching a tile locked by another
+        thread waits for it, leaving no square dug in the meantime.
+        """
+        grid = [[randint(0, 9) == 0 for col in range(23)] for row in range(17)]
+        plain, striped = Board(grid), Board(grid, tile_size=4)
+
+        for i in range(100):
+            row, col, state = randint(0, 16), randint(0, 22), choice(list(State))
+            plain.set_state(row, col, state)
+            striped.set_state(row, col, state)
+
+            self.assertEqual(str(plain), str(striped))
+
+        b = Board([[False] * 20 for i in range(20)], tile_size=5)
+        locked, release = Event(), Event()
+
+        def hold_last_tile():
+            with b._tile_locks[-1]:
+                locked.set()
+                release.wait()
+
+        holder = Thread(target=hold_last_tile)
+        holder.start()
+        locked.wait()
+
+        digger = Thread(target=b.set_state, args=(0, 0, State.DUG))
+        digger.start()
+        digger.join(0.2)
+
+        self.assertTrue(digger.is_alive())
+        self.assertEqual(len(b), str(b).count(State.UNTOUCHED.representation))
+
+        release.set()
+        digger.join()
+        holder.join()
+
+        self.assertEqual(0, str(b).count(State.UNTOUCHED.representation))
+
+    def test_lock_metrics(self):
+        """
+        The locks taken by single commands are timed, and not only the ones taken by batches.
+        """
+        def counts(name):
+            return {lock: next(value for suffix, labels, value in METRICS.histogram(name, "", lock=lock).samples()
+                               if suffix == "_count") for lock in ("batch", "tiles", "board")}
+
+        b = Board.create_from_difficulty(Board.DIFF_INTERMEDIATE, seed=0, tile_size=4)
+        safe = next(square for square in b if not square.has_bomb)
+        waits, holds = counts("minesweeper_board_lock_wait_seconds"), counts("minesweeper_board_lock_hold_seconds")
+
+        b.set_state(0, 0, State.FLAGGED)
+        b.set_state(safe.row, safe.col, State.DUG)
+
+        for name, before in (("minesweeper_board_lock_wait_seconds", waits),
+                             ("minesweeper_board_lock_hold_seconds", holds)):
+            after = counts(name)
+            self.assertEqual(before["batch"], after["batch"])
+            self.assertGreaterEqual(after["tiles"] - before["tiles"], 2)
+            self.assertEqual(2, after["board"] - before["board"])
+
+    def test_atomic_cascade(self):
+        """
+        With lock striping, snapshots published while a flood-fill runs, by mutations of tiles it has not reached yet,
+        show either none or all of the squares it reveals.
+        """
+        size = 60
+
+        for i in range(5):
+            b = Board([[False] * size for row in range(size - 1)] + [[False] * (size - 1) + [True]], tile_size=3)
+            done = Event()
+            counts = set()
+            untouched = CELL_REPRESENTATIONS.index(State.UNTOUCHED.representation)
+
+            def flag():
+                while not done.is_set():
+                    for row in range(size - 1):
+                        b.set_state(row, size - 1, State.FLAGGED)
+                        b.set_state(row, size - 1, State.UNTOUCHED)
+
+            def read():
+                while not done.is_set():
+                    # The squares of every column but the last one, flagged and deflagged meanwhile
+                    codes = b.snapshot().codes()
+                    counts.add(sum(1 for index, code in enumerate(codes)
+                                   if index % size != size - 1 and code < untouched))
+
+            threads = [Thread(target=flag), Thread(target=read)]
+
+            for thread in threads:
+                thread.start()
+
+            b.set_state(0, 0, State.DUG)
+            done.set()
+
+            for thread in threads:
+                thread.join()
+
+            self.assertLessEqual(counts, {0, size * (size - 1)})
+
+    def test_snapshot(self):
+        """
+        Snapshots are immutable, and reading the board never waits for a thread holding the board lock.
+        """
+        b = Board([[False, True], [False, False]])
+        before = b.snapshot()
+
+        b.set_state(0, 0, State.DUG)
+
+        self.assertEqual(0, before.version)
+        self.assertEqual(1, b.snapshot().version)
+        self.assertEqual("  0 1\n0 - - \n1 - - \n", str(before))
+        self.assertEqual("  0 1\n0 1 - \n1 - - \n", str(b.snapshot()))
+
+        locked, release = Event(), Event()
+
+        def hold_lock():
+            with b._lock:
+                locked.set()
+                release.wait()
+
+        holder = Thread(target=hold_lock)
+        holder.start()
+        locked.wait()
+
+        self.assertEqual(str(b.snapshot()), str(b))
+
+        release.set()
+        holder.join()
+
+    def test_region(self):
+        """
+        Regions are clipped to the board, and are labelled with the rows and the columns of the region.
+        """
+        b = Board.create_from_difficulty((12, 15, 20), seed=0)
+        b.set_state(10, 3, State.DUG)
+        region = b.region(9, 2, 5, 4)
+
+        self.assertEqual(str(b), str(b.region(0, 0, b.height(), b.width())))
+        self.assertEqual(b.snapshot().packed(), b.region(-3, -3, 100, 100).packed())
+        self.assertEqual((9, 2, 3, 4), (region.row, region.col, region.height(), region.width))
+        self.assertEqual("   2 3 4 5\n9  - - - - \n10 - 2 - - \n11 - - - - \n", str(region))
+        self.assertEqual(0, b.region(20, 0, 5, 5).height())
+
+    def test_batch(self):
+        """
+        A deferred batch publishes a single snapshot when it ends, and holds every tile lock meanwhile.
+        """
+        b = Board([[False] * 4 for i in range(4)], 2)
+        before = b.snapshot()
+        acquired = list()
+
+        with b.batch(deferred=True):
+            b.set_state(0, 0, State.FLAGGED)
+            b.set_state(3, 3, State.FLAGGED)
+
+            thread = Thread(target=lambda: acquired.append(b._tile_locks[3].acquire(blocking=False)))
+            thread.start()
+            thread.join()
+
+            self.assertIs(before, b.snapshot())
+
+        self.assertEqual([False], acquired)
+        self.assertEqual(2, b.snapshot().version)
+        self.assertEqual("  0 1 2 3\n0 F - - - \n1 - - - - \n2 - - - - \n3 - - - F \n", str(b))
+
+        with b.batch():
+            b.set_state(1, 1, State.FLAGGED)
+
+            self.assertEqual(3, b.snapshot().version)
+
     def test_thread_safety(self):
         configs = {
             "threads": 35,
@@ -0,0 +1,70 @@
+import unittest
+from random import Random
+from unittest import TestCase
+from board import *
+from chunked import *
+
+
+class ChunkedBoardTest(TestCase):
+
+    def test_same_as_board(self):
+        """
+        A chunked board plays as the Board holding the same mines, across the boundaries of its chunks, and chunks
+        dropped are generated again identically.
+        """
+        chunked = ChunkedBoard(23, 37, 0.12, seed=0, chunk_size=8, max_chunks=2)
+        b = Board([[ChunkedBoard(23, 37, 0.12, seed=0, chunk_size=8).square(row, col).has_bomb for col in range(37)]
+                   for row in range(23)])
+        generator = Random(0)
+
+        for i in range(40):
+            row, col = generator.randrange(23), generator.randrange(37)
+            state = generator.choice((State.DUG, State.DUG, State.FLAGGED))
+
+            self.assertEqual(b.set_state(row, col, state), chunked.set_state(row, col, state))
+            self.assertEqual(str(b.region(0, 0, 23, 37)), str(chunked.region(0, 0, 23, 37)))
+
+            if state == State.DUG and b.square(row, col).has_bomb:
+                b.square(row, col).has_bomb = False
+                chunked.square(row, col).has_bomb = False
+
+        self.assertEqual(str(b.region(5, 6, 10, 12)), str(chunked.region(5, 6, 10, 12)))
+        self.assertEqual([b.nearby_bombs(row, 8) for row in range(23)],
+                         [chunked.nearby_bombs(row, 8) for row in range(23)])
+
+    def test_lazy(self):
+        """
+        Chunks are generated when reached only, and the unexplored ones are dropped beyond the maximum.
+        """
+        chunked = ChunkedBoard(seed=1, chunk_size=16, max_chunks=4)
+
+        self.assertEqual(0, chunked.chunks())
+        self.assertEqual(15, str(chunked.region(10 ** 9, 10 ** 9, 3, 5)).count(State.UNTOUCHED.representation))
+        self.assertEqual(0, chunked.chunks())
+
+        for col in range(0, 16 * 10, 16):
+            chunked.nearby_bombs(10 ** 6, col)
+
+        self.assertEqual(4, chunked.chunks())
+
+        chunked.set_state(0, 0, State.FLAGGED)
+        chunked.set_state(10 ** 6, 10 ** 6, State.FLAGGED)
+        chunked.nearby_bombs(10 ** 7, 0)
+
+        self.assertEqual(4, chunked.chunks())
+        self.assertEqual(State.FLAGGED, chunked.square(0, 0).state)
+        self.assertEqual(ChunkedBoard(seed=1).square(10 ** 8, 5).has_bomb,
+                         ChunkedBoard(seed=1, chunk_size=16).square(10 ** 8, 5).has_bomb)
+
+    def test_changes_since(self):
+        chunked = ChunkedBoard(seed=2, chunk_size=4)
+        version = chunked.version()
+        chunked.set_state(3, 3, State.FLAGGED)
+        chunked.set_state(4, 4, State.FLAGGED)
+
+        self.assertEqual((version + 2, [(3, 3, "F"), (4, 4, "F")]), chunked.changes_since(version))
+        self.assertIsNone(chunked.changes_since(version + 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from os import listdir, replace
+from os.path import getsize, join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+from board import *
+from journal import *
+from room import RoomRegistry
+
+
+class BoardJournalTest(TestCase):
+
+    @staticmethod
+    def play(board):
+        """
+        Flags, digs and clears a mine of **board**, as players do.
+        """
+        board.set_state(0, 0, State.FLAGGED)
+        board.set_state(board.height() - 1, board.width() - 1, State.DUG)
+        mine = next(square for square in board if square.has_bomb)
+        board.set_state(mine.row, mine.col, State.DUG)
+        mine.has_bomb = False
+
+    def test_recover(self):
+        """
+        Restarted registries restore every room from the snapshots and the journals, at the state they were left in.
+        """
+        with TemporaryDirectory() as directory:
+            rooms = RoomRegistry(Board.create_from_difficulty(Board.DIFF_EASY, seed=0),
+                                 journal=BoardJournal(directory))
+            default = rooms.default_room()
+            first = rooms.join("first")
+
+            for board in (default.board, first.board):
+                self.play(board)
+
+            rooms.close()
+            restored = RoomRegistry(Board.create_from_difficulty(Board.DIFF_EASY, seed=1),
+                                    journal=BoardJournal(directory))
+
+            self.assertIn("first", restored)
+            self.assertEqual(str(default.board), str(restored.default_room().board))
+            self.assertEqual(str(first.board), str(restored.join("first").board))
+            self.assertEqual(default.board.mines_count(), restored.default_room().board.mines_count())
+
+            restored.close()
+
+    def test_checkpoint(self):
+        """
+        A journal growing beyond its checkpoint size is emptied once a snapshot of its board is saved.
+        """
+        with TemporaryDirectory() as directory:
+            journal = BoardJournal(directory, interval=3600, checkpoint_size=64)
+            board = Board.create_from_difficulty(Board.DIFF_INTERMEDIATE, seed=0)
+            journal.attach("room", board)
+            journal.flush()
+
+            board.set_state(0, 0, State.FLAGGED)
+            journal.flush()
+            self.assertGreater(getsize(join(directory, "room" + BoardJournal.JOURNAL_EXTENSION)), 0)
+
+            for col in range(1, board.width()):
+                board.set_state(0, col, State.FLAGGED)
+
+            journal.flush()
+            self.assertEqual(0, getsize(join(directory, "room" + BoardJournal.JOURNAL_EXTENSION)))
+            self.assertEqual(str(board), str(journal.recover()["room"]))
+
+            journal.close()
+
+    def test_checkpoint_crash(self):
+        """
+        A checkpoint interrupted by a crash, before or after its snapshot replaces the last one, never replays the
+        journal over a snapshot taken after it.
+        """
+        class Crash(Exception):
+            pass
+
+        def crash_on_snapshot(source, destination):
+            if source.endswith(BoardJournal.TEMPORARY_EXTENSION):
+                raise Crash()
+
+            replace(source, destination)
+
+        for target, side_effect in (("journal.replace", crash_on_snapshot), ("journal.remove", Crash)):
+            with self.subTest(target=target), TemporaryDirectory() as directory:
+                journal = BoardJournal(directory, interval=3600, checkpoint_size=0)
+                board = Board.create_from_difficulty(Board.DIFF_EASY, seed=0)
+                journal.attach("room", board)
+                journal.flush()
+                board.set_state(0, 0, State.FLAGGED)
+                flagged = str(board)
+                to_bytes = board.to_bytes
+
+                def deflag_to_bytes():
+                    # Changed while the snapshot is taken: in the snapshot, and not in the journal
+                    board.set_state(0, 0, State.UNTOUCHED)
+                    return to_bytes()
+
+                with patch.object(board, "to_bytes", deflag_to_bytes), patch(target, side_effect=side_effect):
+                    self.assertRaises(Crash, journal.flush)
+
+                expected = flagged if target == "journal.replace" else str(board)
+                self.assertEqual(expected, str(BoardJournal(directory).recover()["room"]))
+                leftovers = (BoardJournal.TEMPORARY_EXTENSION, BoardJournal.ASIDE_EXTENSION)
+                self.assertEqual([], [name for name in listdir(directory) if name.endswith(leftovers)])
+
+    def test_torn_record(self):
+        """
+        Records left incomplete or corrupt by a crash are ignored, with the records following them.
+        """
+        with TemporaryDirectory() as directory:
+            journal = BoardJournal(directory, interval=3600)
+            board = Board.create_from_difficulty(Board.DIFF_EASY, seed=0)
+            journal.attach("room", board)
+            journal.flush()
+            board.set_state(0, 0, State.FLAGGED)
+            journal.flush()
+            expected = str(board)
+            board.set_state(1, 0, State.FLAGGED)
+            journal.close()
+
+            path = join(directory, "room" + BoardJournal.JOURNAL_EXTENSION)
+
+            with open(path, "r+b") as file:
+                file.truncate(getsize(path) - 1)
+
+            self.assertEqual(expected, str(BoardJournal(directory).recover()["room"]))
+
+    def test_collect(self):
+        """
+        The snapshot and the journal of a room garbage-collected are removed.
+        """
+        with TemporaryDirectory() as directory:
+            journal = BoardJournal(directory, interval=3600)
+            rooms = RoomRegistry(Board.create_from_difficulty(Board.DIFF_EASY), idle_timeout=0, journal=journal)
+            room = rooms.join("first")
+            room.board.set_state(0, 0, State.FLAGGED)
+            journal.flush()
+
+            self.assertIn("first" + BoardJournal.SNAPSHOT_EXTENSION, listdir(directory))
+
+            rooms.leave(room)
+            journal.flush()
+
+            self.assertEqual(["default"], sorted({name.split(".")[0] for name in listdir(directory)}))
+            self.assertIsNone(room.board.journal)
+
+            rooms.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from unittest import TestCase
+from message import *
+
+
+class UTSMessageTest(TestCase):
+
+    def test_parse_infer_type(self):
+        expected = {
+            "look": UTSLookMessage,
+            "look since 12": UTSLookSinceMessage,
+            " dig 3 4\n": UTSDigMessage,
+            "flag -1 2": UTSFlagMessage,
+            "deflag 3 4": UTSDeflagMessage,
+            "join room-1": UTSJoinMessage,
+            "protocol binary": UTSProtocolMessage,
+            "view 0 10 20 40": UTSViewMessage,
+            "view off": UTSViewMessage,
+            "hint": UTSHintMessage,
+            "view 0 10": UTSInvalidMessage,
+            "help": UTSHelpRequestMessage,
+            "bye": UTSByeMessage,
+            "-1": UTSByeMessage,
+            "look since -1": UTSInvalidMessage,
+            "deflag 3": UTSInvalidMessage,
+            "dig 3 four": UTSInvalidMessage,
+            "helpme": UTSInvalidMessage,
+            "": UTSInvalidMessage,
+        }
+
+        for raw_input, message_type in expected.items():
+            self.assertIsInstance(UTSMessage.parse_infer_type(raw_input), message_type, raw_input)
+
+        message = UTSMessage.parse_infer_type("deflag 3 4")
+        self.assertEqual((3, 4), (message.row, message.col))
+        self.assertEqual("Error. 'dig x' was not understood.",
+                         UTSMessage.parse_infer_type("dig x\n").stu_error_message_factory().msg)
+
+    def test_parse(self):
+        self.assertEqual(7, UTSLookSinceMessage.parse("look since 7").version)
+        self.assertRaises(ValueError, UTSDigMessage.parse, "flag 1 2")
+        self.assertEqual((0, 10, 20, 40), UTSViewMessage.parse("view 0 10 20 40").viewport())
+        self.assertIsNone(UTSViewMessage.parse("view off").viewport())
+
+
+if __name__ == "__main__":
+    unittest.main()
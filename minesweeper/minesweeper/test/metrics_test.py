@@ -0,0 +1,66 @@
+import unittest
+from threading import Thread
+from unittest import TestCase
+from metrics import *
+
+
+class MetricsTest(TestCase):
+
+    def test_threads(self):
+        """
+        The updates of every thread are counted, including the ones of the threads which exited.
+        """
+        registry = MetricsRegistry()
+        counter = registry.counter("test_events", "Events")
+        threads = [Thread(target=lambda: [counter.inc() for i in range(10000)]) for i in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        counter.inc(5)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(40005, counter.value())
+        self.assertEqual(40005, counter.value())
+        self.assertEqual(1, len(counter._shards))
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Durations", kind="test")
+
+        for value in (0.5e-6, 1e-6, 3e-6, 2.0):
+            histogram.observe(value)
+
+        samples = {(suffix, labels.get("le")): value for suffix, labels, value in histogram.samples()}
+
+        self.assertIs(histogram, registry.histogram("test_seconds", "Durations", kind="test"))
+        self.assertRaises(ValueError, registry.counter, "test_seconds", "Durations", kind="test")
+        self.assertEqual(2, samples["_bucket", repr(1e-6)])
+        self.assertEqual(3, samples["_bucket", repr(4e-6)])
+        self.assertEqual(3, samples["_bucket", repr(Histogram.DEFAULT_BUCKETS[-1])])
+        self.assertEqual(4, samples["_bucket", "+Inf"])
+        self.assertEqual(4, samples["_count", None])
+        self.assertAlmostEqual(2.0000045, samples["_sum", None])
+
+    def test_exposition(self):
+        registry = MetricsRegistry()
+        registry.gauge("test_connections", "Connections").inc(3)
+        registry.counter("test_bytes", "Bytes", protocol="text").inc(10)
+        registry.counter("test_bytes", "Bytes", protocol="binary").inc(2)
+
+        self.assertEqual(
+            '# HELP test_bytes Bytes\n'
+            '# TYPE test_bytes counter\n'
+            'test_bytes_total{protocol="text"} 10\n'
+            'test_bytes_total{protocol="binary"} 2\n'
+            '# HELP test_connections Connections\n'
+            '# TYPE test_connections gauge\n'
+            'test_connections 3\n',
+            registry.exposition()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
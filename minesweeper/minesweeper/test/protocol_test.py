@@ -0,0 +1,95 @@
+import unittest
+from io import BytesIO
+from unittest import TestCase
+from board import *
+from protocol import *
+
+
+class BinaryProtocolTest(TestCase):
+
+    def test_commands(self):
+        messages = [UTSLookMessage(), UTSLookSinceMessage(2 ** 40), UTSDigMessage(3, 4), UTSFlagMessage(0, 7),
+                    UTSDeflagMessage(5, 1), UTSJoinMessage("room-1"), UTSProtocolMessage("text"),
+                    UTSCollapseMessage(True), UTSWatchMessage(False), UTSViewMessage(-2, 3, 10, 20),
+                    UTSHintMessage(), UTSHelpRequestMessage(), UTSByeMessage()]
+        buffer = b"".join(BINARY_PROTOCOL.encode(message) for message in messages)
+        offset = 0
+
+        for message in messages:
+            decoded, offset = BINARY_PROTOCOL.parse(buffer, offset)
+
+            self.assertIs(type(message), type(decoded))
+            self.assertEqual(message.get_representation(), decoded.get_representation())
+
+        self.assertIsNone(BINARY_PROTOCOL.parse(buffer, offset))
+        self.assertIsNone(BINARY_PROTOCOL.parse(BINARY_PROTOCOL.encode(UTSDigMessage(3, 4))[:-1]))
+        self.assertIsNone(BINARY_PROTOCOL.parse(BINARY_PROTOCOL.encode(UTSJoinMessage("room"))[:-1]))
+        self.assertIsInstance(BINARY_PROTOCOL.parse(b"\xff")[0], UTSInvalidMessage)
+
+    def test_board(self):
+        board = Board.create_from_probability(7, 9, 0.3)
+        board.set_state(0, 0, State.FLAGGED)
+        board.set_state(3, 4, State.DUG)
+        board.set_state(6, 8, State.DUG)
+        reply, payload = BINARY_PROTOCOL.read_reply(BytesIO(BINARY_PROTOCOL.encode(STUBoardMessage(board))))
+        version, height, width, codes = BinaryProtocol.decode_board(payload)
+
+        self.assertEqual(BinaryProtocol.REPLY_BOARD, reply)
+        self.assertEqual((board.version(), 7, 9), (version, height, width))
+        self.assertEqual(
+            [board._representation(index) for index in range(len(board))],
+            [CELL_REPRESENTATIONS[code] for code in codes]
+        )
+        self.assertEqual(32, len(board.snapshot().packed()))
+
+    def test_view(self):
+        board = Board.create_from_probability(7, 9, 0.3)
+        board.set_state(3, 4, State.DUG)
+        reply, payload = BINARY_PROTOCOL.read_reply(BytesIO(BINARY_PROTOCOL.encode(STUBoardMessage(board,
+                                                                                                   (2, 3, 3, 10)))))
+        version, row, col, height, width, codes = BinaryProtocol.decode_view(payload)
+
+        self.assertEqual(BinaryProtocol.REPLY_VIEW, reply)
+        self.assertEqual((board.version(), 2, 3, 3, 6), (version, row, col, height, width))
+        self.assertEqual(
+            [board._representation(r * 9 + c) for r in range(2, 5) for c in range(3, 9)],
+            [CELL_REPRESENTATIONS[code] for code in codes]
+        )
+
+    def test_hint(self):
+        reply, payload = BINARY_PROTOCOL.read_reply(BytesIO(BINARY_PROTOCOL.encode(STUHintMessage(3, 4, 0.25))))
+
+        self.assertEqual(BinaryProtocol.REPLY_HINT, reply)
+        self.assertEqual((3, 4, 0.25), BinaryProtocol.HINT.unpack(payload))
+        self.assertEqual("hint 3 4 0.250\n", TEXT_PROTOCOL.encode(STUHintMessage(3, 4, 0.25)).decode())
+
+    def test_delta(self):
+        board = Board([[False, True], [False, False]])
+        version = board.version()
+        board.set_state(1, 1, State.DUG)
+        board.set_state(0, 1, State.FLAGGED)
+        encoded = BINARY_PROTOCOL.encode(STUBoardDeltaMessage(*board.changes_since(version)))
+        reply, payload = BINARY_PROTOCOL.read_reply(BytesIO(encoded))
+
+        self.assertEqual(BinaryProtocol.REPLY_DELTA, reply)
+        self.assertEqual((board.version(), [(0, 1, 10), (1, 1, 1)]), BinaryProtocol.decode_delta(payload))
+
+        encoded = BINARY_PROTOCOL.encode(STUBoardDeltaMessage(*board.changes_since(version), (1, 0, 1, 2)))
+        self.assertEqual((board.version(), [(1, 1, 1)]),
+                         BinaryProtocol.decode_delta(BINARY_PROTOCOL.read_reply(BytesIO(encoded))[1]))
+
+    def test_text(self):
+        message = UTSMessage.parse_infer_type("protocol binary")
+        buffer = TEXT_PROTOCOL.encode(message) + TEXT_PROTOCOL.encode(UTSDigMessage(1, 2)) + b"look"
+        decoded, offset = TEXT_PROTOCOL.parse(buffer)
+
+        self.assertIsNone(message.find_errors(None))
+        self.assertIsNotNone(UTSProtocolMessage("morse").find_errors(None))
+        self.assertEqual("protocol binary", decoded.get_representation())
+        self.assertEqual("dig 1 2", TEXT_PROTOCOL.parse(buffer, offset)[0].get_representation())
+        self.assertIsNone(TEXT_PROTOCOL.parse(buffer, len(buffer) - 4))
+        self.assertRaises(ProtocolError, TEXT_PROTOCOL.parse, b"x" * (TextProtocol.MAX_LINE_LENGTH + 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
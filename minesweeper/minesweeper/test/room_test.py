@@ -0,0 +1,120 @@
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+from board import *
+from room import *
+
+
+class RoomRegistryTest(TestCase):
+
+    @staticmethod
+    def make_registry(idle_timeout):
+        return RoomRegistry(Board.create_from_difficulty(Board.DIFF_EASY), idle_timeout=idle_timeout)
+
+    def test_join(self):
+        rooms = self.make_registry(RoomRegistry.DEFAULT_IDLE_TIMEOUT)
+        default = rooms.join(RoomRegistry.DEFAULT_ROOM)
+        first = rooms.join("first", default)
+        again = rooms.join("first")
+
+        self.assertIs(first, again)
+        self.assertIsNot(default.board, first.board)
+        self.assertEqual((Board.DIFF_EASY[0], Board.DIFF_EASY[1]), (first.board.height(), first.board.width()))
+        self.assertEqual(0, default.players)
+        self.assertEqual(2, first.players)
+        self.assertRaises(ValueError, rooms.join, "not a room")
+
+    def test_join_race(self):
+        """
+        A room created by another player while a board is created for it is joined, and no other room is created.
+        """
+        rooms = RoomRegistry(Board.create_from_difficulty(Board.DIFF_EASY), board_factory=lambda: create())
+        boards, joined = list(), list()
+
+        def create():
+            boards.append(Board.create_from_difficulty(Board.DIFF_EASY))
+
+            # The other player joins while the first board is being created
+            if len(boards) == 1:
+                joined.append(rooms.join("first"))
+
+            return boards[-1]
+
+        with patch("room.Room", wraps=Room) as room_class:
+            first = rooms.join("first")
+
+        self.assertIs(joined[0], first)
+        self.assertIs(boards[1], first.board)
+        self.assertEqual(2, first.players)
+        self.assertEqual(1, room_class.call_count)
+
+    def test_collect(self):
+        rooms = self.make_registry(0)
+        room = rooms.join("first")
+
+        rooms.leave(room)
+        rooms.leave(rooms.join(RoomRegistry.DEFAULT_ROOM))
+
+        self.assertNotIn("first", rooms)
+        self.assertIn(RoomRegistry.DEFAULT_ROOM, rooms)
+        self.assertEqual(1, len(rooms))
+
+        rooms = self.make_registry(RoomRegistry.DEFAULT_IDLE_TIMEOUT)
+        rooms.leave(rooms.join("first"))
+
+        self.assertEqual(0, rooms.collect())
+        self.assertIn("first", rooms)
+
+
+class RoomWatchersTest(TestCase):
+
+    class Watcher:
+
+        def __init__(self):
+            self.wakes = 0
+
+        def wake(self):
+            self.wakes += 1
+
+    def test_notify(self):
+        watchers = RoomWatchers(Board.create_from_difficulty(Board.DIFF_EASY))
+        first, second = self.Watcher(), self.Watcher()
+
+        watchers.subscribe(first)
+        watchers.subscribe(second)
+        watchers.notify()
+        watchers.unsubscribe(second)
+        watchers.notify()
+
+        self.assertEqual(1, len(watchers))
+        self.assertEqual((3, 2), (first.wakes, second.wakes))
+
+    def test_update(self):
+        board = Board([[False, True], [False, False]])
+        watchers = RoomWatchers(board)
+        renders = list()
+
+        def render(version):
+            renders.append(version)
+            return board.version(), "update since %d" % version
+
+        self.assertIsNone(watchers.update(board.version(), "text", render))
+
+        version = board.version()
+        board.set_state(0, 0, State.FLAGGED)
+        update = watchers.update(version, "text", render)
+
+        self.assertEqual((board.version(), "update since %d" % version), update)
+        self.assertIs(update, watchers.update(version, "text", render))
+        self.assertIsNot(update, watchers.update(version, "binary", render))
+        self.assertEqual([version, version], renders)
+        self.assertIsNone(watchers.update(board.version(), "text", render))
+
+        board.set_state(0, 0, State.UNTOUCHED)
+        watchers.update(version, "text", render)
+
+        self.assertEqual([version] * 3, renders)
+
+
+if __name__ == "__main__":
+    unittest.main()
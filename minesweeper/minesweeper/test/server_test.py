@@ -0,0 +1,345 @@
+import asyncio
+import unittest
+from os.path import dirname, join
+from signal import SIGINT
+from socket import AF_UNIX, MSG_WAITALL, SOCK_DGRAM, create_connection, send_fds, socket, socketpair
+from struct import Struct
+from subprocess import Popen
+from sys import executable
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from zlib import crc32
+import server
+from board import CELL_REPRESENTATIONS, Board, State
+from message import UTSFlagMessage, UTSJoinMessage, UTSLookMessage
+from protocol import TEXT_PROTOCOL, BinaryProtocol
+from room import RoomRegistry
+
+
+class ServerTest(TestCase):
+    """
+    Starts server.py on an ephemeral port, and plays on it through sockets, as clients do.
+    """
+
+    TIMEOUT = 10
+    REPLY_HEADER = Struct("!BI")
+    BOARD_HEADER = Struct("!QII")
+
+    def start(self, *arguments):
+        """
+        Starts a server with **arguments** added to its command line, stopped with a SIGINT at the end of the test.
+        Boards have 8 x 8 squares, unless a board file is given.
+        :return: the port of the server.
+        """
+        with socket() as probe:
+            probe.bind(("localhost", 0))
+            port = probe.getsockname()[1]
+
+        size = [] if "-f" in arguments else ["-s", "8"]
+        process = Popen([executable, server.__file__, "-d", "false", "-p", str(port)] + size + list(arguments),
+                        cwd=dirname(server.__file__))
+        self.addCleanup(process.wait, self.TIMEOUT)
+        self.addCleanup(process.send_signal, SIGINT)
+
+        for i in range(100):
+            try:
+                create_connection(("localhost", port)).close()
+                return port
+            except ConnectionRefusedError:
+                sleep(0.1)
+
+        self.fail("The server did not start listening at port %d" % port)
+
+    def connect(self, port):
+        """
+        :return: a socket connected to the server at **port**, once the hello message is read.
+        """
+        client = create_connection(("localhost", port), timeout=self.TIMEOUT)
+        self.addCleanup(client.close)
+        self.assertIn("Welcome to Minesweeper", self.receive(client, "Type 'help' for help.\n\n"))
+
+        return client
+
+    def receive(self, client, expected, count=1):
+        """
+        Reads from **client** until **expected** is received **count** times.
+        :return: the text received.
+        """
+        received = ""
+
+        while received.count(expected) < count:
+            data = client.recv(2 ** 16)
+            self.assertTrue(data, "Connection closed before '%s' was received: %r" % (expected, received))
+            received += data.decode()
+
+        return received
+
+    def receive_binary(self, client):
+        """
+        Reads a reply of the binary protocol from **client**.
+        :return: a (reply type, payload) tuple.
+        """
+        kind, length = self.REPLY_HEADER.unpack(client.recv(self.REPLY_HEADER.size, MSG_WAITALL))
+
+        return kind, client.recv(length, MSG_WAITALL) if length else b""
+
+    def receive_board(self, client):
+        """
+        Reads a board reply of the binary protocol from **client**.
+        :return: the code of every square of the board, one per byte, in row-major order.
+        """
+        kind, payload = self.receive_binary(client)
+        self.assertEqual(BinaryProtocol.REPLY_BOARD, kind)
+        version, height, width = self.BOARD_HEADER.unpack_from(payload)
+        packed = payload[self.BOARD_HEADER.size:]
+        codes = bytes(code for byte in packed for code in (byte >> 4, byte & 0xF))[:height * width]
+        self.assertEqual(height * width, len(codes))
+
+        return codes
+
+    def test_pipelined_batch(self):
+        """
+        Commands sent at once are all replied to, in order, by the threaded and the asyncio servers.
+        """
+        for mode in ("threaded", "asyncio"):
+            with self.subTest(mode=mode):
+                client = self.connect(self.start("-m", mode))
+
+                client.sendall(b"look\nflag 0 0\nflag 0 1\nlook\n")
+                boards = self.receive(client, "\n\n", 4).split("\n\n")
+
+                self.assertTrue(boards[0].split("\n")[1].startswith("0 - -"), boards[0])
+                self.assertTrue(boards[1].split("\n")[1].startswith("0 F -"), boards[1])
+                self.assertTrue(boards[3].split("\n")[1].startswith("0 F F"), boards[3])
+
+                client.sendall(b"bye\n")
+                self.receive(client, "Bye")
+
+    def test_batch_locks(self):
+        """
+        Only the batches with several commands changing the board hold every lock of the board.
+        """
+        board = Board.create_from_difficulty(Board.DIFF_EASY, tile_size=4)
+        ends = socketpair()
+        rooms = RoomRegistry(board)
+        connection = server.Connection(SimpleNamespace(rooms=lambda: rooms), ends[0])
+
+        for end in ends:
+            self.addCleanup(end.close)
+
+        with patch.object(board, "batch", wraps=board.batch) as batch:
+            connection._process_batch([UTSLookMessage(), UTSFlagMessage(0, 0), UTSLookMessage()])
+            self.assertEqual(0, batch.call_count)
+
+            connection._process_batch([UTSFlagMessage(0, 1), UTSFlagMessage(0, 2)])
+            self.assertEqual(1, batch.call_count)
+
+        self.assertTrue(str(board).split("\n")[1].startswith("0 F F F"), str(board))
+
+    def test_watch(self):
+        """
+        A watching client is pushed the changes made by another client, by the threaded and the asyncio servers.
+        """
+        for mode in ("threaded", "asyncio"):
+            with self.subTest(mode=mode):
+                port = self.start("-m", mode)
+                watcher, player = self.connect(port), self.connect(port)
+
+                # The whole board is pushed first
+                watcher.sendall(b"watch on\n")
+                self.assertIn("board ", self.receive(watcher, "\n\n"))
+
+                player.sendall(b"flag 0 0\n")
+                self.receive(player, "\n\n")
+                self.assertIn("delta ", self.receive(watcher, "\n0 0 F\n"))
+
+    def test_view(self):
+        """
+        A view is replied to with its region of the board, and restricts the following boards to it until turned
+        off, by the threaded and the asyncio servers.
+        """
+        for mode in ("threaded", "asyncio"):
+            with self.subTest(mode=mode):
+                client = self.connect(self.start("-m", mode))
+                client.sendall(b"flag 2 3\n")
+                self.receive(client, "\n\n")
+
+                client.sendall(b"view 2 3 2 3\n")
+                self.assertEqual("  3 4 5\n2 F - - \n3 - - - \n\n", self.receive(client, "\n\n"))
+
+                client.sendall(b"flag 3 5\nlook\n")
+                self.assertEqual("  3 4 5\n2 F - - \n3 - - F \n\n", self.receive(client, "\n\n", 2).split("\n\n", 1)[1])
+
+                client.sendall(b"view off\n")
+                self.assertEqual(9, len(self.receive(client, "\n\n").split("\n\n")[0].split("\n")))
+
+    def test_prefork(self):
+        """
+        Clients are accepted by every worker of a prefork server, and play in the default room, whichever worker
+        accepted them.
+        """
+        port = self.start("-m", "prefork", "-w", "2")
+        clients = [self.connect(port) for i in range(8)]
+
+        clients[0].sendall(b"flag 0 0\n")
+        self.receive(clients[0], "\n\n")
+
+        for client in clients:
+            client.sendall(b"look\n")
+            self.assertTrue(self.receive(client, "\n\n").split("\n")[1].startswith("0 F"))
+
+    def test_prefork_hand_off(self):
+        """
+        A client joining a room hosted by another worker is handed off to that worker, and plays there.
+        """
+        port = self.start("-m", "prefork", "-w", "2")
+        rooms = {crc32(name.encode()) % 2: name for name in ("first", "second", "third", "fourth")}
+        first, second = rooms[0], rooms[1]
+        client = self.connect(port)
+
+        client.sendall(b"join %s\n" % first.encode())
+        self.receive(client, "Joined room '%s'" % first)
+        client.sendall(b"flag 0 0\n")
+        self.assertIn("F", self.receive(client, "\n\n"))
+
+        # The commands sent with the join are handed off with the client
+        client.sendall(b"join %s\nlook\n" % second.encode())
+        self.assertNotIn("F", self.receive(client, "\n\n").split("'%s'" % second)[1])
+
+        client.sendall(b"join %s\n" % first.encode())
+        self.receive(client, "Joined room '%s'" % first)
+        client.sendall(b"look\n")
+        self.assertIn("F", self.receive(client, "\n\n"))
+
+    def test_flush(self):
+        """
+        Connections handing off a client wait until every byte written to it is passed to the kernel, whereas
+        drain() returns once the bytes buffered drop below the low-water mark.
+        """
+        client, peer = socketpair()
+        self.addCleanup(peer.close)
+        received = list()
+        reading = Thread(target=lambda: received.extend(iter(lambda: len(peer.recv(2 ** 16)), 0)))
+        reading.start()
+
+        async def flush():
+            reader, writer = await asyncio.open_connection(sock=client)
+            writer.transport.set_write_buffer_limits(high=2 ** 20)
+            writer.write(b"-" * 2 ** 23)
+            await server.AsyncConnection._flush(SimpleNamespace(writer=writer))
+            buffered, limits = writer.transport.get_write_buffer_size(), writer.transport.get_write_buffer_limits()
+            writer.close()
+
+            return buffered, limits
+
+        self.assertEqual((0, (2 ** 18, 2 ** 20)), asyncio.run(flush()))
+        reading.join(self.TIMEOUT)
+        self.assertEqual(2 ** 23, sum(received))
+
+    def test_prefork_binary(self):
+        """
+        Clients of the binary protocol dig and look with packed board replies, and keep the protocol when they are
+        handed off to another worker.
+        """
+        # Read by the server whenever a room is created
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = join(directory.name, "board.txt")
+
+        # A single mine, in the bottom right corner
+        with open(path, "w") as file:
+            file.write("\n".join(" ".join("1" if row == col == 7 else "0" for col in range(8)) for row in range(8)))
+
+        port = self.start("-m", "prefork", "-w", "2", "-f", path)
+        owner = crc32(b"default") % 2
+        room = next(name for name in ("first", "second", "third", "fourth") if crc32(name.encode()) % 2 != owner)
+        client = self.connect(port)
+        client.sendall(b"protocol binary\n")
+        self.receive(client, "Using the binary protocol.\n")
+
+        client.sendall(Struct("!Bii").pack(BinaryProtocol.COMMAND_DIG, 0, 0))
+        codes = self.receive_board(client)
+        self.assertEqual(0, codes[0])
+        self.assertEqual(CELL_REPRESENTATIONS.index(State.UNTOUCHED.representation), codes[-1])
+
+        client.sendall(Struct("!BB").pack(BinaryProtocol.COMMAND_JOIN, len(room)) + room.encode())
+        kind, payload = self.receive_binary(client)
+        self.assertEqual((BinaryProtocol.REPLY_JOIN, room.encode()), (kind, payload[4:]))
+
+        client.sendall(Struct("!Bii").pack(BinaryProtocol.COMMAND_FLAG, 0, 0) +
+                       Struct("!B").pack(BinaryProtocol.COMMAND_LOOK))
+
+        for i in range(2):
+            codes = self.receive_board(client)
+            self.assertEqual(CELL_REPRESENTATIONS.index(State.FLAGGED.representation), codes[0])
+            self.assertEqual({CELL_REPRESENTATIONS.index(State.UNTOUCHED.representation)}, set(codes[1:]))
+
+        client.sendall(Struct("!B").pack(BinaryProtocol.COMMAND_BYE))
+        self.assertEqual((BinaryProtocol.REPLY_BYE, b""), self.receive_binary(client))
+
+    def test_prefork_bad_hand_off(self):
+        """
+        Hand-offs which are malformed or carry no socket are discarded, and the sockets they carry are closed.
+        """
+        handoffs = [socketpair(AF_UNIX, SOCK_DGRAM) for i in range(2)]
+        worker = server.WorkerMineSweeperServer(Board.create_from_difficulty(Board.DIFF_EASY), 0, False,
+                                                lambda: Board.create_from_difficulty(Board.DIFF_EASY), 0, handoffs)
+        client, peer = socketpair()
+
+        for sock in [worker] + [end for pair in handoffs for end in pair] + [client, peer]:
+            self.addCleanup(sock.close)
+
+        for message, fds in ((b"join room text 0 0 -", [client.fileno()]), (b"join room text 0\n", [client.fileno()]),
+                             (b"join room morse 0 0 -\n", [client.fileno()]), (b"join room text 0 0 -\n", [])):
+            with self.subTest(message=message, fds=len(fds)):
+                send_fds(handoffs[0][0], [message], fds)
+                worker._receive_handoff()
+
+        client.close()
+        peer.settimeout(self.TIMEOUT)
+        # Every copy of the client socket is closed
+        self.assertEqual(b"", peer.recv(1))
+
+    def test_prefork_hand_off_pending(self):
+        """
+        A client which sent too many commands after a join to be handed off is kept by its worker, in its room.
+        """
+        handoffs = [socketpair(AF_UNIX, SOCK_DGRAM) for i in range(2)]
+        worker = server.WorkerMineSweeperServer(Board.create_from_difficulty(Board.DIFF_EASY), 0, False,
+                                                lambda: Board.create_from_difficulty(Board.DIFF_EASY), 0, handoffs)
+        room = next(name for name in ("first", "second", "third") if worker.owner(name) == 1)
+        connection = SimpleNamespace(writer=SimpleNamespace(get_extra_info=lambda name: None), protocol=TEXT_PROTOCOL,
+                                     collapse=False, watching=False, viewport=None,
+                                     pending=lambda: b"look\n" * worker.HANDOFF_SIZE)
+
+        self.assertFalse(worker.hand_off(connection, room))
+        worker.close()
+
+        for pair in handoffs:
+            for end in pair:
+                end.close()
+
+        port = self.start("-m", "prefork", "-w", "2")
+        client = self.connect(port)
+        commands = 50000
+        # Replies are not read until every command is sent, so that the commands pile up in the worker
+        sender = Thread(target=client.sendall, args=(b"watch off\n" * 5000 + b"join %s\n" % room.encode() +
+                                                      b"watch off\n" * commands,))
+        sender.start()
+        sleep(0.5)
+        received = self.receive(client, "not pushed.\n", 5000 + commands)
+        sender.join()
+
+        self.assertTrue("Joined room '%s'" % room in received or
+                        UTSJoinMessage.ERROR_NOT_JOINED % room in received, received[-500:])
+
+        client.sendall(b"look\n")
+        self.receive(client, "\n\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
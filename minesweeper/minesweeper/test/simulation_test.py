@@ -0,0 +1,61 @@
+import json
+import unittest
+from io import StringIO
+from unittest import TestCase
+from board import *
+from simulation import *
+
+
+class SimulationTest(TestCase):
+
+    @staticmethod
+    def games(results):
+        """
+        :return: the results of every game of **results**, without the time spent.
+        """
+        return {key: value for key, value in results.to_dict().items() if key != "seconds"}
+
+    def test_reproducible(self):
+        """
+        The results of a run depend on its seed only, whatever its batches and the number of processes playing them.
+        """
+        inline = simulate(Board.DIFF_EASY, 30, seed=1, processes=1, batch_size=7)
+        pooled = simulate(Board.DIFF_EASY, 30, seed=1, processes=2, batch_size=10)
+
+        self.assertEqual(self.games(inline), self.games(pooled))
+        self.assertNotEqual(self.games(inline), self.games(simulate(Board.DIFF_EASY, 30, seed=2, processes=1)))
+
+    def test_results(self):
+        """
+        Every game counts its moves, the moves which did not hit a mine counting the squares they revealed.
+        """
+        results = simulate(Board.DIFF_EASY, 20, RandomStrategy, processes=1)
+        cascades = sum(results.cascades_histogram.values())
+
+        self.assertEqual(20, results.games)
+        self.assertEqual(20, sum(results.moves_histogram.values()))
+        self.assertEqual(results.moves, sum(moves * count for moves, count in results.moves_histogram.items()))
+        self.assertEqual(results.moves - (results.games - results.wins), cascades)
+
+        won, moves, cascades = play_game((4, 4, 1), "0 0", SolverStrategy)
+        self.assertTrue(won)
+        self.assertEqual(15, sum(cascades))
+        self.assertEqual(moves, len(cascades))
+
+    def test_output(self):
+        """
+        The configuration of a run, the results of every batch, in order, and the totals are written as JSON lines.
+        """
+        output = StringIO()
+        results = simulate(Board.DIFF_EASY, 25, seed=3, processes=1, batch_size=10, output=output)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual(["config", "batch", "batch", "batch", "total"], [line["kind"] for line in lines])
+        self.assertEqual([0, 10, 20], [line["first"] for line in lines[1:-1]])
+        self.assertEqual(results.wins, sum(line["wins"] for line in lines[1:-1]))
+        self.assertEqual(self.games(results), {key: value for key, value in lines[-1].items()
+                                               if key not in ("kind", "elapsed", "seconds")})
+
+
+if __name__ == "__main__":
+    unittest.main()
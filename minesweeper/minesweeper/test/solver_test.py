@@ -0,0 +1,76 @@
+import unittest
+from unittest import TestCase
+from board import *
+from solver import *
+
+
+class BoardSolverTest(TestCase):
+
+    def test_safe(self):
+        """
+        Squares hinted as safe are never mined, and the view of the solver follows the board as it is played.
+        """
+        safe_hints = 0
+
+        for seed in range(20):
+            b = Board.create_from_difficulty(Board.DIFF_INTERMEDIATE, seed=seed, safe=(8, 8))
+            solver = BoardSolver(b)
+            b.set_state(8, 8, State.DUG)
+            hint = solver.hint()
+
+            while hint is not None and hint[2] == 0:
+                self.assertFalse(b.square(hint[0], hint[1]).has_bomb, seed)
+                b.set_state(hint[0], hint[1], State.DUG)
+                safe_hints += 1
+                hint = solver.hint()
+
+            self.assertEqual(BoardSolver(b).frontier(), solver.frontier())
+
+        self.assertGreater(safe_hints, 100)
+
+    def test_probability(self):
+        """
+        Ambiguous squares are hinted with the probability of a mine, found by enumerating the solutions.
+        """
+        b = Board([[True, False, False], [False, False, False]])
+        b.set_state(1, 2, State.DUG)
+        b.set_state(0, 0, State.FLAGGED)
+
+        self.assertEqual([(0, 1), (1, 1)], BoardSolver(b).frontier())
+        self.assertEqual((1, 0, 0.5), BoardSolver(b).hint())
+
+        b.set_state(1, 0, State.DUG)
+        solver = BoardSolver(b)
+
+        self.assertIsNone(solver.hint())
+
+        b.set_state(0, 0, State.UNTOUCHED)
+
+        self.assertEqual((0, 0, 1.0), solver.hint())
+
+    def test_incremental(self):
+        """
+        The view is updated from the change log, and rebuilt once the changes are no longer in the log.
+        """
+        b = Board.create_from_difficulty((40, 40, 200), seed=0, safe=(20, 20))
+        solver = BoardSolver(b)
+        solver.hint()
+        b.set_state(20, 20, State.DUG)
+        version = solver._version
+
+        self.assertEqual(BoardSolver(b).frontier(), solver.frontier())
+        self.assertEqual(b.version(), solver._version)
+        self.assertGreater(solver._version, version)
+
+        with b.batch():
+            for col in range(b.width()):
+                b.set_state(0, col, State.FLAGGED)
+            for i in range(Board.CHANGELOG_SIZE):
+                b.set_state(1, 0, State.FLAGGED if i % 2 else State.UNTOUCHED)
+
+        self.assertIsNone(b.changes_since(solver._version))
+        self.assertEqual(BoardSolver(b).frontier(), solver.frontier())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from os import urandom
+from socket import socketpair, SOL_SOCKET, SO_SNDBUF
+from threading import Thread
+from unittest import TestCase
+from transport import *
+
+
+class BufferedSocketWriterTest(TestCase):
+
+    def test_flush(self):
+        """
+        Multi-megabyte segments are sent completely and in order, through many partial sends.
+        """
+        sender, receiver = socketpair()
+        sender.setsockopt(SOL_SOCKET, SO_SNDBUF, 4096)
+        segments = [urandom(3 * 2 ** 20), b"", b"\n", urandom(1000), urandom(2 ** 20 + 7)]
+        received = bytearray()
+
+        def receive():
+            while len(received) < sum(len(segment) for segment in segments):
+                received.extend(receiver.recv(65536))
+
+        thread = Thread(target=receive)
+        thread.start()
+
+        with sender, receiver:
+            writer = BufferedSocketWriter(sender, limit=2 ** 20)
+            writer.write(segments[:2])
+
+            # The first segment alone reached the limit: it was flushed already
+            self.assertEqual(0, writer.buffered())
+
+            writer.write(segments[2:])
+            writer.flush()
+            thread.join()
+
+        self.assertEqual(0, writer.buffered())
+        self.assertEqual(b"".join(segments), bytes(received))
+
+
+if __name__ == "__main__":
+    unittest.main()
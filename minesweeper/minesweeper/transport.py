@@ -0,0 +1,71 @@
+from collections import deque
+
+try:
+    from os import sysconf
+
+    # The maximum number of segments a single sendmsg call accepts, which may be indeterminate (-1)
+    _MAX_SEGMENTS = sysconf("SC_IOV_MAX")
+except (ImportError, ValueError, OSError):
+    _MAX_SEGMENTS = -1
+
+
+class BufferedSocketWriter:
+    """
+    The output buffer of a blocking socket. Messages are written as lists of pre-encoded bytes segments, which are
+    queued as memoryviews, never copied nor joined, and sent with scatter-gather sendmsg calls. A partial send only
+    drops the bytes sent from the first segments queued, so that every byte is eventually sent, in order.\n
+    Backpressure: the segments queued are flushed as soon as they reach **limit** bytes, blocking the writer until
+    the client reads them, so that a slow client never makes the buffer grow beyond **limit** plus one segment.
+    """
+
+    DEFAULT_LIMIT = 2 ** 22
+    MAX_SEGMENTS = _MAX_SEGMENTS if _MAX_SEGMENTS > 0 else 1024
+
+    def __init__(self, sock, limit=DEFAULT_LIMIT):
+        self._socket = sock
+        self.limit = limit
+        self._segments = deque()
+        self._buffered = 0
+
+    def __repr__(self):
+        return "<'%s.%s' object, segments=%d, buffered=%d>" % \
+               (self.__class__.__module__, self.__class__.__name__, len(self._segments), self._buffered)
+
+    def buffered(self):
+        """
+        :return: the number of bytes written and not sent yet.
+        """
+        return self._buffered
+
+    def write(self, segments):
+        """
+        Queues **segments**, an iterable of bytes-like objects, flushing the buffer if it reaches the limit.
+        """
+        for segment in segments:
+            if segment:
+                self._segments.append(memoryview(segment))
+                self._buffered += len(segment)
+
+        if self._buffered >= self.limit:
+            self.flush()
+
+    def flush(self):
+        """
+        Sends every segment queued, blocking until the socket accepted all of them.
+        """
+        sendmsg = getattr(self._socket, "sendmsg", None)
+
+        while self._segments:
+            if sendmsg is not None:
+                sent = sendmsg([self._segments[i] for i in range(min(len(self._segments), self.MAX_SEGMENTS))])
+            else:
+                sent = self._socket.send(self._segments[0])
+
+            self._buffered -= sent
+
+            while sent > 0:
+                if sent >= len(self._segments[0]):
+                    sent -= len(self._segments.popleft())
+                else:
+                    self._segments[0] = self._segments[0][sent:]
+                    sent = 0